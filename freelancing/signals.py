@@ -3,10 +3,11 @@
 # Add this to your freelance/signals.py file or create a new one
 # -------------------------------
 
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 import logging
 
+from shop import fragments, notification_feed
 from shop.email import send_email_with_sendgrid
 # Import your freelance models
 from freelancing.models import (
@@ -465,6 +466,39 @@ def handle_notification_created(sender, instance, created, **kwargs):
         # For now, we'll just log it
 
 
+@receiver(post_save, sender=Notification)
+def update_notification_feed(sender, instance, created, **kwargs):
+    """Keep the header's combined feed (shop.notification_feed) current."""
+    notification_feed.notification_saved(instance, created)
+
+
+@receiver(post_delete, sender=Notification)
+def drop_notification_feed(sender, instance, **kwargs):
+    notification_feed.notification_deleted(instance)
+
+
+# -------------------------------
+# Home Page Top Lists
+# -------------------------------
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_home_top_jobs(sender, instance, **kwargs):
+    fragments.bump('top_jobs')
+
+
+@receiver(post_save, sender=FreelancerProfile)
+@receiver(post_delete, sender=FreelancerProfile)
+def invalidate_home_top_freelancers(sender, instance, **kwargs):
+    fragments.bump('top_freelancers')
+
+
+@receiver(post_save, sender=CompanyProfile)
+@receiver(post_delete, sender=CompanyProfile)
+def invalidate_home_top_companies(sender, instance, **kwargs):
+    fragments.bump('top_companies')
+
+
 # -------------------------------
 # Utility Functions for Manual Email Sending
 # -------------------------------
@@ -416,3 +416,6 @@ PLATFORM_SETTINGS = {
     "PLATFORM_FEE_PERCENTAGE": 0.10,  # 10%
     "PAYMENT_PROCESSING_FEE": 0.029,  # 2.9%
 }
+
+# Product search backend (see shop/search.py)
+SHOP_SEARCH_BACKEND = "shop.search.DatabaseSearchBackend"
@@ -36,6 +36,7 @@ from .mixins import (
     CustomerReadOnlyMixin,
     VendorAutoAssignMixin,
 )
+from .signals import refresh_product_indexes
 
 User = get_user_model()
 
@@ -229,7 +230,10 @@ class ProductAdmin(
     def activate_products(self, request, queryset):
         if request.user.is_vendor_type:
             queryset = queryset.filter(vendor__user=request.user)
-        updated = queryset.update(is_active=True)
+        product_ids = list(queryset.values_list("pk", flat=True))
+        updated = Product.objects.filter(pk__in=product_ids).update(is_active=True)
+        # The update skips the Product signals that keep the indexes current
+        refresh_product_indexes(product_ids)
         self.message_user(request, f"{updated} products were activated.")
 
     activate_products.short_description = "Activate selected products"
@@ -237,7 +241,9 @@ class ProductAdmin(
     def deactivate_products(self, request, queryset):
         if request.user.is_vendor_type:
             queryset = queryset.filter(vendor__user=request.user)
-        updated = queryset.update(is_active=False)
+        product_ids = list(queryset.values_list("pk", flat=True))
+        updated = Product.objects.filter(pk__in=product_ids).update(is_active=False)
+        refresh_product_indexes(product_ids)
         self.message_user(request, f"{updated} products were deactivated.")
 
     deactivate_products.short_description = "Deactivate selected products"
@@ -0,0 +1,274 @@
+"""
+In-process typeahead index for the header search box.
+
+Every worker keeps a sorted array of ``(normalized word-suffix, entry key)``
+pairs over product, brand, category and subcategory names, so a prefix lookup
+is a ``bisect`` plus a short scan — no database access. Results for hot
+prefixes are kept in a small LRU.
+
+Changes are published through the cache: the signals bump a version counter
+and store the changed entry under that version's own key, so concurrent
+changes never overwrite each other. A worker that is behind reloads only the
+changed entries; one that has fallen further behind than AUTOCOMPLETE_LOG_SIZE
+changes, or finds one missing (or whose index is older than
+``AUTOCOMPLETE_MAX_AGE``), rebuilds from scratch. Rebuilds run in a
+background thread while requests keep using the current index; only a
+worker's very first index is built on the request.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+from django.utils.translation import get_language
+
+from .models import Brand, Category, Product, SubCategory
+from .search import normalize
+
+AUTOCOMPLETE_VERSION_KEY = "shop:autocomplete:version"
+AUTOCOMPLETE_LOG_SIZE = 500
+AUTOCOMPLETE_MAX_AGE = 15 * 60  # Full rebuild at least this often
+# Workers older than this rebuild anyway, so changes need not outlive it
+AUTOCOMPLETE_CHANGE_TIMEOUT = 2 * AUTOCOMPLETE_MAX_AGE
+HOT_PREFIX_CACHE_SIZE = 1024
+MAX_SCAN = 200  # Keys inspected per lookup before ranking
+
+PRODUCT, BRAND, CATEGORY, SUBCATEGORY = "product", "brand", "category", "subcategory"
+
+# Rank of each kind when suggestions tie on match quality
+KIND_ORDER = {CATEGORY: 0, SUBCATEGORY: 1, BRAND: 2, PRODUCT: 3}
+
+
+# kind -> (model, storefront filter, {url kwarg: field})
+SOURCES = {
+    PRODUCT: (Product, Product.STOREFRONT_FILTER, {"slug": "slug"}),
+    BRAND: (Brand, {"is_active": True}, {"slug": "slug"}),
+    CATEGORY: (Category, {"is_active": True}, {"slug": "slug"}),
+    SUBCATEGORY: (
+        SubCategory,
+        {"is_active": True, "category__is_active": True},
+        {"category_slug": "category__slug", "slug": "slug"},
+    ),
+}
+
+
+def _entries_for(kind, ids=None):
+    """Load ``{(kind, pk): (label, url_kwargs, normalized label)}`` entries."""
+    model, filters, url_fields = SOURCES[kind]
+    queryset = model.objects.filter(**filters)
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    entries = {}
+    for pk, name, *values in queryset.values_list("pk", "name", *url_fields.values()):
+        entries[(kind, pk)] = (name, dict(zip(url_fields, values)), normalize(name))
+    return entries
+
+
+def _terms(normalized):
+    """Every word-suffix of the label, so "Cotton Shirt" matches "shi"."""
+    words = normalized.split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+    """Sorted-array prefix index with a per-prefix result LRU."""
+
+    def __init__(self, version=0):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.entries = {}
+        self.keys = []
+        self.hot = OrderedDict()
+        self.lock = threading.RLock()
+
+    def build(self):
+        entries = {}
+        for kind in KIND_ORDER:
+            entries.update(_entries_for(kind))
+        keys = sorted(
+            (term, key) for key, entry in entries.items() for term in _terms(entry[2])
+        )
+        with self.lock:
+            self.entries, self.keys = entries, keys
+            self.hot.clear()
+            self.built_at = time.monotonic()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for term in _terms(entry[2]):
+            index = bisect_left(self.keys, (term, key))
+            if index < len(self.keys) and self.keys[index] == (term, key):
+                del self.keys[index]
+
+    def update(self, changed):
+        """Reload the given ``(kind, pk)`` entries from the database."""
+        by_kind = {}
+        for kind, pk in changed:
+            by_kind.setdefault(kind, set()).add(pk)
+        fresh = {}
+        for kind, ids in by_kind.items():
+            fresh.update(_entries_for(kind, list(ids)))
+        with self.lock:
+            for key in changed:
+                self._remove(key)
+                if key in fresh:
+                    self.entries[key] = fresh[key]
+                    for term in _terms(fresh[key][2]):
+                        insort(self.keys, (term, key))
+            self.hot.clear()
+
+    def _match(self, prefix, limit):
+        candidates = {}
+        index = bisect_left(self.keys, (prefix,))
+        for term, key in self.keys[index : index + MAX_SCAN]:
+            if not term.startswith(prefix):
+                break
+            label, _, normalized = self.entries[key]
+            # Matches at the start of the name beat mid-name word matches
+            starts = normalized.startswith(prefix)
+            rank = (0 if starts else 1, KIND_ORDER[key[0]], len(label), label)
+            if key not in candidates or rank < candidates[key]:
+                candidates[key] = rank
+        ranked = sorted(candidates.items(), key=lambda item: item[1])
+        return [key for key, _ in ranked[:limit]]
+
+    def _suggestion(self, key):
+        kind, pk = key
+        label, url_kwargs, _ = self.entries[key]
+        url = None
+        if kind != BRAND:
+            url = reverse(f"shop:{kind}_detail", kwargs=url_kwargs)
+        return {
+            "type": kind,
+            "id": pk,
+            "name": label,
+            "slug": url_kwargs["slug"],
+            "url": url,
+        }
+
+    def lookup(self, prefix, limit=10):
+        """Return suggestion dicts for a prefix, from the LRU when hot."""
+        prefix = " ".join(normalize(prefix).split())
+        if not prefix:
+            return []
+        # URLs are language-prefixed, so the language is part of the key
+        hot_key = (prefix, limit, get_language())
+        with self.lock:
+            result = self.hot.get(hot_key)
+            if result is not None:
+                self.hot.move_to_end(hot_key)
+                return result
+            result = [self._suggestion(key) for key in self._match(prefix, limit)]
+            self.hot[hot_key] = result
+            if len(self.hot) > HOT_PREFIX_CACHE_SIZE:
+                self.hot.popitem(last=False)
+            return result
+
+
+_index = None
+_index_lock = threading.Lock()
+_rebuilding = False
+
+
+def _change_key(version):
+    return f"shop:autocomplete:change:{version}"
+
+
+def _published_version():
+    version = cache.get(AUTOCOMPLETE_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(AUTOCOMPLETE_VERSION_KEY, version, None)
+    return version
+
+
+def _changes(since, version):
+    """
+    The entries changed after version ``since`` up to ``version``, or
+    ``None`` when some are no longer known (the index must be rebuilt).
+    """
+    if version - since > AUTOCOMPLETE_LOG_SIZE:
+        return None
+    keys = [_change_key(v) for v in range(since + 1, version + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return set(found.values())
+
+
+def _rebuild(version, in_thread=False):
+    global _index, _rebuilding
+    try:
+        index = PrefixIndex(version)
+        index.build()
+        with _index_lock:
+            if _index is None or _index.version <= version:
+                _index = index
+    finally:
+        _rebuilding = False
+        if in_thread:
+            connection.close()
+
+
+def _start_rebuild(version):
+    """Rebuild the index in the background unless a rebuild is running."""
+    global _rebuilding
+    with _index_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(
+        target=_rebuild,
+        args=(version, True),
+        name="autocomplete-rebuild",
+        daemon=True,
+    ).start()
+
+
+def get_index():
+    """Return this worker's index, catching up with published changes."""
+    global _index
+    version = _published_version()
+    index = _index
+    if index is None:
+        with _index_lock:
+            index = _index
+            if index is None:
+                index = PrefixIndex(version)
+                index.build()
+                _index = index
+        return index
+
+    if time.monotonic() - index.built_at > AUTOCOMPLETE_MAX_AGE:
+        _start_rebuild(version)
+    if index.version < version:
+        with index.lock:
+            if index.version < version:
+                changed = _changes(index.version, version)
+                if changed is None:
+                    _start_rebuild(version)
+                else:
+                    index.update(changed)
+                    index.version = version
+    return index
+
+
+def suggest(prefix, limit=10):
+    """Return up to ``limit`` suggestion dicts for a typed prefix."""
+    return get_index().lookup(prefix, limit)
+
+
+def mark_changed(kind, pk):
+    """Publish a changed entry to every worker (called from shop.signals)."""
+    try:
+        version = cache.incr(AUTOCOMPLETE_VERSION_KEY)
+    except ValueError:
+        version = 2
+        cache.set(AUTOCOMPLETE_VERSION_KEY, version, None)
+    cache.set(_change_key(version), (kind, pk), AUTOCOMPLETE_CHANGE_TIMEOUT)
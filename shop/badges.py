@@ -0,0 +1,79 @@
+"""
+Cached cart / wishlist badge counters.
+
+The header badges are polled on every page. Customer counters are cached per
+user and dropped by the CartItem / Cart / WishlistItem signals, so a poll is
+answered from the session and the cache alone; anonymous counters come
+straight from the session cart and wishlist (see shop.cart_storage).
+"""
+
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+
+from .cart_storage import SESSION_CART_ID_KEY, SESSION_CART_KEY
+from .models import Cart, WishlistItem
+
+BADGE_TIMEOUT = 10 * 60  # Bounds any drift from writes that bypass signals
+
+
+def _user_key(user_id):
+    return f"shop:badges:user:{user_id}"
+
+
+def _cart_key(cart_id):
+    return f"shop:badges:cart:{cart_id}"
+
+
+def _count_for_user(user_id):
+    cart_count = (
+        Cart.objects.filter(user_id=user_id)
+        .values_list("total_items_field", flat=True)
+        .first()
+    )
+    wishlist_count = WishlistItem.objects.filter(wishlist__user_id=user_id).count()
+    return cart_count or 0, wishlist_count
+
+
+def get_counts(request):
+    """
+    Return ``(scope, cart_count, wishlist_count)`` for the request without
+    loading the user; ``scope`` identifies whose counters these are.
+    """
+    session = request.session
+    user_id = session.get(SESSION_KEY)
+    if user_id is not None:
+        key = _user_key(user_id)
+        counts = cache.get(key)
+        if counts is None:
+            counts = _count_for_user(user_id)
+            cache.set(key, counts, BADGE_TIMEOUT)
+        return (f"user:{user_id}", *counts)
+
+    wishlist = session.get("wishlist", [])
+    wishlist_count = len(wishlist) if isinstance(wishlist, list) else 0
+    cart_id = session.get(SESSION_CART_ID_KEY)
+    if cart_id is None:
+        return "session", sum(session.get(SESSION_CART_KEY, {}).values()), wishlist_count
+
+    # An anonymous cart promoted at checkout
+    key = _cart_key(cart_id)
+    cart_count = cache.get(key)
+    if cart_count is None:
+        cart_count = (
+            Cart.objects.filter(pk=cart_id)
+            .values_list("total_items_field", flat=True)
+            .first()
+        ) or 0
+        cache.set(key, cart_count, BADGE_TIMEOUT)
+    return f"cart:{cart_id}", cart_count, wishlist_count
+
+
+def invalidate_user(user_id):
+    cache.delete(_user_key(user_id))
+
+
+def invalidate_cart(cart_id, user_id=None):
+    keys = [_cart_key(cart_id)]
+    if user_id is not None:
+        keys.append(_user_key(user_id))
+    cache.delete_many(keys)
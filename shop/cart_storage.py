@@ -0,0 +1,217 @@
+"""
+Cart storage: database carts for customers, session carts for anonymous
+shoppers.
+
+Most anonymous visitors never buy, so their cart lives in the session as
+``{variant_id: quantity}`` (the format ``merge_session_cart_wishlist`` merges
+on login) and no Cart row is written for them. The session cart is promoted
+to a database Cart only when the shopper reaches checkout; the session then
+remembers the promoted cart's id so later changes go to that cart.
+
+``SessionCart`` exposes the parts of the Cart interface the views use
+(``total_items``, ``total_price``, ``update_totals()``, ``add()``), and its
+items behave like CartItem instances (``save()``, ``delete()``,
+``get_total_price()``), so the cart page works on either kind of cart.
+"""
+
+from decimal import Decimal
+
+from .models import Cart, CartItem, ProductVariant
+
+SESSION_CART_KEY = "cart"
+# Id of the database cart an anonymous session was promoted to
+SESSION_CART_ID_KEY = "cart_id"
+
+
+class SessionCartItem:
+    """A session cart line; its ``id`` is the variant id."""
+
+    def __init__(self, cart, product_variant, quantity):
+        self.cart = cart
+        self.product_variant = product_variant
+        self.quantity = quantity
+        self.id = self.pk = product_variant.pk
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_variant}"
+
+    def get_unit_price(self):
+        return self.product_variant.get_price
+
+    def get_total_price(self):
+        return self.quantity * self.get_unit_price()
+
+    def save(self):
+        self.cart.set_quantity(self.id, self.quantity)
+
+    def delete(self):
+        self.cart.remove(self.id)
+
+
+class SessionCart:
+    """Anonymous cart kept in the session instead of the database."""
+
+    user = None
+    is_session_cart = True
+
+    def __init__(self, session):
+        self.session = session
+        self._items = None
+
+    def __bool__(self):
+        return True
+
+    @property
+    def session_key(self):
+        return self.session.session_key
+
+    @property
+    def lines(self):
+        return self.session.get(SESSION_CART_KEY, {})
+
+    def _store(self, lines):
+        self.session[SESSION_CART_KEY] = lines
+        self._items = None
+
+    @property
+    def total_items(self):
+        return sum(self.lines.values())
+
+    @property
+    def total_price(self):
+        return sum(
+            (item.get_total_price() for item in self.get_items()), Decimal("0.00")
+        )
+
+    # Cart field names, for code written against the model
+    total_items_field = total_items
+    total_price_field = total_price
+
+    def update_totals(self):
+        return self.total_items, self.total_price
+
+    def add(self, variant, quantity):
+        """Add ``quantity`` of ``variant``; returns the new line quantity."""
+        lines = dict(self.lines)
+        key = str(variant.pk)
+        lines[key] = lines.get(key, 0) + quantity
+        self._store(lines)
+        return lines[key]
+
+    def set_quantity(self, variant_id, quantity):
+        if quantity <= 0:
+            return self.remove(variant_id)
+        lines = dict(self.lines)
+        lines[str(variant_id)] = quantity
+        self._store(lines)
+        return True
+
+    def remove(self, variant_id):
+        lines = dict(self.lines)
+        if lines.pop(str(variant_id), None) is None:
+            return False
+        self._store(lines)
+        return True
+
+    def get_item(self, variant_id):
+        for item in self.get_items():
+            if str(item.id) == str(variant_id):
+                return item
+        return None
+
+    def get_items(self):
+        """The cart lines with their variants loaded in a single query."""
+        if self._items is None:
+            lines = self.lines
+            variants = ProductVariant.objects.select_related(
+                "product", "color", "size"
+            ).in_bulk([int(variant_id) for variant_id in lines])
+            self._items = [
+                SessionCartItem(self, variants[int(variant_id)], quantity)
+                for variant_id, quantity in lines.items()
+                if int(variant_id) in variants
+            ]
+        return self._items
+
+
+def _promoted_cart(request):
+    cart_id = request.session.get(SESSION_CART_ID_KEY)
+    if cart_id is None:
+        return None
+    cart = Cart.objects.filter(pk=cart_id, user__isnull=True).first()
+    if cart is None:
+        request.session.pop(SESSION_CART_ID_KEY, None)
+    return cart
+
+
+def get_cart(request, create=False):
+    """
+    Return the request's cart: the customer's Cart (created when ``create``
+    is set, otherwise possibly ``None``), the Cart an anonymous session was
+    promoted to, or else a ``SessionCart``. Never writes for anonymous users.
+    """
+    if request.user.is_authenticated:
+        if create:
+            return Cart.objects.get_or_create(user=request.user)[0]
+        return Cart.objects.filter(user=request.user).first()
+    return _promoted_cart(request) or SessionCart(request.session)
+
+
+def promote(request):
+    """
+    Move an anonymous session cart into a database Cart (at checkout) and
+    return it. Returns the customer's cart for authenticated users and
+    ``None`` when there is nothing to check out.
+    """
+    if request.user.is_authenticated:
+        return Cart.objects.filter(user=request.user).first()
+
+    cart = _promoted_cart(request)
+    lines = {
+        int(variant_id): quantity
+        for variant_id, quantity in request.session.get(SESSION_CART_KEY, {}).items()
+    }
+    if cart is None:
+        if not lines:
+            return None
+        if not request.session.session_key:
+            request.session.save()
+        # Adopts a cart stored under this session by an older version
+        cart = Cart.objects.get_or_create(
+            session_key=request.session.session_key, user=None
+        )[0]
+        request.session[SESSION_CART_ID_KEY] = cart.pk
+
+    if lines:
+        merge_lines(cart, lines)
+        request.session.pop(SESSION_CART_KEY, None)
+    return cart
+
+
+def merge_lines(cart, lines):
+    """
+    Add ``{variant_id: quantity}`` to a database cart, summing quantities
+    with its existing items: one read of the items, one of the variants
+    (unknown ids are skipped) and two bulk writes, then the totals are
+    recomputed once.
+    """
+    lines = {int(variant_id): quantity for variant_id, quantity in lines.items()}
+    if not lines:
+        return
+    existing = {
+        item.product_variant_id: item
+        for item in cart.items.filter(product_variant_id__in=lines)
+    }
+    valid_ids = set(
+        ProductVariant.objects.filter(pk__in=lines).values_list("pk", flat=True)
+    )
+    for variant_id, item in existing.items():
+        item.quantity += lines[variant_id]
+    CartItem.objects.bulk_update(existing.values(), ["quantity"])
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product_variant_id=variant_id, quantity=quantity)
+        for variant_id, quantity in lines.items()
+        if variant_id in valid_ids and variant_id not in existing
+    )
+    # Bulk writes bypass CartItem's incremental totals
+    cart.update_totals()
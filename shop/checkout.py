@@ -0,0 +1,283 @@
+"""
+Order placement.
+
+``place_order`` turns a list of cart lines into an Order with a fixed number
+of queries however many lines or vendors the cart holds:
+
+    variants                    one SELECT (no row locks)
+    the cart's stock holds      one SELECT ... FOR UPDATE + one DELETE
+    vendors (commission rates)  one SELECT; shipping comes from shop.shipping
+    order, address, payment     one INSERT each, written once with final totals
+    order items, vendor orders  one bulk INSERT each
+    stock and released holds    one conditional UPDATE
+    vendor wallets              one UPDATE with F() expressions
+    coupon                      see shop.coupons.redeem
+
+Stock is never oversold: the stock UPDATE only matches a variant whose
+unreserved stock, plus what this cart holds (shop.reservations), covers the
+line, and releases the hold in the same statement. Everything runs in one
+transaction; a line without enough stock raises CheckoutError and nothing
+is written. Queryset updates bypass the ProductVariant signals, so the
+cached variant matrices, product documents and facet documents are
+refreshed once the transaction commits.
+"""
+
+import logging
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from . import (
+    coupons,
+    facets,
+    fragments,
+    product_documents,
+    reservations,
+    shipping,
+    variant_matrix,
+)
+from .models import (
+    Order,
+    OrderItem,
+    Payment,
+    ProductVariant,
+    VendorOrder,
+    VendorProfile,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(ValueError):
+    """The order cannot be placed as requested (e.g. not enough stock)."""
+
+
+def cart_lines(cart):
+    """
+    Return ``{variant_id: quantity}`` for a database cart (one query) or a
+    session / express cart.
+    """
+    if getattr(cart, "is_session_cart", False):
+        return {int(variant_id): quantity for variant_id, quantity in cart.lines.items()}
+    lines = defaultdict(int)
+    for variant_id, quantity in cart.items.values_list(
+        "product_variant_id", "quantity"
+    ):
+        lines[variant_id] += quantity
+    return dict(lines)
+
+
+def _describe(variant):
+    return (
+        f"{variant.product.name} "
+        f"({variant.color.name if variant.color else 'N/A'}, "
+        f"{variant.size.name if variant.size else 'N/A'})"
+    )
+
+
+def _load_variants(lines, held):
+    variants = ProductVariant.objects.select_related(
+        "product", "color", "size"
+    ).in_bulk(list(lines))
+    for variant_id, quantity in lines.items():
+        variant = variants.get(variant_id)
+        if variant is None:
+            raise CheckoutError("An item in your cart is no longer available.")
+        available = (
+            variant.stock_quantity - variant.reserved_quantity + held.get(variant_id, 0)
+        )
+        if available < quantity:
+            raise CheckoutError(
+                f"Not enough stock for {_describe(variant)}. "
+                f"Available: {max(available, 0)}, Requested: {quantity}"
+            )
+    return variants
+
+
+def _decrement_stock(lines, held):
+    """
+    Take ``lines`` out of stock and every ``held`` quantity out of the
+    reserved counters in one UPDATE; returns the rows updated. Holds are
+    released in full, including those of variants no longer in the cart
+    and any quantity held beyond what is bought.
+    """
+
+    def per_variant(values):
+        return Case(
+            *[When(pk=variant_id, then=Value(qty)) for variant_id, qty in values.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+    quantity = per_variant(lines)
+    released = per_variant(held)
+    return ProductVariant.objects.filter(
+        Q(
+            pk__in=list(lines),
+            stock_quantity__gte=F("reserved_quantity") - released + quantity,
+        )
+        | Q(pk__in=[variant_id for variant_id in held if variant_id not in lines])
+    ).update(
+        stock_quantity=F("stock_quantity") - quantity,
+        reserved_quantity=Greatest(F("reserved_quantity") - released, Value(0)),
+    )
+
+
+def _credit_wallets(payouts):
+    """Add ``{vendor_id: amount}`` to the vendor wallets in one UPDATE."""
+    if not payouts:
+        return
+    amount = Case(
+        *[When(pk=vendor_id, then=Value(payout)) for vendor_id, payout in payouts.items()],
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    VendorProfile.objects.filter(pk__in=list(payouts)).update(
+        wallet_balance=F("wallet_balance") + amount
+    )
+
+
+def _stock_sold(sold, sold_out):
+    """
+    Drop the caches kept for variant stock after an order committed.
+    ``sold`` are the products ordered, ``sold_out`` the products of which a
+    variant ran out.
+    """
+    try:
+        variant_matrix.invalidate_many(sold)
+        product_documents.invalidate_many(sold)
+        if sold_out:
+            for product_id in sold_out:
+                facets.refresh_product(product_id)
+            fragments.bump(*fragments.PRODUCT_SECTIONS)
+    except Exception as e:
+        logger.error(f"Failed to update stock caches after an order: {e}")
+
+
+@transaction.atomic
+def place_order(
+    *,
+    user,
+    lines,
+    contact,
+    address,
+    payment_method,
+    transaction_photo=None,
+    coupon=None,
+    reserved_for=None,
+    idempotency_key=None,
+):
+    """
+    Create a paid Order for ``lines`` (``{variant_id: quantity}``).
+
+    ``contact`` holds the order's ``full_name``, ``email`` and
+    ``phone_number``; ``address`` is an unsaved ShippingAddress that becomes
+    the order's shipping address. ``coupon`` is redeemed by the order and
+    the stock holds of the ``reserved_for`` cart are converted into it.
+    Raises CheckoutError when a line cannot be fulfilled, CouponError when
+    the coupon's limits were reached and IntegrityError when an order was
+    already placed with ``idempotency_key`` (see shop.idempotency).
+    """
+    if not lines:
+        raise CheckoutError("Your cart is empty.")
+
+    held = reservations.claim(reserved_for) if reserved_for is not None else {}
+    variants = _load_variants(lines, held)
+
+    subtotals = defaultdict(Decimal)
+    for variant_id, quantity in lines.items():
+        variant = variants[variant_id]
+        subtotals[variant.product.vendor_id] += variant.get_price * quantity
+    vendors = VendorProfile.objects.in_bulk(
+        [vendor_id for vendor_id in subtotals if vendor_id is not None]
+    )
+    shipping_quote = shipping.quote(dict(subtotals), address.city)
+
+    subtotal = shipping_quote.subtotal
+    shipping_cost = shipping_quote.total
+    discount_amount = (
+        coupons.discount_for(coupon, subtotal) if coupon else Decimal("0.00")
+    )
+    grand_total = subtotal + shipping_cost - discount_amount
+
+    order = Order.objects.create(
+        user=user,
+        full_name=contact["full_name"],
+        email=contact.get("email") or "",
+        phone_number=contact["phone_number"],
+        subtotal=subtotal,
+        shipping_cost=shipping_cost,
+        grand_total=grand_total,
+        coupon=coupon,
+        discount_amount=discount_amount,
+        status="processing",
+        payment_status="paid",
+        idempotency_key=idempotency_key,
+    )
+
+    address.order = order
+    address.save()
+
+    Payment.objects.create(
+        order=order,
+        payment_method=payment_method,
+        amount=grand_total,
+        transaction_id=f"TXN-{uuid.uuid4().hex[:10]}",
+        is_success=True,
+        transaction_photo=transaction_photo,
+    )
+
+    OrderItem.objects.bulk_create(
+        OrderItem(
+            order=order,
+            product_variant_id=variant_id,
+            quantity=quantity,
+            price_at_purchase=variants[variant_id].get_price,
+        )
+        for variant_id, quantity in lines.items()
+    )
+
+    vendor_orders = []
+    for vendor_id, vendor in vendors.items():
+        commission_amount = (subtotals[vendor_id] * vendor.commission_rate) / 100
+        vendor_order = VendorOrder(
+            order=order,
+            vendor=vendor,
+            subtotal=subtotals[vendor_id],
+            shipping_charged=shipping_quote.charges[vendor_id],
+            commission_rate=vendor.commission_rate,
+            commission_amount=commission_amount,
+        )
+        vendor_order.calculate_net_payout()  # bulk_create skips save()
+        vendor_orders.append(vendor_order)
+    VendorOrder.objects.bulk_create(vendor_orders)
+
+    # Misses when another order took the stock since it was read; the
+    # transaction rolls everything back, holds included
+    if _decrement_stock(lines, held) != len(set(lines) | set(held)):
+        raise CheckoutError("Stock changed while placing your order. Please try again.")
+
+    _credit_wallets(
+        {vendor_order.vendor_id: vendor_order.net_payout for vendor_order in vendor_orders}
+    )
+
+    if coupon:
+        coupons.redeem(coupon, order, user)
+
+    sold, sold_out = set(), set()
+    for variant_id, quantity in lines.items():
+        variant = variants[variant_id]
+        sold.add(variant.product_id)
+        # Stock left for other shoppers: this cart's hold is released
+        unreserved = variant.stock_quantity - (
+            variant.reserved_quantity - held.get(variant_id, 0)
+        )
+        if unreserved <= quantity:
+            sold_out.add(variant.product_id)
+    transaction.on_commit(partial(_stock_sold, sold, sold_out))
+    reservations.publish(set(held) - set(lines))
+    return order
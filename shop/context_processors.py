@@ -1,13 +1,47 @@
-from itertools import chain
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from . import notification_feed
 from .models import Category
 
+# Context processors run for every template rendered with a request,
+# AJAX partials included, so their values are lazy: nothing is queried
+# unless the template uses it.
+
+CATEGORIES_CACHE_TIMEOUT = 60 * 60
+CATEGORIES_VERSION_KEY = "shop:nav_categories:version"
+
+
+def _categories_version():
+    version = cache.get(CATEGORIES_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(CATEGORIES_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_categories():
+    try:
+        cache.incr(CATEGORIES_VERSION_KEY)
+    except ValueError:
+        cache.set(CATEGORIES_VERSION_KEY, 2, None)
+
+
+def active_categories():
+    """The active categories by name, cached until a Category changes."""
+    key = f"shop:nav_categories:{_categories_version()}"
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.filter(is_active=True).order_by("name"))
+        cache.set(key, categories, CATEGORIES_CACHE_TIMEOUT)
+    return categories
+
 
 def categories_processor(request):
     """
     Provides a list of all active categories to all templates.
     """
-    categories = Category.objects.filter(is_active=True).order_by("name")
-    return {"all_categories": categories}
+    return {"all_categories": SimpleLazyObject(active_categories)}
 
 
 def currency_processor(request):
@@ -15,15 +49,7 @@ def currency_processor(request):
     Provides the user's selected currency to all templates.
     Defaults to USD if not set.
     """
-    currency = request.session.get("currency", "USD")
-    # Debug logging
-    import logging
-
-    logger = logging.getLogger(__name__)
-    logger.info(
-        f"Currency processor: session_key={request.session.session_key}, currency={currency}"
-    )
-    return {"currency": currency}
+    return {"currency": request.session.get("currency", "USD")}
 
 
 def notifications_context(request):
@@ -33,21 +59,8 @@ def notifications_context(request):
     if not request.user.is_authenticated:
         return {}
 
-    # Fetch notifications from both shop and freelancing apps
-    shop_notifications = request.user.shop_notifications.all()
-    freelancing_notifications = request.user.freelancing_notifications.all()
-
-    # Combine and sort all notifications by creation date
-    all_notifications = sorted(
-        chain(shop_notifications, freelancing_notifications),
-        key=lambda x: x.created_at,
-        reverse=True,
-    )
-
-    # Get the count of unread notifications from both sources
-    unread_count = sum(1 for n in all_notifications if not n.is_read)
-
+    feed = SimpleLazyObject(lambda: notification_feed.get_feed(request.user))
     return {
-        "recent_notifications": all_notifications[:10],  # Show the 10 most recent
-        "unread_notifications_count": unread_count,
+        "recent_notifications": SimpleLazyObject(lambda: feed[0]),
+        "unread_notifications_count": SimpleLazyObject(lambda: feed[1]),
     }
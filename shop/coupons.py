@@ -0,0 +1,154 @@
+"""
+Coupons.
+
+The applied coupon is kept in the session by code. Its definition is read
+from the cache (``get_coupon``), so rendering the cart or checkout does not
+query the Coupon table; the Coupon signals drop every cached definition
+through a version number.
+
+Limits are enforced when an order redeems the coupon (``redeem``), inside
+the order's transaction:
+
+    max_uses            one conditional UPDATE: times_used < max_uses
+    max_uses_per_user   a CouponRedemption row numbered per customer; the
+                        unique (coupon, user, use_number) constraint rejects
+                        a concurrent redemption over the limit
+
+The checks made while browsing (``check``) only keep shoppers from
+applying a coupon that will not redeem.
+"""
+
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .models import Coupon, CouponRedemption
+
+SESSION_COUPON_KEY = "coupon_code"
+COUPON_CACHE_TIMEOUT = 5 * 60
+COUPON_VERSION_KEY = "shop:coupons:version"
+# Cached for unknown codes (None would read as a miss)
+NO_COUPON = 0
+
+
+class CouponError(ValueError):
+    """The coupon cannot be used; the message is shown to the shopper."""
+
+
+def _version():
+    version = cache.get(COUPON_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(COUPON_VERSION_KEY, version, None)
+    return version
+
+
+def _key(code):
+    return f"shop:coupons:{_version()}:code:{code.strip().lower()}"
+
+
+def get_coupon(code):
+    """The coupon with ``code`` (case-insensitive), or ``None``."""
+    if not code:
+        return None
+    key = _key(code)
+    coupon = cache.get(key)
+    if coupon is None:
+        coupon = Coupon.objects.filter(code__iexact=code.strip()).first() or NO_COUPON
+        cache.set(key, coupon, COUPON_CACHE_TIMEOUT)
+    return coupon or None
+
+
+def invalidate_all():
+    try:
+        cache.incr(COUPON_VERSION_KEY)
+    except ValueError:
+        cache.set(COUPON_VERSION_KEY, 2, None)
+
+
+def user_uses(coupon, user):
+    """How many orders of ``user`` redeemed ``coupon`` (indexed count)."""
+    return CouponRedemption.objects.filter(coupon=coupon, user=user).count()
+
+
+def check(coupon, subtotal, user=None):
+    """Raise CouponError unless ``coupon`` applies to a cart of ``subtotal``."""
+    now = timezone.now()
+    if not (coupon.is_active and coupon.valid_from <= now <= coupon.valid_to):
+        raise CouponError(_("This coupon is invalid or has expired."))
+    if coupon.max_uses is not None and coupon.times_used >= coupon.max_uses:
+        raise CouponError(_("This coupon has reached its usage limit."))
+    if coupon.min_purchase_amount and subtotal < coupon.min_purchase_amount:
+        raise CouponError(
+            _("Cart total must be at least %(amount)s to use this coupon.")
+            % {"amount": coupon.min_purchase_amount}
+        )
+    if user is not None and user.is_authenticated:
+        if user_uses(coupon, user) >= coupon.max_uses_per_user:
+            raise CouponError(
+                _("You have already used this coupon the maximum number of times.")
+            )
+
+
+def discount_for(coupon, subtotal):
+    """The discount ``coupon`` gives on ``subtotal``, never more than it."""
+    if coupon.discount_type == "percentage":
+        discount = subtotal * coupon.discount_value / 100
+    else:
+        discount = coupon.discount_value
+    return min(discount, subtotal).quantize(Decimal("0.01"))
+
+
+def applied_coupon(request, subtotal):
+    """
+    Return ``(coupon, discount, error)`` for the coupon applied in the
+    session. A coupon that no longer applies is removed from the session;
+    ``error`` then holds the reason to show the shopper.
+    """
+    code = request.session.get(SESSION_COUPON_KEY)
+    coupon = get_coupon(code)
+    if coupon is None:
+        if code:
+            request.session.pop(SESSION_COUPON_KEY, None)
+        return None, Decimal("0.00"), None
+    try:
+        check(coupon, subtotal, request.user)
+    except CouponError as e:
+        request.session.pop(SESSION_COUPON_KEY, None)
+        return None, Decimal("0.00"), str(e)
+    return coupon, discount_for(coupon, subtotal), None
+
+
+def redeem(coupon, order, user=None):
+    """
+    Count one use of ``coupon`` by ``order``. Must run inside the order's
+    transaction; raises CouponError when a limit has been reached.
+    """
+    used = Coupon.objects.filter(
+        Q(max_uses__isnull=True) | Q(times_used__lt=F("max_uses")),
+        pk=coupon.pk,
+    ).update(times_used=F("times_used") + 1)
+    if not used:
+        raise CouponError(_("This coupon has reached its usage limit."))
+
+    use_number = 1
+    if user is not None:
+        use_number = user_uses(coupon, user) + 1
+        if use_number > coupon.max_uses_per_user:
+            raise CouponError(
+                _("You have already used this coupon the maximum number of times.")
+            )
+    try:
+        with transaction.atomic():
+            CouponRedemption.objects.create(
+                coupon=coupon, user=user, order=order, use_number=use_number
+            )
+    except IntegrityError:
+        # Another order of this customer took the same use number
+        raise CouponError(
+            _("You have already used this coupon the maximum number of times.")
+        )
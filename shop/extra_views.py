@@ -1,7 +1,7 @@
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
 from django.utils.translation import gettext as _
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, require_POST
 from .models import (
     ProductVariant,
     CartItem,
@@ -9,95 +9,96 @@ from .models import (
     Product,
 )  # Assuming Cart and CartItem are in .models
 from .utils import get_or_create_cart  # Assuming this is a utility function you have
+from .express import buy_now_url, get_express_cart
 from django.db import transaction
 
 
 def buy_now_view(request):
     if request.method == "POST":
-        product_id = request.POST.get("product_id")
-        color_id = request.POST.get("color_id")
-        size_id = request.POST.get("size_id")
-        quantity_str = request.POST.get(
-            "quantity", "1"
-        )  # Get quantity from POST, default to '1'
-
-        try:
-            quantity = int(quantity_str)
-            if quantity <= 0:
-                messages.error(request, _("Quantity must be a positive number."))
-                # Attempt to redirect back to the product detail page
-                if product_id:
-                    product = get_object_or_404(Product, id=product_id)
-                    return redirect("shop:product_detail", slug=product.slug)
-                return redirect("shop:home")  # Fallback
-        except ValueError:
-            messages.error(request, _("Invalid quantity provided."))
+        return _buy_now(request)
+    else:
+        messages.error(request, _("Invalid request for buy now."))
+        return redirect("shop:home")
+
+
+def _buy_now(request):
+    product_id = request.POST.get("product_id")
+    color_id = request.POST.get("color_id")
+    size_id = request.POST.get("size_id")
+    quantity_str = request.POST.get(
+        "quantity", "1"
+    )  # Get quantity from POST, default to '1'
+
+    try:
+        quantity = int(quantity_str)
+        if quantity <= 0:
+            messages.error(request, _("Quantity must be a positive number."))
             # Attempt to redirect back to the product detail page
             if product_id:
                 product = get_object_or_404(Product, id=product_id)
                 return redirect("shop:product_detail", slug=product.slug)
             return redirect("shop:home")  # Fallback
-
-        if not product_id or not color_id or not size_id:
-            messages.error(request, _("Please select a product, color, and size."))
-            # Attempt to redirect back to the product detail page if product_id is known
-            if product_id:
-                product = get_object_or_404(Product, id=product_id)
-                return redirect("shop:product_detail", slug=product.slug)
-            return redirect("shop:home")  # Fallback if product_id is missing
-
-        try:
-            variant = get_object_or_404(
-                ProductVariant,
-                product_id=product_id,
-                color_id=color_id,
-                size_id=size_id,
-            )
-        except ProductVariant.DoesNotExist:
-            messages.error(request, _("The selected product variant does not exist."))
-            # Redirect to the product detail if the variant is invalid
+    except ValueError:
+        messages.error(request, _("Invalid quantity provided."))
+        # Attempt to redirect back to the product detail page
+        if product_id:
             product = get_object_or_404(Product, id=product_id)
             return redirect("shop:product_detail", slug=product.slug)
+        return redirect("shop:home")  # Fallback
 
-        # Check stock for the requested quantity
-        if variant.stock_quantity < quantity:
-            messages.error(
-                request,
-                _(
-                    f"Not enough stock. Only {variant.stock_quantity} available for {variant.product.name} ({variant.color.name}, {variant.size.name})."
-                ),
-            )
-            return redirect("shop:product_detail", slug=variant.product.slug)
-
+    if not product_id or not color_id or not size_id:
+        messages.error(request, _("Please select a product, color, and size."))
+        # Attempt to redirect back to the product detail page if product_id is known
+        if product_id:
+            product = get_object_or_404(Product, id=product_id)
+            return redirect("shop:product_detail", slug=product.slug)
+        return redirect("shop:home")  # Fallback if product_id is missing
+
+    variant = get_object_or_404(
+        ProductVariant.objects.select_related("product", "color", "size"),
+        product_id=product_id,
+        color_id=color_id,
+        size_id=size_id,
+    )
+
+    # Check stock for the requested quantity
+    if variant.available_quantity < quantity:
+        messages.error(
+            request,
+            _("Not enough stock. Only %(available)s available for %(product)s (%(color)s, %(size)s).")
+            % {
+                "available": variant.available_quantity,
+                "product": variant.product.name,
+                "color": variant.color.name,
+                "size": variant.size.name,
+            },
+        )
+        return redirect("shop:product_detail", slug=variant.product.slug)
+
+    # Check out this one line directly; the shopper's cart is left untouched
+    # (a repeated click just opens the same checkout again)
+    return redirect(buy_now_url(variant, quantity))
+
+
+@require_POST
+def express_to_cart(request):
+    """Leave an express checkout: move its line into the shopper's cart."""
+    express_cart = get_express_cart(request)
+    if express_cart is None:
+        return redirect("shop:cart_view")
+    item = express_cart.get_items()
+    if item:
+        item = item[0]
+        # A session cart for anonymous shoppers, promoted at checkout
         cart = get_or_create_cart(request)
-
-        # Use a transaction for critical cart operations
         with transaction.atomic():
-            # Add the single item with the selected quantity
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product_variant=variant,
-                defaults={
-                    "quantity": quantity
-                },  # Set the quantity from the POST request
-            )
-            if not created:
-                # If item already existed, update its quantity
-                cart_item.quantity += quantity
-                cart_item.save()
-
-            cart.update_totals()  # Recalculate cart totals after modification
-
+            cart.add(item.product_variant, item.quantity)
         messages.success(
             request,
-            _(
-                f"{quantity} x {variant.product.name} ({variant.color.name}, {variant.size.name}) added to cart."
-            ),
+            _("%(quantity)s x %(product)s added to cart.")
+            % {"quantity": item.quantity, "product": item.product_variant.product.name},
         )
-        return redirect("shop:checkout")
-    else:
-        messages.error(request, _("Invalid request for buy now."))
-        return redirect("shop:home")
+    return redirect("shop:cart_view")
 
 
 @require_http_methods(["GET", "POST"])
@@ -0,0 +1,352 @@
+"""
+Facet index for the category / subcategory filter sidebars.
+
+Each listing scope ("all", a category or a subcategory) has a cached facet
+document holding one compact row per storefront product:
+
+    product_id -> (subcategory_id, brand_id, fit_type_id, price,
+                   color_ids, size_ids)
+
+plus the label objects (Brand, FitType, Color, Size, SubCategory slugs) needed
+to render the sidebar. ``price`` is the price shoppers pay (the sale price
+while on sale), which is also what the listings filter and sort on.
+
+The facet counts are aggregated from the rows once per scope and combination
+of GET filters and cached next to the document, so a page view reads one
+small cached result; the rows are only loaded and filtered in Python when
+that result is missing. This replaces one DISTINCT query per facet plus a
+Min/Max aggregate.
+
+Every scope has its own version number: the Product / ProductVariant signals
+bump the versions of the scopes a product is (or was) listed in, and the
+documents are rebuilt on their next read. A bump is one atomic ``incr``, so
+concurrent writes never lose each other's changes and no write has to load a
+whole catalog document. The whole index is invalidated (global version bump)
+when a facet label model changes.
+"""
+
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+
+from .models import Brand, Color, FitType, Product, ProductVariant, Size, SubCategory
+
+FACET_CACHE_TIMEOUT = 60 * 60  # Rebuild at least hourly to absorb any drift
+FACET_VERSION_KEY = "shop:facets:version"
+
+# Upper bounds of the price buckets shown in the sidebar (last bucket is open).
+PRICE_BUCKETS = (
+    Decimal("25"),
+    Decimal("50"),
+    Decimal("100"),
+    Decimal("200"),
+    Decimal("500"),
+)
+
+# Row tuple positions
+SUBCATEGORY, BRAND, FIT_TYPE, PRICE, COLORS, SIZES = range(6)
+
+# The GET parameters applied by ``_filter_rows``; they key the cached counts
+FILTER_PARAMS = (
+    "subcategory",
+    "fit_type",
+    "brand",
+    "color",
+    "size",
+    "min_price",
+    "max_price",
+)
+
+
+def _version():
+    version = cache.get(FACET_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(FACET_VERSION_KEY, version, None)
+    return version
+
+
+def _scope_version_key(version, scope):
+    return f"shop:facets:{version}:{scope}:version"
+
+
+def _scope_key(scope):
+    version = _version()
+    version_key = _scope_version_key(version, scope)
+    scope_version = cache.get(version_key)
+    if scope_version is None:
+        scope_version = 1
+        cache.add(version_key, scope_version, None)
+    return f"shop:facets:{version}:{scope}:{scope_version}"
+
+
+def scope_for(category=None, subcategory=None):
+    """Return the scope name used to key a listing's facet document."""
+    if subcategory is not None:
+        return f"sub:{subcategory.pk}"
+    if category is not None:
+        return f"cat:{category.pk}"
+    return "all"
+
+
+def _storefront_products():
+    return Product.storefront()
+
+
+def _build_rows(products_queryset):
+    """Build facet rows for the given products in two queries."""
+    rows = {}
+    for pid, subcategory_id, brand_id, fit_type_id, price in products_queryset.annotate(
+        current_price=Product.current_price()
+    ).values_list("id", "subcategory_id", "brand_id", "fit_type_id", "current_price"):
+        rows[pid] = [subcategory_id, brand_id, fit_type_id, price, set(), set()]
+
+    if rows:
+        variants = ProductVariant.objects.filter(
+            product_id__in=list(rows),
+            is_available=True,
+            stock_quantity__gt=0,
+        ).values_list("product_id", "color_id", "size_id")
+        for pid, color_id, size_id in variants:
+            rows[pid][COLORS].add(color_id)
+            rows[pid][SIZES].add(size_id)
+
+    return {
+        pid: (row[0], row[1], row[2], row[3], frozenset(row[4]), frozenset(row[5]))
+        for pid, row in rows.items()
+    }
+
+
+def _build_labels():
+    """Active facet label objects, keyed by primary key."""
+    return {
+        "brands": {b.pk: b for b in Brand.objects.filter(is_active=True)},
+        "fit_types": {f.pk: f for f in FitType.objects.filter(is_active=True)},
+        "colors": {c.pk: c for c in Color.objects.filter(is_active=True)},
+        "sizes": {s.pk: s for s in Size.objects.filter(is_active=True)},
+        "subcategories": dict(SubCategory.objects.values_list("pk", "slug")),
+    }
+
+
+def build_document(scope):
+    """Compute the facet document for a scope from the database."""
+    products = _storefront_products()
+    if scope.startswith("cat:"):
+        products = products.filter(category_id=int(scope[4:]))
+    elif scope.startswith("sub:"):
+        products = products.filter(subcategory_id=int(scope[4:]))
+    return {"rows": _build_rows(products), "labels": _build_labels()}
+
+
+def get_document(scope):
+    key = _scope_key(scope)
+    document = cache.get(key)
+    if document is None:
+        document = build_document(scope)
+        cache.set(key, document, FACET_CACHE_TIMEOUT)
+    return document
+
+
+def _parse_price(value):
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def _ids_matching(labels, attr, value):
+    value = value.lower()
+    return {
+        pk for pk, obj in labels.items() if str(getattr(obj, attr, "")).lower() == value
+    }
+
+
+def _filter_rows(rows, labels, params):
+    """Apply the same GET filters as ``_filter_and_sort_products``."""
+    subcategory = params.get("subcategory")
+    fit_type = params.get("fit_type")
+    brand = params.get("brand")
+    color = params.get("color")
+    size = params.get("size")
+    min_price = _parse_price(params.get("min_price"))
+    max_price = _parse_price(params.get("max_price"))
+
+    subcategory_ids = (
+        {pk for pk, slug in labels["subcategories"].items() if slug == subcategory}
+        if subcategory
+        else None
+    )
+    fit_type_ids = _ids_matching(labels["fit_types"], "slug", fit_type) if fit_type else None
+    brand_ids = _ids_matching(labels["brands"], "slug", brand) if brand else None
+    color_ids = _ids_matching(labels["colors"], "name", color) if color else None
+    size_ids = _ids_matching(labels["sizes"], "name", size) if size else None
+
+    for row in rows.values():
+        if subcategory_ids is not None and row[SUBCATEGORY] not in subcategory_ids:
+            continue
+        if fit_type_ids is not None and row[FIT_TYPE] not in fit_type_ids:
+            continue
+        if brand_ids is not None and row[BRAND] not in brand_ids:
+            continue
+        if color_ids is not None and not (row[COLORS] & color_ids):
+            continue
+        if size_ids is not None and not (row[SIZES] & size_ids):
+            continue
+        if min_price is not None and row[PRICE] < min_price:
+            continue
+        if max_price is not None and row[PRICE] > max_price:
+            continue
+        yield row
+
+
+def _counted(labels, counts):
+    """Return label objects that occur in ``counts``, annotated and sorted by name."""
+    objects = []
+    for pk, count in counts.items():
+        obj = labels.get(pk)
+        if obj is not None:
+            obj.product_count = count
+            objects.append(obj)
+    return sorted(objects, key=lambda o: o.name)
+
+
+def _bucket_index(price):
+    for index, upper in enumerate(PRICE_BUCKETS):
+        if price < upper:
+            return index
+    return len(PRICE_BUCKETS)
+
+
+def _facets_key(scope, params):
+    filters = "&".join(
+        f"{name}={params[name]}" for name in FILTER_PARAMS if params.get(name)
+    )
+    digest = hashlib.md5(filters.encode()).hexdigest()
+    return f"{_scope_key(scope)}:counts:{digest}"
+
+
+def get_facets(category=None, subcategory=None, params=None):
+    """
+    Return the sidebar facets for a listing.
+
+    The result mirrors the context the views used to build with separate
+    queries: ``fit_types``, ``brands``, ``colors`` and ``sizes`` are lists of
+    model instances (each with a ``product_count`` attribute), ``price_range``
+    has the ``price__min`` / ``price__max`` keys of the old aggregate, and
+    ``price_buckets`` holds per-bucket product counts.
+    """
+    scope = scope_for(category, subcategory)
+    params = params or {}
+    # Keyed under the scope version, so a bump drops the counts as well
+    key = _facets_key(scope, params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = _count_facets(get_document(scope), params)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def _count_facets(document, params):
+    labels = document["labels"]
+
+    brand_counts, fit_type_counts, color_counts, size_counts = {}, {}, {}, {}
+    bucket_counts = [0] * (len(PRICE_BUCKETS) + 1)
+    price_min = price_max = None
+
+    for row in _filter_rows(document["rows"], labels, params):
+        if row[BRAND] is not None:
+            brand_counts[row[BRAND]] = brand_counts.get(row[BRAND], 0) + 1
+        if row[FIT_TYPE] is not None:
+            fit_type_counts[row[FIT_TYPE]] = fit_type_counts.get(row[FIT_TYPE], 0) + 1
+        for color_id in row[COLORS]:
+            color_counts[color_id] = color_counts.get(color_id, 0) + 1
+        for size_id in row[SIZES]:
+            size_counts[size_id] = size_counts.get(size_id, 0) + 1
+
+        price = row[PRICE]
+        bucket_counts[_bucket_index(price)] += 1
+        if price_min is None or price < price_min:
+            price_min = price
+        if price_max is None or price > price_max:
+            price_max = price
+
+    lower_bounds = (Decimal("0"),) + PRICE_BUCKETS
+    price_buckets = [
+        {
+            "min": lower_bounds[index],
+            "max": PRICE_BUCKETS[index] if index < len(PRICE_BUCKETS) else None,
+            "count": count,
+        }
+        for index, count in enumerate(bucket_counts)
+    ]
+
+    return {
+        "fit_types": _counted(labels["fit_types"], fit_type_counts),
+        "brands": _counted(labels["brands"], brand_counts),
+        "colors": _counted(labels["colors"], color_counts),
+        "sizes": _counted(labels["sizes"], size_counts),
+        "price_range": {"price__min": price_min, "price__max": price_max},
+        "price_buckets": price_buckets,
+    }
+
+
+# --- Incremental maintenance (called from shop.signals) ---
+
+
+def invalidate_scopes(*scopes):
+    """Drop the facet documents of ``scopes`` (rebuilt on the next read)."""
+    version = _version()
+    for scope in scopes:
+        version_key = _scope_version_key(version, scope)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, 2, None)
+
+
+def refresh_product(product_id, previous_scopes=()):
+    """
+    Drop the documents of every scope a product belongs to (or used to
+    belong to, for products moved to another category).
+    """
+    placement = (
+        Product.objects.filter(pk=product_id)
+        .values_list("category_id", "subcategory_id")
+        .first()
+    )
+    scopes = set(previous_scopes)
+    scopes.add("all")
+    if placement:
+        scopes.update({f"cat:{placement[0]}", f"sub:{placement[1]}"})
+    invalidate_scopes(*scopes)
+
+
+def refresh_products(product_ids):
+    """``refresh_product`` for many products, e.g. after a bulk update."""
+    scopes = {"all"}
+    for category_id, subcategory_id in Product.objects.filter(
+        pk__in=list(product_ids)
+    ).values_list("category_id", "subcategory_id"):
+        scopes.update({f"cat:{category_id}", f"sub:{subcategory_id}"})
+    invalidate_scopes(*scopes)
+
+
+def discard_product(product_id, category_id=None, subcategory_id=None):
+    """Drop the documents of every scope a deleted product was indexed in."""
+    scopes = {"all"}
+    if category_id:
+        scopes.add(f"cat:{category_id}")
+    if subcategory_id:
+        scopes.add(f"sub:{subcategory_id}")
+    invalidate_scopes(*scopes)
+
+
+def invalidate_all():
+    """Drop every facet document, e.g. after a Brand or Color changes."""
+    try:
+        cache.incr(FACET_VERSION_KEY)
+    except ValueError:
+        cache.set(FACET_VERSION_KEY, 2, None)
@@ -0,0 +1,91 @@
+"""
+Versioned fragment cache for the home page.
+
+Each home page section (product rails, categories, sliders, ads, freelancing
+top lists) is cached on its own under a per-section version number. Model
+signals bump the version of the sections they affect, so a change only
+recomputes the stale section and every other section stays a cache hit.
+
+Sections hold currency- and user-independent data (evaluated model instances
+with their images and stock flag preloaded). Currency, wishlist state and the
+session are applied when the page is rendered, so a cached section is correct
+for every visitor.
+"""
+
+from django.core.cache import cache
+
+FRAGMENT_TIMEOUT = 60 * 60
+# Sections with date-bounded content are also refreshed on a short clock
+SECTION_TIMEOUTS = {"ads": 5 * 60}
+
+PRODUCT_SECTIONS = ("featured", "new_arrivals", "best_sellers", "sale", "recent")
+# Product flag that places a product in each rail ("recent" holds any product)
+SECTION_FLAGS = {
+    "featured": "is_featured",
+    "new_arrivals": "is_new_arrival",
+    "best_sellers": "is_best_seller",
+    "sale": "is_on_sale",
+}
+
+
+def _version_key(section):
+    return f"shop:fragments:{section}:version"
+
+
+def section_versions(sections):
+    """Return ``{section: version}`` in a single cache round trip."""
+    keys = {_version_key(section): section for section in sections}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, section in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = 1
+            cache.add(key, version, None)
+        versions[section] = version
+    return versions
+
+
+def get_sections(builders):
+    """
+    Return ``{section: data}`` for the given ``{section: builder}`` mapping.
+    Up-to-date sections come from one ``get_many``; only stale or missing
+    ones call their builder.
+    """
+    versions = section_versions(builders)
+    keys = {
+        f"shop:fragments:{section}:{version}": section
+        for section, version in versions.items()
+    }
+    cached = cache.get_many(keys)
+
+    sections, fresh = {}, {}
+    for key, section in keys.items():
+        if key in cached:
+            sections[section] = cached[key]
+            continue
+        data = builders[section]()
+        sections[section] = data
+        fresh.setdefault(SECTION_TIMEOUTS.get(section, FRAGMENT_TIMEOUT), {})[key] = data
+
+    for timeout, values in fresh.items():
+        cache.set_many(values, timeout)
+    return sections
+
+
+def bump(*sections):
+    """Invalidate sections by moving them to a new version."""
+    for section in sections:
+        try:
+            cache.incr(_version_key(section))
+        except ValueError:
+            cache.set(_version_key(section), 2, None)
+
+
+def product_sections(product):
+    """Sections a product currently appears in (or could appear in)."""
+    return ["recent"] + [
+        section
+        for section, flag in SECTION_FLAGS.items()
+        if getattr(product, flag, False)
+    ]
@@ -0,0 +1,104 @@
+"""
+Idempotent form submissions.
+
+A double-click or a browser retry on the checkout form used to place the
+order twice. Each submission now carries a key (the ``idempotency_key``
+field rendered into the form, or else a fingerprint of the posted data) and
+the first request to ``claim`` it runs the view; repeats get its recorded
+result (the order number) instead of running the pipeline again:
+
+    key = SubmissionKey.for_request(request, "checkout")
+    result = key.claim()           # None: this request runs the submission
+    try:
+        ...
+        key.complete(order.order_number)
+    finally:
+        if not key.completed:
+            key.release()          # Let a retry run it again
+
+A repeat that arrives while the first request is still running gets
+``PENDING`` straight away rather than holding a worker while it waits.
+Keys are scoped to the user or session and kept in the cache; orders also
+store theirs (Order.idempotency_key) so a duplicate is refused by the
+database even if the cache entry is gone. An anonymous request without a
+session has no owner to scope its key to, so it is not deduplicated.
+"""
+
+import hashlib
+import uuid
+
+from django.core.cache import cache
+
+FORM_FIELD = "idempotency_key"
+# Keys rendered into a form identify that one form
+KEY_TIMEOUT = 60 * 60
+# Fingerprints of the posted data only catch quick repeats, so the same
+# purchase made deliberately later still goes through
+FINGERPRINT_TIMEOUT = 30
+# Bounds how long a crashed request keeps its key claimed
+PENDING_TIMEOUT = 60
+PENDING = "pending"
+
+
+def new_key():
+    """A fresh key for a form to submit in its ``idempotency_key`` field."""
+    return uuid.uuid4().hex
+
+
+class SubmissionKey:
+    def __init__(self, key, timeout):
+        self.key = key
+        self.timeout = timeout
+        self.completed = False
+
+    @classmethod
+    def for_request(cls, request, scope):
+        """
+        Return the key of the request's submission, or ``None`` for an
+        anonymous request without a session: its key would be shared with
+        every other such visitor, so it is not deduplicated.
+        """
+        if request.user.is_authenticated:
+            owner = f"user:{request.user.pk}"
+        elif request.session.session_key:
+            owner = f"session:{request.session.session_key}"
+        else:
+            return None
+        token = request.POST.get(FORM_FIELD)
+        timeout = KEY_TIMEOUT
+        if not token:
+            posted = sorted(
+                (name, request.POST.getlist(name))
+                for name in request.POST
+                if name != "csrfmiddlewaretoken"
+            )
+            token = repr(posted)
+            timeout = FINGERPRINT_TIMEOUT
+        digest = hashlib.sha256(f"{scope}:{owner}:{token}".encode()).hexdigest()
+        return cls(digest, timeout)
+
+    @property
+    def cache_key(self):
+        return f"shop:idempotency:{self.key}"
+
+    def claim(self):
+        """
+        Claim the key for this request: returns ``None`` if this request
+        should run the submission, else the result recorded by the request
+        that did (``PENDING`` while it is still running).
+        """
+        if cache.add(self.cache_key, PENDING, PENDING_TIMEOUT):
+            return None
+        result = cache.get(self.cache_key)
+        if result is None:
+            # Released or expired since the add; try once more
+            return None if cache.add(self.cache_key, PENDING, PENDING_TIMEOUT) else PENDING
+        return result
+
+    def complete(self, result):
+        self.completed = True
+        cache.set(self.cache_key, result, self.timeout)
+
+    def release(self):
+        """Let a retry run the submission again (e.g. after it failed)."""
+        cache.delete(self.cache_key)
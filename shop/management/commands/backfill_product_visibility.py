@@ -0,0 +1,43 @@
+"""
+Recompute Product.is_visible (hides test/dummy/sample products from the
+storefront) for the whole catalog, e.g. after the demo markers in
+Product.DEMO_* change. Migration 0008 did this once for existing products;
+saves keep the flag current since.
+
+Only products whose flag changes are written, and their search, facet,
+typeahead and page caches are refreshed, since the bulk update skips the
+Product signals.
+
+Usage:
+    python manage.py backfill_product_visibility
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import Product
+from shop.signals import refresh_product_indexes
+
+
+class Command(BaseCommand):
+    help = "Recompute the storefront visibility flag of every product."
+
+    def handle(self, *args, **options):
+        demo = Product.demo_filter()
+        with transaction.atomic():
+            hide = list(
+                Product.objects.filter(demo, is_visible=True).values_list("pk", flat=True)
+            )
+            show = list(
+                Product.objects.exclude(demo)
+                .filter(is_visible=False)
+                .values_list("pk", flat=True)
+            )
+            Product.objects.filter(pk__in=hide).update(is_visible=False)
+            Product.objects.filter(pk__in=show).update(is_visible=True)
+        refresh_product_indexes(hide + show)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Product visibility updated: {len(show)} shown, {len(hide)} hidden."
+            )
+        )
@@ -0,0 +1,56 @@
+"""
+Recompute the precomputed "related products" lists shown on the product page
+(see shop.related_products).
+
+Usage:
+    python manage.py compute_related_products              # Whole catalog
+    python manage.py compute_related_products --product 12 --product 15
+    python manage.py compute_related_products --limit 12   # Top 12 per product
+
+Run it periodically, e.g. nightly from cron:
+    30 3 * * * cd /path/to/mnory && python manage.py compute_related_products
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import product_documents
+from shop.models import Product
+from shop.related_products import RELATED_PRODUCTS_LIMIT, compute_related
+
+
+class Command(BaseCommand):
+    help = "Precompute the top-N related products of every storefront product."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            action="append",
+            type=int,
+            dest="products",
+            help="Only recompute this product id (may be repeated)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=RELATED_PRODUCTS_LIMIT,
+            help=f"Related products kept per product (default {RELATED_PRODUCTS_LIMIT})",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        product_ids = options["products"]
+        updated = compute_related(product_ids, limit=options["limit"])
+
+        # Cached product pages pick up the new lists on their next build
+        if product_ids is None:
+            product_ids = Product.objects.values_list("pk", flat=True)
+        product_documents.invalidate_many(list(product_ids))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Related products computed for {updated} products "
+                f"in {time.monotonic() - started:.1f}s."
+            )
+        )
@@ -0,0 +1,35 @@
+"""
+Delete visitor sessions that have been inactive for a while. The admin
+dashboard counts visitors from daily sketches (see shop.visitor_analytics),
+so old VisitorSession rows are no longer needed for its numbers. Day
+sketches older than the longest dashboard window are pruned too.
+
+Usage:
+    python manage.py prune_visitor_sessions             # Inactive for 90 days
+    python manage.py prune_visitor_sessions --days 30
+
+Cron example (daily at 3 AM):
+    0 3 * * * cd /path/to/project && python manage.py prune_visitor_sessions
+"""
+
+from django.core.management.base import BaseCommand
+
+from shop.visitor_analytics import prune
+
+
+class Command(BaseCommand):
+    help = "Delete visitor sessions inactive for the given number of days."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=90,
+            help="Delete sessions inactive for this many days (default: 90)",
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune(options["days"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} inactive visitor sessions.")
+        )
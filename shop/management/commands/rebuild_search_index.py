@@ -0,0 +1,23 @@
+"""
+Rebuild the product search index from scratch.
+
+Usage:
+    python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand
+
+from shop.models import ProductSearchToken
+from shop.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index for all storefront products."
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE("Rebuilding product search index..."))
+        get_backend().rebuild()
+        products = ProductSearchToken.objects.values("product_id").distinct().count()
+        self.stdout.write(
+            self.style.SUCCESS(f"Search index rebuilt: {products} products indexed.")
+        )
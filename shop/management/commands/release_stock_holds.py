@@ -0,0 +1,38 @@
+"""
+Release expired checkout stock holds (see shop.reservations) so their stock
+can be sold again. Expired holds that block a new hold are also released on
+demand, so this only needs to run every few minutes.
+
+Usage:
+    python manage.py release_stock_holds            # Release expired holds
+    python manage.py release_stock_holds --repair   # Also recount reserved stock
+
+Cron example (every 5 minutes):
+    */5 * * * * cd /path/to/project && python manage.py release_stock_holds
+"""
+
+from django.core.management.base import BaseCommand
+
+from shop.reservations import repair_counters, sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Release expired checkout stock holds."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Recompute the reserved stock of every variant from its holds",
+        )
+
+    def handle(self, *args, **options):
+        released = sweep_expired()
+        self.stdout.write(
+            self.style.SUCCESS(f"Released expired holds on {released} variants.")
+        )
+        if options["repair"]:
+            repaired = repair_counters()
+            self.stdout.write(
+                self.style.SUCCESS(f"Reserved stock repaired on {repaired} variants.")
+            )
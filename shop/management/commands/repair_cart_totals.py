@@ -0,0 +1,36 @@
+"""
+Verify the incrementally maintained cart totals against the cart items and
+repair carts whose totals drifted (see Cart.repair_totals).
+
+Usage:
+    python manage.py repair_cart_totals            # All carts
+    python manage.py repair_cart_totals --days 7   # Carts changed in the last week
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Verify and repair the stored totals of shopping carts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Only check carts updated in the last N days",
+        )
+
+    def handle(self, *args, **options):
+        carts = Cart.objects.all()
+        if options["days"]:
+            since = timezone.now() - timedelta(days=options["days"])
+            carts = carts.filter(updated_at__gte=since)
+        repaired = Cart.repair_totals(carts)
+        self.stdout.write(
+            self.style.SUCCESS(f"Cart totals verified: {repaired} carts repaired.")
+        )
@@ -6,7 +6,7 @@ from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
 from django.utils.translation import gettext as _
 from django.utils import timezone
-from .models import VisitorSession
+from . import visitor_tracking
 
 
 class AdminAccessMiddleware(MiddlewareMixin):
@@ -153,48 +153,30 @@ class LoginRedirectMiddleware(MiddlewareMixin):
 
 
 class VisitorTrackingMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        import time
-        from django.db import OperationalError
+    """
+    Record each page view's visitor session. The write happens later, in
+    batches (see shop.visitor_tracking), so requests never wait on it.
+    """
 
+    def process_request(self, request):
         path = request.path
         if path.startswith("/static/") or path.startswith("/media/") or path.startswith("/admin/"):
             return None
 
+        user_agent = request.META.get("HTTP_USER_AGENT", "")[:512]
+        # Crawlers and health checks would each start a session of their own
+        if visitor_tracking.is_bot(user_agent):
+            return None
+
         session = request.session
         if not session.session_key:
             session.save()
-        session_key = session.session_key
-
-        ip_address = request.META.get("REMOTE_ADDR")
-        user_agent = request.META.get("HTTP_USER_AGENT", "")[:512]
-
-        # Retry logic for database locks
-        max_retries = 3
-        retry_delay = 0.1  # Start with 100ms
-
-        for attempt in range(max_retries):
-            try:
-                VisitorSession.objects.update_or_create(
-                    session_key=session_key,
-                    defaults={
-                        "user": request.user if request.user.is_authenticated else None,
-                        "ip_address": ip_address,
-                        "user_agent": user_agent,
-                        "last_activity": timezone.now(),
-                    },
-                )
-                break  # Success, exit retry loop
-            except OperationalError as e:
-                if "database is locked" in str(e) and attempt < max_retries - 1:
-                    # Wait with exponential backoff before retrying
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Double the delay for next retry
-                else:
-                    # Last attempt failed or different error, log and continue
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Failed to update visitor session: {str(e)}")
-                    break
 
+        visitor_tracking.record(
+            session.session_key,
+            request.user.pk if request.user.is_authenticated else None,
+            request.META.get("REMOTE_ADDR"),
+            user_agent,
+            timezone.now(),
+        )
         return None
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_payment_transaction_photo_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='shop.product')),
+            ],
+            options={
+                'verbose_name': 'Product Search Token',
+                'verbose_name_plural': 'Product Search Tokens',
+                'indexes': [models.Index(fields=['token', 'product'], name='shop_produc_token_62e102_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+# Product.is_demo as of this migration; frozen so later changes to the
+# rules do not change what this migration does
+DEMO_NAME_PREFIXES = ("test", "dummy")
+DEMO_NAME_MARKERS = ("test product", "dummy product", "sample product")
+DEMO_DESCRIPTION_MARKERS = ("this is a test", "dummy description", "sample description")
+
+
+def backfill_visibility(apps, schema_editor):
+    """Hide the existing test/dummy/sample products."""
+    Product = apps.get_model("shop", "Product")
+    demo = models.Q()
+    for prefix in DEMO_NAME_PREFIXES:
+        demo |= models.Q(name__istartswith=prefix)
+    for marker in DEMO_NAME_MARKERS:
+        demo |= models.Q(name__icontains=marker)
+    for marker in DEMO_DESCRIPTION_MARKERS:
+        demo |= models.Q(description__icontains=marker)
+    Product.objects.filter(demo).update(is_visible=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_productsearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_visible',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_available', 'is_visible', 'created_at'], name='shop_produc_is_acti_f13c5b_idx'),
+        ),
+        migrations.RunPython(backfill_visibility, migrations.RunPython.noop),
+    ]
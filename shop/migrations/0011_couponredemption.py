@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_redemptions(apps, schema_editor):
+    """Record the coupon uses of existing orders."""
+    Order = apps.get_model("shop", "Order")
+    CouponRedemption = apps.get_model("shop", "CouponRedemption")
+    uses = {}
+    redemptions = []
+    for order_id, coupon_id, user_id in (
+        Order.objects.filter(coupon__isnull=False)
+        .order_by("created_at", "pk")
+        .values_list("pk", "coupon_id", "user_id")
+    ):
+        use_number = 1
+        if user_id is not None:
+            use_number = uses[coupon_id, user_id] = uses.get((coupon_id, user_id), 0) + 1
+        redemptions.append(
+            CouponRedemption(
+                coupon_id=coupon_id,
+                user_id=user_id,
+                order_id=order_id,
+                use_number=use_number,
+            )
+        )
+    CouponRedemption.objects.bulk_create(redemptions, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('use_number', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='shop.coupon')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemption', to='shop.order')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Coupon Redemption',
+                'verbose_name_plural': 'Coupon Redemptions',
+                'constraints': [models.UniqueConstraint(fields=('coupon', 'user', 'use_number'), name='unique_coupon_use_per_user')],
+            },
+        ),
+        migrations.RunPython(backfill_redemptions, migrations.RunPython.noop),
+    ]
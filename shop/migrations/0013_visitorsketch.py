@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:09
+
+import hashlib
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# The sketch layout of shop.visitor_analytics as of this migration; frozen
+# so the stored registers stay readable whatever that module becomes
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+
+
+class HyperLogLog:
+    def __init__(self):
+        self.registers = bytearray(REGISTERS)
+
+    def add(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+        h = int.from_bytes(digest, "big")
+        index = h >> (64 - PRECISION)
+        rest = h & ((1 << (64 - PRECISION)) - 1)
+        rank = (64 - PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+
+def backfill_sketches(apps, schema_editor):
+    """Count existing visitor sessions on the day they were created."""
+    VisitorSession = apps.get_model("shop", "VisitorSession")
+    VisitorSketch = apps.get_model("shop", "VisitorSketch")
+    sketches = {"all": HyperLogLog()}
+    for session_key, created_at in VisitorSession.objects.values_list(
+        "session_key", "created_at"
+    ).iterator():
+        day = timezone.localdate(created_at).isoformat()
+        sketches.setdefault(day, HyperLogLog()).add(session_key)
+        sketches["all"].add(session_key)
+    VisitorSketch.objects.bulk_create(
+        [
+            VisitorSketch(period=period, registers=bytes(hll.registers))
+            for period, hll in sketches.items()
+        ],
+        batch_size=100,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=10, unique=True)),
+                ('registers', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Visitor Sketch',
+                'verbose_name_plural': 'Visitor Sketches',
+            },
+        ),
+        migrations.AlterField(
+            model_name='visitorsession',
+            name='last_activity',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
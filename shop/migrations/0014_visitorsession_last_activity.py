@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_visitorsketch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visitorsession',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,13 +1,15 @@
 # shop/models.py
 
 from django.db import models
-from django.db.models import Q
+from django.db.models import F, Q
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 from django.conf import settings  # Import settings to get AUTH_USER_MODEL
 from django.db.models import Avg
+from django.db.models.functions import Now
 from django.contrib.auth.models import AbstractUser
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill
@@ -313,6 +315,8 @@ class Product(models.Model):
     )  # This might become less relevant with variants
     is_active = models.BooleanField(default=True)
     is_available = models.BooleanField(default=True)
+    # False for test/dummy/sample catalog entries; computed in save()
+    is_visible = models.BooleanField(default=True, editable=False)
 
     # SEO fields
     meta_title = models.CharField(max_length=200, blank=True)
@@ -401,15 +405,72 @@ class Product(models.Model):
             models.Index(fields=["slug"]),
             models.Index(fields=["category", "subcategory"]),
             models.Index(fields=["is_active", "is_available"]),
+            models.Index(
+                fields=["is_active", "is_available", "is_visible", "created_at"]
+            ),
         ]
 
     def __str__(self):
         return self.name
 
+    # Markers of placeholder products that must never reach the storefront
+    DEMO_NAME_PREFIXES = ("test", "dummy")
+    DEMO_NAME_MARKERS = ("test product", "dummy product", "sample product")
+    DEMO_DESCRIPTION_MARKERS = (
+        "this is a test",
+        "dummy description",
+        "sample description",
+    )
+
+    @property
+    def is_demo(self):
+        """Whether the name or description marks this as a test/dummy product."""
+        name = (self.name or "").lower()
+        description = (self.description or "").lower()
+        return (
+            name.startswith(self.DEMO_NAME_PREFIXES)
+            or any(marker in name for marker in self.DEMO_NAME_MARKERS)
+            or any(marker in description for marker in self.DEMO_DESCRIPTION_MARKERS)
+        )
+
+    # The products shoppers see: listings, search, facets, autocomplete
+    STOREFRONT_FILTER = {"is_active": True, "is_available": True, "is_visible": True}
+
+    @classmethod
+    def storefront(cls):
+        """Products shown on the storefront (see STOREFRONT_FILTER)."""
+        return cls.objects.filter(**cls.STOREFRONT_FILTER)
+
+    @classmethod
+    def demo_filter(cls):
+        """The ``is_demo`` rules as a Q object, for bulk backfills."""
+        query = models.Q()
+        for prefix in cls.DEMO_NAME_PREFIXES:
+            query |= models.Q(name__istartswith=prefix)
+        for marker in cls.DEMO_NAME_MARKERS:
+            query |= models.Q(name__icontains=marker)
+        for marker in cls.DEMO_DESCRIPTION_MARKERS:
+            query |= models.Q(description__icontains=marker)
+        return query
+
+    @classmethod
+    def current_price(cls):
+        """``get_price`` (the sale price while on sale) as a query expression."""
+        return models.Case(
+            models.When(is_on_sale=True, sale_price__gt=0, then=models.F("sale_price")),
+            default=models.F("price"),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
 
+        self.is_visible = not self.is_demo
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"name", "description"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"is_visible"}
+
         # Automatically set is_on_sale
         if self.sale_price and self.sale_price < self.price:
             self.is_on_sale = True
@@ -439,15 +500,34 @@ class Product(models.Model):
     @property
     def is_in_stock(self):
         """Return if total stock is above 0 from any variant"""
-        return self.variants.filter(stock_quantity__gt=0, is_available=True).exists()
+        if "has_stock" in self.__dict__:
+            # Annotated / preloaded by shop.product_cards
+            return self.has_stock
+        return self.variants.filter(
+            stock_quantity__gt=F("reserved_quantity"), is_available=True
+        ).exists()
+
+    def _prefetched_images(self):
+        """Return the prefetched images list, or None if not prefetched."""
+        return getattr(self, "_prefetched_objects_cache", {}).get("images")
 
     def get_main_image(self):
         """Return the main image or fallback to first image"""
+        images = self._prefetched_images()
+        if images is not None:
+            images = list(images)
+            main_image = next((image for image in images if image.is_main), None)
+            return main_image or (images[0] if images else None)
         main_image = self.images.filter(is_main=True).first()
         return main_image or self.images.first()
 
     def get_hover_image(self):
         """Return the hover image or fallback to first image"""
+        images = self._prefetched_images()
+        if images is not None:
+            images = list(images)
+            hover_image = next((image for image in images if image.is_hover), None)
+            return hover_image or (images[0] if images else None)
         hover_image = self.images.filter(is_hover=True).first()
         return hover_image or self.images.first()
 
@@ -456,7 +536,7 @@ class Product(models.Model):
         return Color.objects.filter(
             is_active=True,
             productvariant__product=self,
-            productvariant__stock_quantity__gt=0,
+            productvariant__stock_quantity__gt=F("productvariant__reserved_quantity"),
             productvariant__is_available=True,
         ).distinct()
 
@@ -468,7 +548,7 @@ class Product(models.Model):
         filters = (
             Q(is_active=True)
             & Q(productvariant__product=self)
-            & Q(productvariant__stock_quantity__gt=0)
+            & Q(productvariant__stock_quantity__gt=F("productvariant__reserved_quantity"))
             & Q(productvariant__is_available=True)
         )
 
@@ -604,6 +684,8 @@ class ProductVariant(models.Model):
     size = models.ForeignKey(Size, on_delete=models.CASCADE)
     sku = models.CharField(max_length=100, unique=True, blank=True)
     stock_quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Stock held for shoppers at checkout (see shop.reservations)
+    reserved_quantity = models.PositiveIntegerField(default=0, editable=False)
     price_adjustment = models.DecimalField(
         max_digits=10, decimal_places=2, default=0.00
     )
@@ -622,6 +704,11 @@ class ProductVariant(models.Model):
         base_price = self.product.get_price
         return base_price + self.price_adjustment
 
+    @property
+    def available_quantity(self):
+        """Stock not held for other shoppers' checkouts"""
+        return max(self.stock_quantity - self.reserved_quantity, 0)
+
     def save(self, *args, **kwargs):
         if not self.sku:
             self.sku = f"{self.product.slug}-{self.color.name.lower()}-{self.size.name.lower()}".replace(
@@ -630,6 +717,56 @@ class ProductVariant(models.Model):
         super().save(*args, **kwargs)
 
 
+class ProductSearchToken(models.Model):
+    """
+    Inverted index entry for product search: one row per (token, product)
+    with a relevance weight. Maintained by shop.search.
+    """
+
+    token = models.CharField(max_length=64)
+    product = models.ForeignKey(
+        Product, related_name="search_tokens", on_delete=models.CASCADE
+    )
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Product Search Token"
+        verbose_name_plural = "Product Search Tokens"
+        indexes = [
+            models.Index(fields=["token", "product"]),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.product_id} ({self.weight})"
+
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed "related products" list: the top-N products for ``product``
+    in ``rank`` order. Rebuilt by the compute_related_products command.
+    """
+
+    product = models.ForeignKey(
+        Product, related_name="related_entries", on_delete=models.CASCADE
+    )
+    related = models.ForeignKey(Product, related_name="+", on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Related Product"
+        verbose_name_plural = "Related Products"
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "rank"], name="unique_related_product_rank"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
 # --- Cart Models ---
 class Cart(models.Model):
     session_key = models.CharField(
@@ -657,30 +794,113 @@ class Cart(models.Model):
 
     @property
     def total_items(self):
-        return (
-            self.items.aggregate(total_quantity=models.Sum("quantity"))[
-                "total_quantity"
-            ]
-            or 0
-        )
+        return self.total_items_field
 
     @property
     def total_price(self):
-        return sum(item.get_total_price() for item in self.items.all())
+        return self.total_price_field
+
+    def add(self, variant, quantity):
+        """Add ``quantity`` of ``variant``; returns the new line quantity."""
+        item, created = self.items.get_or_create(
+            product_variant=variant, defaults={"quantity": quantity}
+        )
+        if not created:
+            item.quantity += quantity
+            item.save()
+        return item.quantity
+
+    def apply_delta(self, quantity, price):
+        """
+        Adjust the stored totals by ``quantity`` items and ``price`` in O(1).
+        Called by CartItem whenever an item is added, requantified or removed.
+        """
+        if not quantity and not price:
+            return
+        Cart.objects.filter(pk=self.pk).update(
+            total_items_field=models.F("total_items_field") + quantity,
+            total_price_field=models.F("total_price_field") + price,
+            updated_at=Now(),
+        )
+        self.total_items_field += quantity
+        self.total_price_field += price
+
+    @staticmethod
+    def _line_total():
+        """SQL expression for ``CartItem.get_total_price()``."""
+        product = "product_variant__product__"
+        unit_price = models.Case(
+            models.When(
+                **{f"{product}is_on_sale": True, f"{product}sale_price__gt": 0},
+                then=models.F(f"{product}sale_price"),
+            ),
+            default=models.F(f"{product}price"),
+        ) + models.F("product_variant__price_adjustment")
+        return models.ExpressionWrapper(
+            models.F("quantity") * unit_price,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
 
     def update_totals(self):
-        total_quantity = (
-            self.items.aggregate(total_quantity=models.Sum("quantity"))[
-                "total_quantity"
-            ]
-            or 0
+        """
+        Verify the stored totals against the cart items with one aggregate
+        query and repair them if they drifted (e.g. after a price change).
+        """
+        totals = self.items.aggregate(
+            total_quantity=models.Sum("quantity"),
+            total_price=models.Sum(self._line_total()),
         )
-        total_price = sum(item.get_total_price() for item in self.items.all())
-        self.total_items_field = total_quantity
-        self.total_price_field = total_price
-        self.save()
+        total_quantity = totals["total_quantity"] or 0
+        total_price = Decimal(totals["total_price"] or 0).quantize(Decimal("0.01"))
+        if (total_quantity, total_price) != (
+            self.total_items_field,
+            self.total_price_field,
+        ):
+            self.total_items_field = total_quantity
+            self.total_price_field = total_price
+            self.save(
+                update_fields=["total_items_field", "total_price_field", "updated_at"]
+            )
         return total_quantity, total_price
 
+    @classmethod
+    def repair_totals(cls, carts=None):
+        """
+        Verify and repair the totals of many carts (all by default) with one
+        grouped query. Returns the number of carts that had drifted.
+        """
+        carts = cls.objects.all() if carts is None else carts
+        actual = {
+            row["cart_id"]: (
+                row["total_quantity"],
+                Decimal(row["total_price"] or 0).quantize(Decimal("0.01")),
+            )
+            for row in CartItem.objects.filter(cart__in=carts)
+            .values("cart_id")
+            .annotate(
+                total_quantity=models.Sum("quantity"),
+                total_price=models.Sum(cls._line_total()),
+            )
+            .order_by()
+        }
+        drifted = []
+        for cart in carts.only("pk", "total_items_field", "total_price_field"):
+            totals = actual.get(cart.pk, (0, Decimal("0.00")))
+            if totals != (cart.total_items_field, cart.total_price_field):
+                cart.total_items_field, cart.total_price_field = totals
+                drifted.append(cart)
+        cls.objects.bulk_update(
+            drifted, ["total_items_field", "total_price_field"], batch_size=500
+        )
+        return len(drifted)
+
+    def clear(self):
+        """Remove every item and reset the totals."""
+        self.items.all().delete()
+        self.total_items_field = 0
+        self.total_price_field = Decimal("0.00")
+        self.save(update_fields=["total_items_field", "total_price_field", "updated_at"])
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name="items", on_delete=models.CASCADE)
@@ -696,13 +916,67 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product_variant.product.name} ({self.product_variant.color.name}, {self.product_variant.size.name})"
 
+    # Quantity as last loaded from / written to the database, so saves and
+    # deletes can apply the difference to the cart totals
+    _saved_quantity = 0
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_quantity = instance.__dict__.get("quantity", 0)
+        return instance
+
+    def get_unit_price(self):
+        return self.product_variant.get_price
+
     def get_total_price(self):
-        price = (
-            self.product_variant.get_price()
-            if callable(getattr(self.product_variant, "get_price", None))
-            else self.product_variant.get_price
-        )
-        return self.quantity * price
+        return self.quantity * self.get_unit_price()
+
+    def _cart_for_delta(self):
+        # Update the cart instance the caller holds (if loaded) in memory too
+        if CartItem.cart.is_cached(self):
+            return self.cart
+        return Cart(pk=self.cart_id, total_items_field=0, total_price_field=Decimal("0"))
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        delta = self.quantity - self._saved_quantity
+        self._saved_quantity = self.quantity
+        if delta:
+            self._cart_for_delta().apply_delta(delta, delta * self.get_unit_price())
+
+    def delete(self, *args, **kwargs):
+        quantity, cart = self._saved_quantity, self._cart_for_delta()
+        unit_price = self.get_unit_price() if quantity else Decimal("0")
+        result = super().delete(*args, **kwargs)
+        self._saved_quantity = 0
+        cart.apply_delta(-quantity, -quantity * unit_price)
+        return result
+
+
+class StockReservation(models.Model):
+    """
+    A short-lived hold on variant stock for a cart at checkout; the held
+    quantity is counted in ProductVariant.reserved_quantity until the hold is
+    converted by an order or released. Maintained by shop.reservations.
+    """
+
+    cart = models.ForeignKey(
+        Cart, related_name="reservations", on_delete=models.CASCADE
+    )
+    product_variant = models.ForeignKey(
+        ProductVariant, related_name="reservations", on_delete=models.CASCADE
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Stock Reservation"
+        verbose_name_plural = "Stock Reservations"
+        unique_together = ("cart", "product_variant")
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_variant_id} for cart {self.cart_id}"
 
 
 # --- Wishlist Models ---
@@ -841,6 +1115,11 @@ class Order(models.Model):
     # Stripe Payment Intent ID (for processing payments)
     stripe_pid = models.CharField(max_length=255, null=True, blank=True)
 
+    # Key of the checkout submission that placed the order (shop.idempotency)
+    idempotency_key = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
+
     # Coupon related fields
     coupon = models.ForeignKey(
         "Coupon",
@@ -964,6 +1243,17 @@ class ShippingAddress(models.Model):
             ).update(is_default=False)
         super().save(*args, **kwargs)
 
+    def copy_for_order(self):
+        """An unsaved copy of a saved address, to be attached to an order."""
+        return ShippingAddress(
+            full_name=self.full_name,
+            email=self.email,
+            address_line1=self.address_line1,
+            address_line2=self.address_line2,
+            city=self.city,
+            phone_number=self.phone_number,
+        )
+
 
 class Payment(models.Model):
     PAYMENT_METHOD_CHOICES = [
@@ -1194,8 +1484,12 @@ class VendorOrder(models.Model):
     def __str__(self):
         return f"{self.vendor.store_name}'s part of Order #{self.order.order_number}"
 
-    def save(self, *args, **kwargs):
+    def calculate_net_payout(self):
         self.net_payout = self.subtotal + self.shipping_charged - self.commission_amount
+        return self.net_payout
+
+    def save(self, *args, **kwargs):
+        self.calculate_net_payout()
         super().save(*args, **kwargs)
 
 
@@ -1482,7 +1776,9 @@ class VisitorSession(models.Model):
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    last_activity = models.DateTimeField(auto_now=True)
+    # Set from the visit, not the write: visits are written in batches
+    # (shop.visitor_tracking)
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         ordering = ["-last_activity"]
@@ -1553,3 +1849,61 @@ class Coupon(models.Model):
         """Check if the coupon is currently valid."""
         now = timezone.now()
         return self.is_active and self.valid_from <= now and self.valid_to >= now
+
+
+class CouponRedemption(models.Model):
+    """
+    One use of a coupon by an order. ``use_number`` counts the customer's
+    uses of the coupon, so the unique constraint caps concurrent redemptions
+    at ``max_uses_per_user``. Written by shop.coupons.
+    """
+
+    coupon = models.ForeignKey(
+        Coupon, on_delete=models.CASCADE, related_name="redemptions"
+    )
+    user = models.ForeignKey(
+        MnoryUser,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="coupon_redemptions",
+    )
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, related_name="coupon_redemption"
+    )
+    use_number = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Coupon Redemption")
+        verbose_name_plural = _("Coupon Redemptions")
+        constraints = [
+            # Guest redemptions have no user and never collide (NULLs differ)
+            models.UniqueConstraint(
+                fields=["coupon", "user", "use_number"],
+                name="unique_coupon_use_per_user",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.coupon} used by order {self.order_id}"
+
+
+class VisitorSketch(models.Model):
+    """
+    HyperLogLog registers counting the unique visitor sessions of one day,
+    or of all time (see shop.visitor_analytics).
+    """
+
+    ALL_TIME = "all"
+
+    period = models.CharField(max_length=10, unique=True)  # ISO day or ALL_TIME
+    registers = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Visitor Sketch")
+        verbose_name_plural = _("Visitor Sketches")
+
+    def __str__(self):
+        return f"Visitors {self.period}"
@@ -0,0 +1,95 @@
+"""
+The header's notification feed.
+
+Notifications live in two tables (shop.Notification and
+freelancing.Notification) but the header shows them as one feed: the ten
+newest and the unread count. Both are kept per user in the cache and read
+together in one round trip (``get_feed``), so rendering the header does
+not query either table.
+
+The notification signals of both apps keep the feed current:
+
+    created         the unread counter is incremented in place (cache.incr)
+                    and the cached newest list dropped
+    updated/deleted both entries dropped
+
+They are rebuilt on the next read with one top-N query and one COUNT per
+app. Bulk updates skip the signals, so code marking many notifications
+read calls ``invalidate`` itself.
+"""
+
+import heapq
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import transaction
+
+FEED_SIZE = 10
+FEED_CACHE_TIMEOUT = 60 * 60
+
+
+def _recent_key(user_id):
+    return f"shop:notification_feed:{user_id}:recent"
+
+
+def _unread_key(user_id):
+    return f"shop:notification_feed:{user_id}:unread"
+
+
+def _sources(user):
+    return (user.shop_notifications.all(), user.freelancing_notifications.all())
+
+
+def _load_recent(user):
+    latest = [
+        notifications.order_by("-created_at")[:FEED_SIZE]
+        for notifications in _sources(user)
+    ]
+    return list(
+        islice(heapq.merge(*latest, key=lambda n: n.created_at, reverse=True), FEED_SIZE)
+    )
+
+
+def _load_unread(user):
+    return sum(
+        notifications.filter(is_read=False).count() for notifications in _sources(user)
+    )
+
+
+def get_feed(user):
+    """Return ``(newest notifications, unread count)`` for ``user``."""
+    recent_key, unread_key = _recent_key(user.pk), _unread_key(user.pk)
+    found = cache.get_many([recent_key, unread_key])
+    recent, unread = found.get(recent_key), found.get(unread_key)
+    if recent is None:
+        recent = _load_recent(user)
+        cache.set(recent_key, recent, FEED_CACHE_TIMEOUT)
+    if unread is None:
+        unread = _load_unread(user)
+        cache.add(unread_key, unread, FEED_CACHE_TIMEOUT)
+    return recent, unread
+
+
+def invalidate(user_id):
+    cache.delete_many([_recent_key(user_id), _unread_key(user_id)])
+
+
+def _created(notification):
+    cache.delete(_recent_key(notification.user_id))
+    if not notification.is_read:
+        try:
+            cache.incr(_unread_key(notification.user_id))
+        except ValueError:
+            pass  # Not cached; counted when next read
+
+
+def notification_saved(notification, created):
+    """Signal handler helper for both apps' Notification post_save."""
+    if created:
+        transaction.on_commit(lambda: _created(notification))
+    else:
+        transaction.on_commit(lambda: invalidate(notification.user_id))
+
+
+def notification_deleted(notification):
+    transaction.on_commit(lambda: invalidate(notification.user_id))
@@ -0,0 +1,288 @@
+"""
+Keyset (cursor) pagination for listings.
+
+Django's ``Paginator`` runs a COUNT(*) over the whole filtered queryset and
+fetches page N with ``OFFSET (N - 1) * per_page``, so every page pays for the
+count and deep pages scan everything before them. ``CursorPaginator`` instead
+continues from the sort key of the last row shown:
+
+    WHERE (price, id) > (:last_price, :last_id) ORDER BY price, id LIMIT n + 1
+
+which costs the same on page 1 and page 1000. Cursors are opaque signed
+tokens carrying the boundary row's sort values; the total is optional and,
+when requested, an approximate (cached) count.
+
+``paginate()`` is the entry point used by the views. Legacy ``?page=N`` links
+keep working through the regular ``Paginator``, which also serves orderings
+a keyset cannot follow (nullable or relation fields).
+"""
+
+import datetime
+import hashlib
+from decimal import Decimal
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SALT = "shop.pagination.cursor"
+APPROXIMATE_COUNT_TIMEOUT = 5 * 60
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class UnsupportedOrdering(ValueError):
+    """The ordering cannot be paginated by keyset (see ``_resolve_field``)."""
+
+
+def _resolve_field(model, path, annotations=None):
+    """
+    Return the model field at the end of a ``related__field`` path, or the
+    output field of an annotation. Raises UnsupportedOrdering for paths that
+    reach NULL values (which compare as unknown, so the keyset condition
+    would skip their rows) and for paths ending on a relation (ordered by the
+    related model's Meta.ordering, not by the id a cursor would store).
+    """
+    if annotations and path in annotations:
+        field = annotations[path].output_field
+        if field.null:
+            raise UnsupportedOrdering(f"Cannot paginate by the nullable {path!r}")
+        return field
+    field = None
+    for name in path.split("__"):
+        field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+        if field.null or field.many_to_many or field.one_to_many:
+            raise UnsupportedOrdering(f"Cannot paginate by the nullable {path!r}")
+        if field.is_relation:
+            model = field.related_model
+    if field.is_relation:
+        raise UnsupportedOrdering(f"Cannot paginate by the relation {path!r}")
+    return field
+
+
+def _value_of(obj, path):
+    for name in path.split("__"):
+        if obj is None:
+            return None
+        obj = obj.pk if name == "pk" else getattr(obj, name)
+    if hasattr(obj, "_meta"):  # ordering by a foreign key orders by its id
+        obj = obj.pk
+    return obj
+
+
+class CursorPage:
+    """The subset of ``django.core.paginator.Page`` the templates use."""
+
+    cursor_mode = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Query strings for the next / previous links, set by paginate()
+        self.next_query = self.previous_query = ""
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset by keyset on its ordering.
+
+    ``ordering`` defaults to the queryset's ``order_by()`` (or the model's
+    ``Meta.ordering``); the primary key is appended as a tie-breaker so the
+    order is total. Raises UnsupportedOrdering when the ordering includes
+    a nullable field or a relation. ``count`` is ``None`` (no total), ``"approximate"``
+    (cached for a few minutes) or ``"exact"``.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None, count="approximate"):
+        ordering = list(
+            ordering or queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if not any(field.lstrip("-") in ("pk", "id") for field in ordering):
+            descending = bool(ordering) and ordering[-1].startswith("-")
+            ordering.append("-pk" if descending else "pk")
+        self.ordering = [(field.lstrip("-"), field.startswith("-")) for field in ordering]
+        self.fields = [
+            _resolve_field(queryset.model, path, queryset.query.annotations)
+            for path, _ in self.ordering
+        ]
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = int(per_page)
+        self.count_mode = count
+
+    @cached_property
+    def count(self):
+        if self.count_mode is None:
+            return None
+        if self.count_mode == "exact":
+            return self.queryset.count()
+        try:
+            sql, params = self.queryset.query.sql_with_params()
+        except Exception:  # EmptyResultSet and friends
+            return self.queryset.count()
+        key = "shop:pagination:count:" + hashlib.md5(
+            repr((sql, params)).encode()
+        ).hexdigest()
+        total = cache.get(key)
+        if total is None:
+            total = self.queryset.count()
+            cache.set(key, total, APPROXIMATE_COUNT_TIMEOUT)
+        return total
+
+    def _signature(self):
+        return [path if not desc else f"-{path}" for path, desc in self.ordering]
+
+    def _make_cursor(self, obj, direction):
+        values = [_encode_value(_value_of(obj, path)) for path, _ in self.ordering]
+        return signing.dumps(
+            {"v": values, "d": direction, "o": self._signature()},
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+
+    def _decode_cursor(self, cursor):
+        """Return ``(values, direction)``, or ``None`` for a bad/foreign cursor."""
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+            if payload["o"] != self._signature() or payload["d"] not in ("n", "p"):
+                return None
+            values = [
+                field.to_python(value) if value is not None else None
+                for field, value in zip(self.fields, payload["v"])
+            ]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            return None
+        if len(values) != len(self.ordering):
+            return None
+        return values, payload["d"]
+
+    def _after(self, values, forward):
+        """Rows strictly after (``forward``) or before the given sort key."""
+        condition, equal = Q(), Q()
+        for (path, descending), value in zip(self.ordering, values):
+            lookup = "gt" if descending != forward else "lt"
+            condition |= equal & Q(**{f"{path}__{lookup}": value})
+            equal &= Q(**{path: value})
+        return condition
+
+    def get_page(self, cursor=None):
+        decoded = self._decode_cursor(cursor) if cursor else None
+        size = self.per_page
+
+        if decoded is None:
+            rows = list(self.queryset[: size + 1])
+            has_next, has_previous = len(rows) > size, False
+            rows = rows[:size]
+        elif decoded[1] == "n":
+            rows = list(self.queryset.filter(self._after(decoded[0], True))[: size + 1])
+            has_next, has_previous = len(rows) > size, True
+            rows = rows[:size]
+        else:
+            reverse = [
+                path if descending else f"-{path}" for path, descending in self.ordering
+            ]
+            rows = list(
+                self.queryset.filter(self._after(decoded[0], False))
+                .order_by(*reverse)[: size + 1]
+            )
+            has_next, has_previous = True, len(rows) > size
+            rows = rows[:size][::-1]
+
+        if not rows:
+            has_next = False
+        next_cursor = self._make_cursor(rows[-1], "n") if has_next and rows else None
+        previous_cursor = (
+            self._make_cursor(rows[0], "p") if has_previous and rows else None
+        )
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class SequenceCursorPaginator:
+    """
+    Cursor pagination over an already-ranked list (e.g. search result ids),
+    with the same interface as ``CursorPaginator``.
+    """
+
+    def __init__(self, sequence, per_page):
+        self.sequence = sequence
+        self.per_page = int(per_page)
+        self.count = len(sequence)
+
+    def _make_cursor(self, offset):
+        return signing.dumps({"i": offset}, salt=CURSOR_SALT)
+
+    def get_page(self, cursor=None):
+        offset = 0
+        if cursor:
+            try:
+                offset = max(int(signing.loads(cursor, salt=CURSOR_SALT)["i"]), 0)
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                offset = 0
+        end = offset + self.per_page
+        rows = self.sequence[offset:end]
+        next_cursor = self._make_cursor(end) if end < self.count else None
+        previous_cursor = (
+            self._make_cursor(max(offset - self.per_page, 0)) if offset > 0 else None
+        )
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+def paginate(request, queryset, per_page, ordering=None, count="approximate"):
+    """
+    Return a page of ``queryset`` (or of a ranked list) for the request: a
+    ``CursorPage`` driven by the ``cursor`` GET parameter, or a regular
+    ``Page`` when the request still uses a numbered ``?page=`` link.
+    """
+    if request.GET.get("page"):
+        return Paginator(queryset, per_page).get_page(request.GET.get("page"))
+
+    if isinstance(queryset, (list, tuple)):
+        paginator = SequenceCursorPaginator(queryset, per_page)
+    else:
+        try:
+            paginator = CursorPaginator(queryset, per_page, ordering, count)
+        except UnsupportedOrdering:
+            return Paginator(queryset, per_page).get_page(1)
+    page = paginator.get_page(request.GET.get("cursor"))
+    params = request.GET.copy()
+    params.pop("cursor", None)
+    params.pop("page", None)
+    for attr, cursor in (
+        ("next_query", page.next_cursor),
+        ("previous_query", page.previous_cursor),
+    ):
+        if cursor is not None:
+            params["cursor"] = cursor
+            setattr(page, attr, params.urlencode())
+    return page
@@ -0,0 +1,66 @@
+"""
+Bulk "product card" projection.
+
+Product cards (home page sections, category tabs, listings) need the main and
+hover image, the stock flag, and the category / brand / vendor of every
+product. Loaded one product at a time that is four to six queries per card.
+The helpers here load everything a page of cards needs in a fixed number of
+queries; ``Product.get_main_image``, ``get_hover_image`` and ``is_in_stock``
+pick the preloaded data up automatically.
+"""
+
+from django.db.models import Exists, F, OuterRef, prefetch_related_objects
+
+from .models import ProductVariant
+
+CARD_RELATIONS = ("category", "brand", "vendor")
+
+
+def _in_stock_variants():
+    return ProductVariant.objects.filter(
+        product=OuterRef("pk"),
+        stock_quantity__gt=F("reserved_quantity"),
+        is_available=True,
+    )
+
+
+def card_queryset(queryset):
+    """
+    Prepare an (unsliced) product queryset for rendering as cards: related
+    objects are joined, images prefetched and the stock flag annotated.
+    """
+    return (
+        queryset.select_related(*CARD_RELATIONS)
+        .prefetch_related("images")
+        .annotate(has_stock=Exists(_in_stock_variants()))
+    )
+
+
+def load_product_cards(products):
+    """
+    Evaluate ``products`` (a queryset, sliced queryset or list) and attach
+    everything a product card needs, in at most six queries regardless of
+    the number of products. Returns the list of products.
+    """
+    products = list(products)
+    if not products:
+        return products
+
+    # Skips relations that were already select_related / prefetched
+    prefetch_related_objects(products, *CARD_RELATIONS, "images")
+
+    missing_stock = [p for p in products if "has_stock" not in p.__dict__]
+    if missing_stock:
+        in_stock_ids = set(
+            ProductVariant.objects.filter(
+                product_id__in=[p.pk for p in missing_stock],
+                stock_quantity__gt=F("reserved_quantity"),
+                is_available=True,
+            )
+            .values_list("product_id", flat=True)
+            .distinct()
+        )
+        for product in missing_stock:
+            product.has_stock = product.pk in in_stock_ids
+
+    return products
@@ -0,0 +1,167 @@
+"""
+Cached product documents for the product detail page.
+
+Everything on the product page that is the same for every visitor (the
+product with its category / brand, ordered images, in-stock variants, the
+color and size availability, public reviews and the precomputed related
+product ids) is assembled once into a document and cached. The Product, ProductVariant,
+ProductImage and Review signals drop the document when any of it changes.
+The category, brand, fit, color and size labels it embeds are shared by many
+products, so changing one of those drops every document (``invalidate_all``).
+
+Per-visitor flags (wishlist membership, whether the user may review) are not
+part of the document; ``user_flags`` resolves them in a single query.
+"""
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from .models import MnoryUser, OrderItem, Product, Review, WishlistItem
+from .related_products import RELATED_PRODUCTS_LIMIT
+from .related_products import related_ids as precomputed_related_ids
+
+DOCUMENT_TIMEOUT = 60 * 60
+DOCUMENT_VERSION_KEY = "shop:product_doc:version"
+
+
+def _version():
+    version = cache.get(DOCUMENT_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(DOCUMENT_VERSION_KEY, version, None)
+    return version
+
+
+def _document_key(version, product_id):
+    return f"shop:product_doc:{version}:{product_id}"
+
+
+def _slug_key(slug):
+    return f"shop:product_doc:slug:{slug}"
+
+
+def build_document(product):
+    """Assemble the shared part of the product page for ``product``."""
+    images = sorted(product.images.all(), key=lambda image: image.order)
+    variants = [
+        variant
+        for variant in product.variants.all()
+        if variant.is_available and variant.available_quantity > 0
+    ]
+    product.has_stock = bool(variants)
+
+    colors = {v.color_id: v.color for v in variants if v.color.is_active}
+    sizes = {v.size_id: v.size for v in variants if v.size.is_active}
+
+    reviews = [
+        {
+            "user_id": review.user_id,
+            "author": review.user.get_full_name() or review.user.email,
+            "rating": review.rating,
+            "comment": review.comment,
+            "created_at": review.created_at,
+        }
+        for review in product.reviews.filter(is_public=True)
+        .select_related("user")
+        .order_by("-created_at")
+    ]
+
+    # Products added since the last compute_related_products run have no
+    # precomputed list yet; fall back to their category / subcategory
+    related_ids = precomputed_related_ids(product.pk) or list(
+        Product.storefront()
+        .filter(
+            Q(category_id=product.category_id) | Q(subcategory_id=product.subcategory_id)
+        )
+        .exclude(id=product.id)
+        .values_list("id", flat=True)[:RELATED_PRODUCTS_LIMIT]
+    )
+
+    return {
+        "product": product,
+        "images": images,
+        "variants": variants,
+        "colors": sorted(colors.values(), key=lambda color: color.name),
+        "sizes": sorted(
+            sizes.values(), key=lambda size: (size.size_type, size.order, size.name)
+        ),
+        "reviews": reviews,
+        "related_ids": related_ids,
+    }
+
+
+def get_document(slug):
+    """
+    Return the product document for a storefront product slug, or ``None``
+    if no storefront product has that slug.
+    """
+    found = cache.get_many([_slug_key(slug), DOCUMENT_VERSION_KEY])
+    version = found.get(DOCUMENT_VERSION_KEY) or _version()
+    product_id = found.get(_slug_key(slug))
+    if product_id is not None:
+        document = cache.get(_document_key(version, product_id))
+        # A renamed product leaves a stale slug mapping behind
+        if document is not None and document["product"].slug == slug:
+            return document
+
+    product = (
+        Product.objects.select_related("category", "subcategory", "brand", "fit_type")
+        .prefetch_related("images", "variants__color", "variants__size")
+        .filter(slug=slug, **Product.STOREFRONT_FILTER)
+        .first()
+    )
+    if product is None:
+        return None
+
+    document = build_document(product)
+    cache.set_many(
+        {_slug_key(slug): product.pk, _document_key(version, product.pk): document},
+        DOCUMENT_TIMEOUT,
+    )
+    return document
+
+
+def invalidate(product_id):
+    cache.delete(_document_key(_version(), product_id))
+
+
+def invalidate_many(product_ids):
+    version = _version()
+    cache.delete_many([_document_key(version, product_id) for product_id in product_ids])
+
+
+def invalidate_all():
+    """Drop every document, e.g. after a Brand or Color is renamed."""
+    try:
+        cache.incr(DOCUMENT_VERSION_KEY)
+    except ValueError:
+        cache.set(DOCUMENT_VERSION_KEY, 2, None)
+
+
+def user_flags(user, product_id):
+    """Return ``(is_in_wishlist, has_purchased, has_reviewed)`` in one query."""
+    if not user.is_authenticated:
+        return False, False, False
+    flags = (
+        MnoryUser.objects.filter(pk=user.pk)
+        .annotate(
+            in_wishlist=Exists(
+                WishlistItem.objects.filter(
+                    wishlist__user=OuterRef("pk"), product_id=product_id
+                )
+            ),
+            purchased=Exists(
+                OrderItem.objects.filter(
+                    order__user=OuterRef("pk"),
+                    product_variant__product_id=product_id,
+                    order__status="delivered",
+                )
+            ),
+            reviewed=Exists(
+                Review.objects.filter(user=OuterRef("pk"), product_id=product_id)
+            ),
+        )
+        .values_list("in_wishlist", "purchased", "reviewed")
+        .first()
+    )
+    return flags or (False, False, False)
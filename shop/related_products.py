@@ -0,0 +1,231 @@
+"""
+Precomputed related products.
+
+The product page used to pick "related products" with an ad hoc category /
+subcategory query on every view. Instead, ``compute_related`` scores every
+storefront product against its candidates offline and stores the top-N in
+the RelatedProduct table, so the page reads its list with a single indexed
+lookup on ``(product_id, rank)``.
+
+Candidates are picked in SQL, per product: the CANDIDATE_LIMIT best matches
+on subcategory / category / brand / price band (the score below without the
+co-purchases), plus the CO_PURCHASE_CANDIDATES products most often bought
+with it. Only those are scored, so the work per product stays bounded however
+large its category grows. Each candidate is scored on:
+
+    same subcategory        SUBCATEGORY_WEIGHT
+    same category           CATEGORY_WEIGHT
+    same brand              BRAND_WEIGHT
+    same price band         PRICE_BAND_WEIGHT   (the sidebar price buckets)
+    bought together         CO_PURCHASE_WEIGHT per order, up to CO_PURCHASE_CAP
+
+Run periodically through the compute_related_products management command.
+"""
+
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from heapq import nlargest
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+
+from .facets import PRICE_BUCKETS
+from .models import OrderItem, Product, RelatedProduct
+
+RELATED_PRODUCTS_LIMIT = 8
+
+SUBCATEGORY_WEIGHT = 40
+CATEGORY_WEIGHT = 10
+BRAND_WEIGHT = 25
+PRICE_BAND_WEIGHT = 10
+CO_PURCHASE_WEIGHT = 20
+CO_PURCHASE_CAP = 10
+# Very large orders say little about which products belong together
+MAX_ORDER_ITEMS = 50
+BATCH_SIZE = 500
+# Candidates read per product: attribute matches, and co-purchased products
+CANDIDATE_LIMIT = 50
+CO_PURCHASE_CANDIDATES = 20
+
+
+def _storefront_products():
+    return Product.storefront()
+
+
+def _price_band(price, sale_price, is_on_sale):
+    current = sale_price if is_on_sale and sale_price else price
+    return bisect_right(PRICE_BUCKETS, current or 0)
+
+
+def _load_products():
+    """Return ``{id: (category_id, subcategory_id, brand_id, price band)}``."""
+    return {
+        pk: (category_id, subcategory_id, brand_id, _price_band(*prices))
+        for pk, category_id, subcategory_id, brand_id, *prices in (
+            _storefront_products().values_list(
+                "pk",
+                "category_id",
+                "subcategory_id",
+                "brand_id",
+                "price",
+                "sale_price",
+                "is_on_sale",
+            )
+        )
+    }
+
+
+def co_purchase_counts(product_ids=None):
+    """
+    Return ``{product_id: Counter({other_id: orders})}`` counting the orders
+    (cancelled ones excluded) containing both products. With ``product_ids``
+    only orders containing one of those products are read.
+    """
+    items = OrderItem.objects.exclude(order__status="cancelled")
+    if product_ids is not None:
+        items = items.filter(
+            order__in=OrderItem.objects.filter(
+                product_variant__product_id__in=product_ids
+            ).values("order_id")
+        )
+    rows = (
+        items.values_list("order_id", "product_variant__product_id")
+        .distinct()
+        .order_by("order_id")
+    )
+
+    counts = defaultdict(Counter)
+
+    def add_order(products):
+        if 1 < len(products) <= MAX_ORDER_ITEMS:
+            for a, b in combinations(sorted(products), 2):
+                counts[a][b] += 1
+                counts[b][a] += 1
+
+    current_order, products = None, []
+    for order_id, product_id in rows.iterator(chunk_size=2000):
+        if order_id != current_order:
+            add_order(products)
+            current_order, products = order_id, []
+        products.append(product_id)
+    add_order(products)
+    return counts
+
+
+def score(attrs, other_attrs, orders_together=0):
+    category_id, subcategory_id, brand_id, band = attrs
+    other_category, other_subcategory, other_brand, other_band = other_attrs
+    points = 0
+    if subcategory_id and subcategory_id == other_subcategory:
+        points += SUBCATEGORY_WEIGHT
+    if category_id == other_category:
+        points += CATEGORY_WEIGHT
+    if brand_id and brand_id == other_brand:
+        points += BRAND_WEIGHT
+    if band == other_band:
+        points += PRICE_BAND_WEIGHT
+    points += CO_PURCHASE_WEIGHT * min(orders_together, CO_PURCHASE_CAP)
+    return points
+
+
+def _points_when(condition, points):
+    return Case(When(condition, then=Value(points)), default=Value(0))
+
+
+def candidate_ids(product_id, attrs, limit=CANDIDATE_LIMIT):
+    """
+    Return up to ``limit`` storefront products sharing the subcategory or
+    brand of the product (the category when it has no subcategory), best
+    attribute match first.
+    """
+    category_id, subcategory_id, brand_id, band = attrs
+    match = (
+        Q(subcategory_id=subcategory_id)
+        if subcategory_id
+        else Q(category_id=category_id)
+    )
+    points = _points_when(Q(category_id=category_id), CATEGORY_WEIGHT)
+    if subcategory_id:
+        points += _points_when(Q(subcategory_id=subcategory_id), SUBCATEGORY_WEIGHT)
+    if brand_id:
+        match |= Q(brand_id=brand_id)
+        points += _points_when(Q(brand_id=brand_id), BRAND_WEIGHT)
+
+    # The price band in SQL: the current price within the band's bucket bounds
+    in_band = Q()
+    if band > 0:
+        in_band &= Q(current_price__gte=PRICE_BUCKETS[band - 1])
+    if band < len(PRICE_BUCKETS):
+        in_band &= Q(current_price__lt=PRICE_BUCKETS[band])
+    points += _points_when(in_band, PRICE_BAND_WEIGHT)
+
+    return list(
+        _storefront_products()
+        .filter(match)
+        .exclude(pk=product_id)
+        .annotate(current_price=Product.current_price())
+        .annotate(points=points)
+        .order_by("-points", "-pk")
+        .values_list("pk", flat=True)[:limit]
+    )
+
+
+def rank_related(product_id, products, co_purchases, limit):
+    """Return ``[(related_id, score), ...]``, best first, for one product."""
+    attrs = products[product_id]
+    together = co_purchases.get(product_id, Counter())
+    candidates = set(candidate_ids(product_id, attrs))
+    candidates.update(
+        other for other, _ in together.most_common(CO_PURCHASE_CANDIDATES)
+    )
+    candidates.discard(product_id)
+
+    scored = (
+        (score(attrs, products[other], together.get(other, 0)), other)
+        for other in candidates
+        if other in products
+    )
+    # Ties go to the newer product (higher id), like the storefront listings
+    return [(other, points) for points, other in nlargest(limit, scored)]
+
+
+def compute_related(product_ids=None, limit=RELATED_PRODUCTS_LIMIT):
+    """
+    Recompute the related list of the given products (all storefront
+    products by default). Returns the number of products updated.
+    """
+    products = _load_products()
+    co_purchases = co_purchase_counts(product_ids)
+
+    # Lists of products that left the storefront are dropped as well
+    stale = RelatedProduct.objects.exclude(product__in=_storefront_products())
+    if product_ids is None:
+        targets = sorted(products)
+    else:
+        stale = stale.filter(product_id__in=product_ids)
+        targets = sorted(pk for pk in set(product_ids) if pk in products)
+    stale.delete()
+
+    for start in range(0, len(targets), BATCH_SIZE):
+        batch = targets[start : start + BATCH_SIZE]
+        rows = [
+            RelatedProduct(product_id=pk, related_id=other, rank=rank, score=points)
+            for pk in batch
+            for rank, (other, points) in enumerate(
+                rank_related(pk, products, co_purchases, limit)
+            )
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=batch).delete()
+            RelatedProduct.objects.bulk_create(rows)
+    return len(targets)
+
+
+def related_ids(product_id):
+    """The precomputed related product ids, best first (one indexed query)."""
+    return list(
+        RelatedProduct.objects.filter(product_id=product_id)
+        .order_by("rank")
+        .values_list("related_id", flat=True)
+    )
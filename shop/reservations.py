@@ -0,0 +1,214 @@
+"""
+Stock reservations for checkout.
+
+When a shopper opens checkout, the cart's lines are held for HOLD_TTL:
+each hold is a StockReservation row, and the held quantity is added to the
+variant's ``reserved_quantity`` counter with a conditional UPDATE
+
+    reserved_quantity = reserved_quantity + qty
+    WHERE stock_quantity >= reserved_quantity + qty
+
+so a hold is granted atomically without locking the variant for the rest of
+the checkout. Stock available to other shoppers is ``stock_quantity -
+reserved_quantity`` (``ProductVariant.available_quantity``); the caches
+showing it (variant matrices, product documents) are patched through
+``publish`` whenever holds are granted or released.
+
+Holds end in one of three ways:
+
+    placing the order       ``claim`` hands them to shop.checkout, which
+                            turns them into the stock decrement
+    expiry                  ``sweep_expired`` (release_stock_holds command)
+    cart deleted            ``release`` from the Cart pre_delete signal
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from . import product_documents, variant_matrix
+from .models import Cart, ProductVariant, StockReservation
+
+logger = logging.getLogger(__name__)
+
+HOLD_TTL = timedelta(minutes=10)
+
+
+def _availability_changed(variant_ids):
+    try:
+        products = set(
+            ProductVariant.objects.filter(pk__in=variant_ids).values_list(
+                "product_id", flat=True
+            )
+        )
+        variant_matrix.invalidate_many(products)
+        product_documents.invalidate_many(products)
+    except Exception as e:
+        logger.error(f"Failed to update availability caches: {e}")
+
+
+def publish(variant_ids):
+    """
+    Drop the cached availability of the given variants once the current
+    transaction commits.
+    """
+    variant_ids = list(variant_ids)
+    if variant_ids:
+        transaction.on_commit(lambda: _availability_changed(variant_ids))
+
+
+def _release_rows(holds):
+    """
+    Lock, delete and uncount the given holds; returns ``{variant_id: qty}``.
+    Locked rows are skipped so a hold is never released twice.
+    """
+    with transaction.atomic():
+        rows = list(
+            holds.select_for_update(skip_locked=True).values_list(
+                "pk", "product_variant_id", "quantity"
+            )
+        )
+        if not rows:
+            return {}
+        released = defaultdict(int)
+        for _pk, variant_id, quantity in rows:
+            released[variant_id] += quantity
+        StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        reserved = Case(
+            *[
+                When(
+                    pk=variant_id,
+                    reserved_quantity__gte=quantity,
+                    then=F("reserved_quantity") - quantity,
+                )
+                for variant_id, quantity in released.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        ProductVariant.objects.filter(pk__in=list(released)).update(
+            reserved_quantity=reserved
+        )
+        publish(released)
+    return dict(released)
+
+
+def _hold(variant_id, quantity):
+    return ProductVariant.objects.filter(
+        pk=variant_id, stock_quantity__gte=F("reserved_quantity") + quantity
+    ).update(reserved_quantity=F("reserved_quantity") + quantity)
+
+
+def reserve(cart, lines):
+    """
+    Hold ``lines`` (``{variant_id: quantity}``) for ``cart`` until
+    ``HOLD_TTL`` from now, replacing the cart's previous holds. Returns the
+    ids of the variants that could not be held; those lines are checked
+    against the remaining stock when the order is placed.
+
+    The cart row is locked for the duration, so two checkouts of the same
+    cart (two tabs, a double load) replace its holds one after the other
+    and the counters always match the StockReservation rows.
+    """
+    with transaction.atomic():
+        Cart.objects.select_for_update().get(pk=cart.pk)
+        expires_at = timezone.now() + HOLD_TTL
+        current = {
+            variant_id: quantity
+            for variant_id, quantity in cart.reservations.values_list(
+                "product_variant_id", "quantity"
+            )
+        }
+        if current and current == lines:
+            # Same lines as before (e.g. the form re-rendered): just extend
+            cart.reservations.update(expires_at=expires_at)
+            return []
+
+        release(cart)
+        holds, unavailable = [], []
+        for variant_id, quantity in lines.items():
+            held = _hold(variant_id, quantity)
+            if not held and _release_rows(
+                StockReservation.objects.filter(
+                    product_variant_id=variant_id, expires_at__lte=timezone.now()
+                )
+            ):
+                # Expired holds of other carts were in the way
+                held = _hold(variant_id, quantity)
+            if held:
+                holds.append(
+                    StockReservation(
+                        cart=cart,
+                        product_variant_id=variant_id,
+                        quantity=quantity,
+                        expires_at=expires_at,
+                    )
+                )
+            else:
+                unavailable.append(variant_id)
+        StockReservation.objects.bulk_create(holds)
+        publish(hold.product_variant_id for hold in holds)
+    return unavailable
+
+
+def release(cart):
+    """Release every hold of ``cart``."""
+    return _release_rows(StockReservation.objects.filter(cart=cart))
+
+
+def claim(cart):
+    """
+    Lock and delete the cart's holds for an order being placed, returning
+    ``{variant_id: quantity}`` held. The caller must take all of these
+    quantities out of ``reserved_quantity`` in the same transaction, ordered
+    or not (see shop.checkout).
+    """
+    rows = list(
+        StockReservation.objects.select_for_update()
+        .filter(cart=cart)
+        .values_list("pk", "product_variant_id", "quantity")
+    )
+    if rows:
+        StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return {variant_id: quantity for _pk, variant_id, quantity in rows}
+
+
+def sweep_expired():
+    """Release every expired hold; returns the number of variants freed."""
+    return len(
+        _release_rows(StockReservation.objects.filter(expires_at__lte=timezone.now()))
+    )
+
+
+def repair_counters():
+    """
+    Recompute ``reserved_quantity`` from the holds, e.g. after holds were
+    removed without going through this module. Returns the variants fixed.
+    Run it while checkout is quiet: a hold granted concurrently may be lost.
+    """
+    held = dict(
+        StockReservation.objects.values("product_variant_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("product_variant_id", "total")
+    )
+    variants = list(
+        ProductVariant.objects.filter(reserved_quantity__gt=0).only(
+            "pk", "reserved_quantity"
+        )
+    ) + list(
+        ProductVariant.objects.filter(pk__in=list(held), reserved_quantity=0).only(
+            "pk", "reserved_quantity"
+        )
+    )
+    drifted = []
+    for variant in variants:
+        expected = held.get(variant.pk, 0)
+        if variant.reserved_quantity != expected:
+            variant.reserved_quantity = expected
+            drifted.append(variant)
+    ProductVariant.objects.bulk_update(drifted, ["reserved_quantity"])
+    return len(drifted)
@@ -0,0 +1,298 @@
+"""
+Product search engine.
+
+Products are tokenized (English and Arabic) into an inverted index of
+``ProductSearchToken`` rows, so a search is one indexed lookup with a GROUP BY
+instead of four ``icontains`` scans joined across Brand and Category.
+
+The backend is pluggable through ``settings.SHOP_SEARCH_BACKEND``; the default
+``DatabaseSearchBackend`` stores the index in the regular database so it works
+the same on SQLite (dev) and MySQL (production). Until the index has been
+built (``rebuild_search_index`` after deploying), it falls back to the
+unranked ``icontains`` scan it replaced, so search keeps working meanwhile.
+"""
+
+import re
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Q, Sum, When
+from django.utils.module_loading import import_string
+
+from .models import Product, ProductSearchToken
+
+MAX_TOKEN_LENGTH = 64
+MAX_RESULTS = 1000
+
+# Weight of a token by the field it was found in
+FIELD_WEIGHTS = (
+    ("name", 8),
+    ("brand", 4),
+    ("category", 2),
+    ("subcategory", 2),
+    ("description", 1),
+)
+
+STOP_WORDS = {
+    # English
+    "a", "an", "and", "the", "of", "for", "with", "in", "on", "to", "by", "or",
+    # Arabic (already normalized: alef maksura folded to yeh)
+    "في", "من", "علي", "الي", "عن", "مع", "و",
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_ARABIC_DIACRITICS_RE = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+_ARABIC_FOLD = str.maketrans(
+    {
+        "\u0623": "\u0627",  # alef with hamza above -> alef
+        "\u0625": "\u0627",  # alef with hamza below -> alef
+        "\u0622": "\u0627",  # alef with madda -> alef
+        "\u0671": "\u0627",  # alef wasla -> alef
+        "\u0649": "\u064a",  # alef maksura -> yeh
+        "\u0629": "\u0647",  # teh marbuta -> heh
+        "\u0624": "\u0648",  # waw with hamza -> waw
+        "\u0626": "\u064a",  # yeh with hamza -> yeh
+        "\u0640": None,  # tatweel
+    }
+)
+# Definite article with attached conjunctions / prepositions: wal-, bal-, kal-, fal-, lil-, al-
+_ARABIC_PREFIXES = (
+    "\u0648\u0627\u0644",
+    "\u0628\u0627\u0644",
+    "\u0643\u0627\u0644",
+    "\u0641\u0627\u0644",
+    "\u0644\u0644",
+    "\u0627\u0644",
+)
+_ARABIC_RE = re.compile("[\u0600-\u06ff]")
+
+
+def normalize(text):
+    """Lowercase and fold Arabic letter variants / diacritics."""
+    text = _ARABIC_DIACRITICS_RE.sub("", (text or "").lower())
+    return text.translate(_ARABIC_FOLD)
+
+
+def stem(token):
+    """Very light stemming: English plurals and Arabic definite-article prefixes."""
+    if _ARABIC_RE.match(token):
+        for prefix in _ARABIC_PREFIXES:
+            if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+                token = token[len(prefix):]
+                break
+        if token.endswith("\u0627\u062a") and len(token) > 4:  # feminine plural
+            token = token[:-2]
+        return token
+
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Split text into normalized, stemmed search tokens (stop words dropped)."""
+    tokens = []
+    for raw in _TOKEN_RE.findall(normalize(text)):
+        if raw in STOP_WORDS or raw == "_":
+            continue
+        tokens.append(stem(raw)[:MAX_TOKEN_LENGTH])
+    return tokens
+
+
+def product_tokens(product):
+    """Return ``{token: weight}`` for a product across all searchable fields."""
+    fields = {
+        "name": product.name,
+        "brand": product.brand.name if product.brand_id else "",
+        "category": product.category.name if product.category_id else "",
+        "subcategory": product.subcategory.name if product.subcategory_id else "",
+        "description": product.description,
+    }
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        # A token counts once per field so long descriptions cannot dominate
+        for token in set(tokenize(fields[field])):
+            weights[token] = weights.get(token, 0) + weight
+    return weights
+
+
+def is_searchable(product):
+    return product.is_active and product.is_available and product.is_visible
+
+
+class BaseSearchBackend(ABC):
+    """Interface every product search backend implements."""
+
+    @abstractmethod
+    def index_products(self, products):
+        """(Re)index the given products, dropping any that are not searchable."""
+
+    @abstractmethod
+    def remove_products(self, product_ids):
+        """Drop the given products from the index."""
+
+    @abstractmethod
+    def search(self, query, limit=MAX_RESULTS):
+        """Return matching product ids, best match first."""
+
+    @abstractmethod
+    def rebuild(self):
+        """Reindex every storefront product from scratch."""
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Inverted index stored in the ``ProductSearchToken`` table.
+
+    Every query token must match (the last one as a prefix, for typeahead);
+    products are ranked by the summed field weights of the matched tokens.
+    """
+
+    batch_size = 1000
+
+    def __init__(self):
+        self.indexed = False
+
+    def is_indexed(self):
+        """Whether the token table has been filled (remembered once it is)."""
+        if not self.indexed:
+            self.indexed = ProductSearchToken.objects.exists()
+        return self.indexed
+
+    def index_products(self, products):
+        products = list(products)
+        if not products:
+            return
+        rows = []
+        for product in products:
+            if not is_searchable(product):
+                continue
+            rows.extend(
+                ProductSearchToken(token=token, product_id=product.pk, weight=weight)
+                for token, weight in product_tokens(product).items()
+            )
+        with transaction.atomic():
+            ProductSearchToken.objects.filter(
+                product_id__in=[p.pk for p in products]
+            ).delete()
+            ProductSearchToken.objects.bulk_create(rows, batch_size=self.batch_size)
+
+    def remove_products(self, product_ids):
+        ProductSearchToken.objects.filter(product_id__in=list(product_ids)).delete()
+
+    def search(self, query, limit=MAX_RESULTS):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        if not self.is_indexed():
+            return self._scan(query, limit)
+
+        conditions = []
+        for index, term in enumerate(terms):
+            is_last = index == len(terms) - 1
+            lookup = Q(token__startswith=term) if is_last else Q(token=term)
+            conditions.append((index, lookup))
+
+        matches = Q()
+        for _, lookup in conditions:
+            matches |= lookup
+
+        ranked = (
+            ProductSearchToken.objects.filter(matches)
+            .annotate(
+                term=Case(
+                    *[When(lookup, then=index) for index, lookup in conditions],
+                    output_field=IntegerField(),
+                )
+            )
+            .values("product_id")
+            .annotate(
+                matched=Count("term", distinct=True),
+                score=Sum("weight"),
+                best=Max("weight"),
+            )
+            .filter(matched=len(terms))
+            .order_by("-score", "-best", "-product_id")
+            .values_list("product_id", flat=True)
+        )
+        return list(ranked[:limit])
+
+    def _scan(self, query, limit):
+        """The ``icontains`` search used before the index, newest first."""
+        query = query.strip()
+        return list(
+            Product.storefront()
+            .filter(
+                Q(name__icontains=query)
+                | Q(description__icontains=query)
+                | Q(brand__name__icontains=query)
+                | Q(category__name__icontains=query)
+            )
+            .order_by("-created_at", "-pk")
+            .values_list("pk", flat=True)
+            .distinct()[:limit]
+        )
+
+    def rebuild(self):
+        ProductSearchToken.objects.all().delete()
+        products = Product.storefront().select_related(
+            "brand", "category", "subcategory"
+        )
+        batch = []
+        for product in products.iterator(chunk_size=self.batch_size):
+            batch.append(product)
+            if len(batch) >= self.batch_size:
+                self.index_products(batch)
+                batch = []
+        self.index_products(batch)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_path = getattr(
+            settings, "SHOP_SEARCH_BACKEND", "shop.search.DatabaseSearchBackend"
+        )
+        _backend = import_string(backend_path)()
+    return _backend
+
+
+def search_product_ids(query, limit=MAX_RESULTS):
+    """Return ranked ids of storefront products matching ``query``."""
+    return get_backend().search(query, limit=limit)
+
+
+def ranked_products(product_ids, queryset=None):
+    """Load products by id, keeping the ranking order of ``product_ids``."""
+    queryset = queryset if queryset is not None else Product.objects.all()
+    products = queryset.filter(pk__in=product_ids, **Product.STOREFRONT_FILTER).in_bulk()
+    return [products[pk] for pk in product_ids if pk in products]
+
+
+def index_product(product):
+    get_backend().index_products(
+        Product.objects.filter(pk=product.pk).select_related(
+            "brand", "category", "subcategory"
+        )
+    )
+
+
+def reindex_products(queryset):
+    """Reindex a set of products, e.g. every product of a renamed brand."""
+    backend = get_backend()
+    queryset = queryset.select_related("brand", "category", "subcategory")
+    batch = []
+    for product in queryset.iterator(chunk_size=DatabaseSearchBackend.batch_size):
+        batch.append(product)
+        if len(batch) >= DatabaseSearchBackend.batch_size:
+            backend.index_products(batch)
+            batch = []
+    backend.index_products(batch)
@@ -0,0 +1,144 @@
+"""
+Shipping quotes.
+
+An order is shipped by each vendor separately, so shipping is quoted per
+vendor: the vendor's VendorShipping rate for the city, waived above the
+vendor's free shipping threshold. Vendors without shipping settings (and
+products without a vendor) are charged the site-wide constance rates.
+
+``quote`` takes the cart's ``{vendor_id: subtotal}`` snapshot and returns a
+ShippingQuote with the per-vendor breakdown; the AJAX quote, the checkout
+page and order creation (shop.checkout) all use it, so they always agree.
+Vendor rates are cached per vendor and dropped by the VendorShipping
+signals; the site rates are cached until the constance config changes.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from constance import config
+from django.core.cache import cache
+from django.db import models
+
+from .models import Cart, VendorShipping
+
+OUTSIDE_CAIRO = "OUTSIDE_CAIRO"
+SHIPPING_CACHE_TIMEOUT = 60 * 60
+SITE_RATES_KEY = "shop:shipping:site_rates"
+# Cached for vendors without shipping settings (None would read as a miss)
+NO_SETTINGS = ()
+
+
+def _vendor_key(vendor_id):
+    return f"shop:shipping:vendor:{vendor_id}"
+
+
+class ShippingQuote:
+    """Shipping for one cart and city, broken down per vendor."""
+
+    def __init__(self, city, subtotals, charges):
+        self.city = city
+        self.subtotals = subtotals  # {vendor_id: Decimal}
+        self.charges = charges  # {vendor_id: Decimal}
+
+    @property
+    def subtotal(self):
+        return sum(self.subtotals.values(), Decimal("0.00"))
+
+    @property
+    def total(self):
+        return sum(self.charges.values(), Decimal("0.00"))
+
+    def __repr__(self):
+        return f"<ShippingQuote {self.city}: {self.total}>"
+
+
+def site_rates():
+    """Return ``(rate_cairo, rate_outside_cairo)`` from the site config."""
+    rates = cache.get(SITE_RATES_KEY)
+    if rates is None:
+        rates = (
+            Decimal(str(config.SHIPPING_RATE_CAIRO)),
+            Decimal(str(config.SHIPPING_RATE_OUTSIDE_CAIRO)),
+        )
+        cache.set(SITE_RATES_KEY, rates, SHIPPING_CACHE_TIMEOUT)
+    return rates
+
+
+def vendor_rates(vendor_ids):
+    """
+    Return ``{vendor_id: (rate_cairo, rate_outside_cairo, threshold)}``,
+    or NO_SETTINGS for vendors without shipping settings. Cache misses are
+    loaded with a single query.
+    """
+    keys = {_vendor_key(vendor_id): vendor_id for vendor_id in vendor_ids}
+    found = cache.get_many(keys)
+    rates = {keys[key]: value for key, value in found.items()}
+
+    missing = [vendor_id for vendor_id in vendor_ids if vendor_id not in rates]
+    if missing:
+        loaded = {vendor_id: NO_SETTINGS for vendor_id in missing}
+        for vendor_id, *settings in VendorShipping.objects.filter(
+            vendor_id__in=missing
+        ).values_list(
+            "vendor_id",
+            "shipping_rate_cairo",
+            "shipping_rate_outside_cairo",
+            "free_shipping_threshold",
+        ):
+            loaded[vendor_id] = tuple(settings)
+        cache.set_many(
+            {_vendor_key(vendor_id): value for vendor_id, value in loaded.items()},
+            SHIPPING_CACHE_TIMEOUT,
+        )
+        rates.update(loaded)
+    return rates
+
+
+def quote(subtotals, city):
+    """Quote shipping to ``city`` for ``{vendor_id: subtotal}``."""
+    vendors = vendor_rates([vendor_id for vendor_id in subtotals if vendor_id])
+    outside = city == OUTSIDE_CAIRO
+    charges = {}
+    for vendor_id, subtotal in subtotals.items():
+        rates = vendors.get(vendor_id, NO_SETTINGS)
+        if rates == NO_SETTINGS:
+            charges[vendor_id] = site_rates()[1 if outside else 0]
+            continue
+        rate_cairo, rate_outside_cairo, threshold = rates
+        if threshold and subtotal >= threshold:
+            charges[vendor_id] = Decimal("0.00")
+        else:
+            charges[vendor_id] = rate_outside_cairo if outside else rate_cairo
+    return ShippingQuote(city, subtotals, charges)
+
+
+def cart_subtotals(cart):
+    """
+    Return the ``{vendor_id: subtotal}`` snapshot of a database cart (one
+    grouped query) or of a session cart.
+    """
+    if getattr(cart, "is_session_cart", False):
+        subtotals = defaultdict(Decimal)
+        for item in cart.get_items():
+            subtotals[item.product_variant.product.vendor_id] += item.get_total_price()
+        return dict(subtotals)
+    return {
+        vendor_id: Decimal(subtotal or 0).quantize(Decimal("0.01"))
+        for vendor_id, subtotal in cart.items.values("product_variant__product__vendor_id")
+        .annotate(subtotal=models.Sum(Cart._line_total()))
+        .values_list("product_variant__product__vendor_id", "subtotal")
+        .order_by()
+    }
+
+
+def quote_cart(cart, city):
+    return quote(cart_subtotals(cart), city)
+
+
+def invalidate_vendor(vendor_id):
+    cache.delete(_vendor_key(vendor_id))
+
+
+def invalidate_site_rates():
+    cache.delete(SITE_RATES_KEY)
@@ -1,6 +1,9 @@
+from constance.signals import config_updated
 from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils.translation import gettext as _
 from .email import (
     send_order_confirmation_email,
     send_order_status_update_email,
@@ -30,8 +33,34 @@ from shop.models import (
     MnoryUser,
     VendorProfile,
     OrderItem,
+    Brand,
+    FitType,
+    Color,
+    Size,
+    Category,
+    SubCategory,
+    ProductImage,
+    HomeSlider,
+    Advertisement,
+    Coupon,
+)
+from . import (
+    autocomplete,
+    badges,
+    cart_storage,
+    context_processors,
+    coupons,
+    facets,
+    fragments,
+    notification_feed,
+    product_documents,
+    reservations,
+    search,
+    shipping,
+    variant_matrix,
 )
 import logging
+from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
@@ -61,41 +90,48 @@ def merge_session_cart_wishlist(sender, user, request, **kwargs):
     the user's permanent cart/wishlist upon successful login.
     """
     # --- Cart Merge Logic ---
-    session_cart = request.session.get("cart", {})
-    if session_cart:
+    lines = defaultdict(int)
+    for variant_id, quantity in request.session.get("cart", {}).items():
+        lines[int(variant_id)] += quantity
+    # An anonymous cart promoted at checkout is folded in as well
+    promoted_id = request.session.pop(cart_storage.SESSION_CART_ID_KEY, None)
+    if promoted_id:
+        promoted = Cart.objects.filter(pk=promoted_id, user__isnull=True).first()
+        if promoted:
+            for variant_id, quantity in promoted.items.values_list(
+                "product_variant_id", "quantity"
+            ):
+                lines[variant_id] += quantity
+            promoted.delete()
+    if lines:
         # Get or create the user's persistent cart
-        cart, _ = Cart.objects.get_or_create(user=user)
-
-        for variant_id, quantity in session_cart.items():
-            # Ensure the variant exists
-            variant = ProductVariant.objects.filter(id=variant_id).first()
-            if variant:
-                # Get or create the cart item
-                item, created = CartItem.objects.get_or_create(
-                    cart=cart, product_variant=variant
-                )
-                if not created:
-                    # If item already exists, add the quantity from session
-                    item.quantity += quantity
-                else:
-                    # If new item, set its quantity
-                    item.quantity = quantity
-                item.save()
+        cart = Cart.objects.get_or_create(user=user)[0]
+        cart_storage.merge_lines(cart, lines)
         # Clear the session cart after merging
-        request.session.pop("cart", None)  # Use .pop(key, default) for safer removal
+        request.session.pop("cart", None)
 
     # --- Wishlist Merge Logic ---
     session_wishlist = request.session.get("wishlist", [])
     if session_wishlist:
         # Get or create the user's persistent wishlist
-        wishlist, _ = Wishlist.objects.get_or_create(user=user)
-
-        for product_id in session_wishlist:
-            # Ensure the product exists
-            product = Product.objects.filter(id=product_id).first()
-            if product:
-                # Add product to wishlist if not already there
-                WishlistItem.objects.get_or_create(wishlist=wishlist, product=product)
+        wishlist = Wishlist.objects.get_or_create(user=user)[0]
+
+        # Add the existing products that are not in the wishlist yet
+        product_ids = set(
+            Product.objects.filter(id__in=session_wishlist).values_list("id", flat=True)
+        )
+        product_ids.difference_update(
+            wishlist.items.filter(product_id__in=product_ids).values_list(
+                "product_id", flat=True
+            )
+        )
+        WishlistItem.objects.bulk_create(
+            WishlistItem(wishlist=wishlist, product_id=product_id)
+            for product_id in product_ids
+        )
+        if product_ids:
+            # bulk_create skips the badge signals
+            transaction.on_commit(lambda: badges.invalidate_user(user.pk))
         # Clear the session wishlist after merging
         request.session.pop(
             "wishlist", None
@@ -107,50 +143,55 @@ def merge_session_cart_wishlist(sender, user, request, **kwargs):
 # -------------------------------
 
 
+def _announce_new_order(order):
+    logger.info(f"New order created: {order.order_number}")
+
+    # --- Create notifications for vendors ---
+    vendors_notified = set()
+    for item in order.items.select_related("product_variant__product__vendor__user"):
+        vendor_profile = item.product_variant.product.vendor
+        if vendor_profile and vendor_profile.id not in vendors_notified:
+            try:
+                Notification.objects.create(
+                    user=vendor_profile.user,
+                    notification_type="new_order",
+                    title=_("New Order Received!"),
+                    message=_(
+                        f"You have a new order #{order.order_number} containing your products."
+                    ),
+                    link=order.get_absolute_url(),  # Assuming Order model has get_absolute_url
+                )
+                vendors_notified.add(vendor_profile.id)
+            except Exception as e:
+                logger.error(
+                    f"Failed to create new order notification for vendor {vendor_profile.user.email}: {e}"
+                )
+
+    # Send order confirmation email to customer
+    try:
+        send_order_confirmation_email(order)
+    except Exception as e:
+        logger.error(
+            f"Failed to send order confirmation email for order {order.order_number}: {str(e)}"
+        )
+
+    # Send admin notification
+    try:
+        send_admin_new_order_notification(order)
+    except Exception as e:
+        logger.error(
+            f"Failed to send admin notification for order {order.order_number}: {str(e)}"
+        )
+
+
 @receiver(post_save, sender=Order)
 def handle_order_created(sender, instance, created, **kwargs):
     """
-    Send order confirmation email when a new order is created
+    Notify vendors and send the confirmation emails for a new order. The order
+    items are written after the Order row, so this waits for the commit.
     """
     if created:
-        logger.info(f"New order created: {instance.order_number}")
-
-        # --- Create notifications for vendors ---
-        vendors_notified = set()
-        for item in instance.items.all():
-            vendor_profile = item.product_variant.product.vendor
-            if vendor_profile and vendor_profile.id not in vendors_notified:
-                try:
-                    Notification.objects.create(
-                        user=vendor_profile.user,
-                        notification_type="new_order",
-                        title=_("New Order Received!"),
-                        message=_(
-                            f"You have a new order #{instance.order_number} containing your products."
-                        ),
-                        link=instance.get_absolute_url(),  # Assuming Order model has get_absolute_url
-                    )
-                    vendors_notified.add(vendor_profile.id)
-                except Exception as e:
-                    logger.error(
-                        f"Failed to create new order notification for vendor {vendor_profile.user.email}: {e}"
-                    )
-
-        # Send order confirmation email to customer
-        try:
-            send_order_confirmation_email(instance)
-        except Exception as e:
-            logger.error(
-                f"Failed to send order confirmation email for order {instance.order_number}: {str(e)}"
-            )
-
-        # Send admin notification
-        try:
-            send_admin_new_order_notification(instance)
-        except Exception as e:
-            logger.error(
-                f"Failed to send admin notification for order {instance.order_number}: {str(e)}"
-            )
+        transaction.on_commit(lambda: _announce_new_order(instance))
 
 
 @receiver(pre_save, sender=Order)
@@ -357,6 +398,476 @@ def handle_vendor_approval_change(sender, instance, **kwargs):
             )
 
 
+# -------------------------------
+# Catalog Index Signals
+# -------------------------------
+
+
+def refresh_product_indexes(product_ids):
+    """
+    Bring the search, facet, typeahead, product page and home page indexes
+    up to date for products changed with a queryset ``update()``, which
+    skips the Product signals below (admin bulk actions, backfills).
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    search.reindex_products(Product.objects.filter(pk__in=product_ids))
+    facets.refresh_products(product_ids)
+    for product_id in product_ids:
+        autocomplete.mark_changed(autocomplete.PRODUCT, product_id)
+        variant_matrix.invalidate(product_id)
+    product_documents.invalidate_many(product_ids)
+    fragments.bump(*fragments.PRODUCT_SECTIONS, "categories")
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_placement(sender, instance, **kwargs):
+    """
+    Remember which listing scopes an existing product was indexed under, so a
+    product moved to another category is removed from its old facet documents.
+    """
+    instance._previous_facet_scopes = ()
+    if instance.pk:
+        placement = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list("category_id", "subcategory_id")
+            .first()
+        )
+        if placement:
+            instance._previous_facet_scopes = (
+                f"cat:{placement[0]}",
+                f"sub:{placement[1]}",
+            )
+
+
+@receiver(post_save, sender=Product)
+def update_product_facets(sender, instance, **kwargs):
+    """Refresh the facet index after a product is created or edited."""
+    try:
+        facets.refresh_product(
+            instance.pk, getattr(instance, "_previous_facet_scopes", ())
+        )
+    except Exception as e:
+        logger.error(f"Failed to update facet index for product {instance.pk}: {e}")
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_facets(sender, instance, **kwargs):
+    """Drop a deleted product from the facet index."""
+    try:
+        facets.discard_product(
+            instance.pk, instance.category_id, instance.subcategory_id
+        )
+    except Exception as e:
+        logger.error(f"Failed to remove product {instance.pk} from facet index: {e}")
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def update_variant_facets(sender, instance, **kwargs):
+    """Variant stock, color and size changes alter the product's facet row."""
+    try:
+        facets.refresh_product(instance.product_id)
+    except Exception as e:
+        logger.error(
+            f"Failed to update facet index for variant {instance.pk}: {e}"
+        )
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=FitType)
+@receiver(post_delete, sender=FitType)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_facet_labels(sender, instance, **kwargs):
+    """Facet labels are embedded in every document, so rebuild them all."""
+    facets.invalidate_all()
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    """Re-tokenize a product (or drop it, if it left the storefront)."""
+    try:
+        search.index_product(instance)
+    except Exception as e:
+        logger.error(f"Failed to update search index for product {instance.pk}: {e}")
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+def update_related_search_index(sender, instance, created, **kwargs):
+    """Brand and category names are indexed with each of their products."""
+    if created:
+        return
+    try:
+        lookup = {
+            Brand: "brand",
+            Category: "category",
+            SubCategory: "subcategory",
+        }[sender]
+        search.reindex_products(Product.objects.filter(**{lookup: instance}))
+    except Exception as e:
+        logger.error(f"Failed to reindex products of {sender.__name__} {instance.pk}: {e}")
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def update_autocomplete_index(sender, instance, **kwargs):
+    """Publish renamed, hidden or deleted names to the typeahead index."""
+    kind = {
+        Product: autocomplete.PRODUCT,
+        Brand: autocomplete.BRAND,
+        Category: autocomplete.CATEGORY,
+        SubCategory: autocomplete.SUBCATEGORY,
+    }[sender]
+    try:
+        autocomplete.mark_changed(kind, instance.pk)
+        if sender is Category and not kwargs.get("created", False):
+            # Subcategory URLs and visibility depend on their category
+            for pk in instance.subcategories.values_list("pk", flat=True):
+                autocomplete.mark_changed(autocomplete.SUBCATEGORY, pk)
+    except Exception as e:
+        logger.error(f"Failed to update autocomplete for {sender.__name__} {instance.pk}: {e}")
+
+
+# -------------------------------
+# Product Page Document Signals
+# -------------------------------
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_document(sender, instance, **kwargs):
+    product_documents.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_document_parts(sender, instance, **kwargs):
+    """Variants, images and reviews are embedded in the product document."""
+    product_documents.invalidate(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=FitType)
+@receiver(post_delete, sender=FitType)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+def invalidate_product_document_labels(sender, instance, **kwargs):
+    """Their names are embedded in the documents of all their products."""
+    product_documents.invalidate_all()
+
+
+# -------------------------------
+# Variant Matrix Signals
+# -------------------------------
+
+
+@receiver(post_save, sender=ProductVariant)
+def update_variant_matrix(sender, instance, **kwargs):
+    """Stock / availability / price changes rebuild the cached matrix."""
+    try:
+        variant_matrix.invalidate(instance.product_id)
+    except Exception as e:
+        logger.error(f"Failed to update variant matrix for variant {instance.pk}: {e}")
+
+
+@receiver(post_delete, sender=ProductVariant)
+def remove_variant_from_matrix(sender, instance, **kwargs):
+    variant_matrix.invalidate(instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_variant_matrix(sender, instance, **kwargs):
+    """Variant prices are relative to the product price."""
+    variant_matrix.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+def invalidate_variant_matrix_labels(sender, instance, **kwargs):
+    variant_matrix.invalidate_all()
+
+
+# -------------------------------
+# Cart Totals Signals
+# -------------------------------
+# Cart totals are maintained incrementally by CartItem; a price change or a
+# deleted variant makes the stored totals of the carts holding it drift, so
+# those carts are repaired here.
+
+PRODUCT_PRICE_FIELDS = ("price", "sale_price", "is_on_sale")
+
+
+def _repair_carts(**item_filter):
+    carts = CartItem.objects.filter(**item_filter).values("cart_id")
+    Cart.repair_totals(Cart.objects.filter(pk__in=carts))
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_price(sender, instance, update_fields=None, **kwargs):
+    instance._previous_price = None
+    if instance.pk and (
+        update_fields is None or set(update_fields) & set(PRODUCT_PRICE_FIELDS)
+    ):
+        instance._previous_price = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list(*PRODUCT_PRICE_FIELDS)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def repair_cart_totals_for_product(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_price", None)
+    current = tuple(getattr(instance, field) for field in PRODUCT_PRICE_FIELDS)
+    if created or previous is None or previous == current:
+        return
+    try:
+        _repair_carts(product_variant__product_id=instance.pk)
+    except Exception as e:
+        logger.error(f"Failed to repair cart totals for product {instance.pk}: {e}")
+
+
+@receiver(pre_save, sender=ProductVariant)
+def remember_variant_price(sender, instance, update_fields=None, **kwargs):
+    instance._previous_price_adjustment = None
+    if instance.pk and (update_fields is None or "price_adjustment" in update_fields):
+        instance._previous_price_adjustment = (
+            ProductVariant.objects.filter(pk=instance.pk)
+            .values_list("price_adjustment", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductVariant)
+def repair_cart_totals_for_variant(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_price_adjustment", None)
+    if created or previous is None or previous == instance.price_adjustment:
+        return
+    try:
+        _repair_carts(product_variant_id=instance.pk)
+    except Exception as e:
+        logger.error(f"Failed to repair cart totals for variant {instance.pk}: {e}")
+
+
+@receiver(pre_delete, sender=ProductVariant)
+def remember_variant_carts(sender, instance, **kwargs):
+    # The cart items are deleted by cascade without CartItem.delete()
+    instance._cart_ids = list(
+        CartItem.objects.filter(product_variant_id=instance.pk).values_list(
+            "cart_id", flat=True
+        )
+    )
+
+
+@receiver(post_delete, sender=ProductVariant)
+def repair_cart_totals_after_variant_delete(sender, instance, **kwargs):
+    cart_ids = getattr(instance, "_cart_ids", None)
+    if not cart_ids:
+        return
+    try:
+        Cart.repair_totals(Cart.objects.filter(pk__in=cart_ids))
+    except Exception as e:
+        logger.error(
+            f"Failed to repair cart totals after deleting variant {instance.pk}: {e}"
+        )
+
+
+# -------------------------------
+# Badge Counter Signals
+# -------------------------------
+# Dropped after the surrounding transaction commits, once CartItem has also
+# applied its change to the cart totals.
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_badge(sender, instance, **kwargs):
+    if CartItem.cart.is_cached(instance):
+        user_id = instance.cart.user_id
+    else:
+        user_id = (
+            Cart.objects.filter(pk=instance.cart_id)
+            .values_list("user_id", flat=True)
+            .first()
+        )
+    transaction.on_commit(lambda: badges.invalidate_cart(instance.cart_id, user_id))
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def invalidate_cart_badge_totals(sender, instance, **kwargs):
+    transaction.on_commit(lambda: badges.invalidate_cart(instance.pk, instance.user_id))
+
+
+@receiver(post_save, sender=WishlistItem)
+@receiver(post_delete, sender=WishlistItem)
+def invalidate_wishlist_badge(sender, instance, **kwargs):
+    if WishlistItem.wishlist.is_cached(instance):
+        user_id = instance.wishlist.user_id
+    else:
+        user_id = (
+            Wishlist.objects.filter(pk=instance.wishlist_id)
+            .values_list("user_id", flat=True)
+            .first()
+        )
+    if user_id is not None:
+        transaction.on_commit(lambda: badges.invalidate_user(user_id))
+
+
+# -------------------------------
+# Shipping Quote Signals
+# -------------------------------
+
+
+@receiver(post_save, sender=VendorShipping)
+@receiver(post_delete, sender=VendorShipping)
+def invalidate_vendor_shipping(sender, instance, **kwargs):
+    shipping.invalidate_vendor(instance.vendor_id)
+
+
+@receiver(config_updated)
+def invalidate_site_shipping_rates(sender, key, **kwargs):
+    if key.startswith("SHIPPING_RATE_"):
+        shipping.invalidate_site_rates()
+
+
+# -------------------------------
+# Coupon Signals
+# -------------------------------
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupon_definitions(sender, instance, **kwargs):
+    """Coupons are cached by code; a renamed code leaves its old key behind."""
+    coupons.invalidate_all()
+
+
+# -------------------------------
+# Navigation Category Signals
+# -------------------------------
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_navigation_categories(sender, instance, **kwargs):
+    context_processors.invalidate_categories()
+
+
+# -------------------------------
+# Notification Feed Signals
+# -------------------------------
+
+
+@receiver(post_save, sender=Notification)
+def update_notification_feed(sender, instance, created, **kwargs):
+    notification_feed.notification_saved(instance, created)
+
+
+@receiver(post_delete, sender=Notification)
+def drop_notification_feed(sender, instance, **kwargs):
+    notification_feed.notification_deleted(instance)
+
+
+# -------------------------------
+# Stock Reservation Signals
+# -------------------------------
+
+
+@receiver(pre_delete, sender=Cart)
+def release_cart_stock_holds(sender, instance, **kwargs):
+    """The holds would be deleted by cascade without uncounting them."""
+    try:
+        reservations.release(instance)
+    except Exception as e:
+        logger.error(f"Failed to release stock holds of cart {instance.pk}: {e}")
+
+
+# -------------------------------
+# Home Page Fragment Signals
+# -------------------------------
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_home_product_sections(sender, instance, **kwargs):
+    """Product flags may have moved it between rails, so bump them all."""
+    try:
+        fragments.bump(*fragments.PRODUCT_SECTIONS, "categories")
+    except Exception as e:
+        logger.error(f"Failed to invalidate home sections for product {instance.pk}: {e}")
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_home_sections_for_product_parts(sender, instance, **kwargs):
+    """Stock and images only change the rails the product is shown in."""
+    try:
+        product = (
+            Product.objects.filter(pk=instance.product_id)
+            .only(*fragments.SECTION_FLAGS.values())
+            .first()
+        )
+        if product is not None:
+            fragments.bump(*fragments.product_sections(product))
+    except Exception as e:
+        logger.error(
+            f"Failed to invalidate home sections for {sender.__name__} {instance.pk}: {e}"
+        )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_home_categories(sender, instance, **kwargs):
+    fragments.bump("categories")
+
+
+@receiver(post_save, sender=HomeSlider)
+@receiver(post_delete, sender=HomeSlider)
+def invalidate_home_sliders(sender, instance, **kwargs):
+    fragments.bump("sliders")
+
+
+@receiver(post_save, sender=Advertisement)
+@receiver(post_delete, sender=Advertisement)
+def invalidate_home_ads(sender, instance, **kwargs):
+    # Click counting saves the ad on every click without changing what is shown
+    if kwargs.get("update_fields") == frozenset({"click_count"}):
+        return
+    fragments.bump("ads")
+
+
 # -------------------------------
 # Optional: Login tracking for first-time users
 # -------------------------------
@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..checkout import place_order
+from ..models import (
+    Category,
+    Color,
+    MnoryUser,
+    Product,
+    ProductVariant,
+    ShippingAddress,
+    Size,
+    SubCategory,
+    VendorProfile,
+)
+
+CONTACT = {"full_name": "Test Buyer", "email": "buyer@example.com", "phone_number": "0100"}
+
+
+class ShopTestCase(TestCase):
+    """Creates a customer and a category; helpers add vendors and variants."""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = MnoryUser.objects.create_user(
+            username="buyer", email="buyer@example.com", password="pw"
+        )
+        self.category = Category.objects.create(name="Shirts")
+        self.subcategory = SubCategory.objects.create(category=self.category, name="Tees")
+        self.color = Color.objects.create(name="Black")
+        self.sizes = 0
+
+    def make_vendor(self, name, commission_rate="10.00"):
+        user = MnoryUser.objects.create_user(
+            username=name, email=f"{name}@example.com", password="pw", user_type="vendor"
+        )
+        # Vendor users get their profile from the user signals
+        vendor, _ = VendorProfile.objects.get_or_create(user=user)
+        vendor.store_name = name
+        vendor.commission_rate = Decimal(commission_rate)
+        vendor.is_approved = True
+        vendor.save()
+        return vendor
+
+    def make_product(self, name, description="A product", price="100.00", **fields):
+        fields.setdefault("category", self.category)
+        fields.setdefault("subcategory", self.subcategory)
+        return Product.objects.create(
+            name=name, description=description, price=Decimal(price), **fields
+        )
+
+    def make_variant(self, vendor=None, price="100.00", stock=10):
+        self.sizes += 1
+        product = self.make_product(f"Product {self.sizes}", price=price, vendor=vendor)
+        variant = ProductVariant.objects.create(
+            product=product,
+            color=self.color,
+            size=Size.objects.create(name=f"S{self.sizes}"),
+            stock_quantity=stock,
+        )
+        return ProductVariant.objects.get(pk=variant.pk)  # Decimal fields as loaded
+
+    def address(self, city="INSIDE_CAIRO"):
+        return ShippingAddress(full_name="Test Buyer", address_line1="Street", city=city, phone_number="0100")
+
+    def order(self, lines, **kwargs):
+        return place_order(
+            user=kwargs.pop("user", self.customer),
+            lines=lines,
+            contact=CONTACT,
+            address=self.address(),
+            payment_method="cod",
+            **kwargs,
+        )
+
+    def refresh(self, *objects):
+        for obj in objects:
+            obj.refresh_from_db()
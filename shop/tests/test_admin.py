@@ -0,0 +1,38 @@
+from django.urls import reverse
+
+from .. import facets, product_documents
+from ..models import MnoryUser
+from ..search import search_product_ids
+from .base import ShopTestCase
+
+
+class ProductAdminActionTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = MnoryUser.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pw"
+        )
+        self.client.force_login(admin)
+        self.product = self.make_variant().product
+
+    def run_action(self, action):
+        return self.client.post(
+            reverse("admin:shop_product_changelist"),
+            {"action": action, "_selected_action": [self.product.pk]},
+        )
+
+    def test_bulk_actions_refresh_the_indexes(self):
+        # Fill the caches first
+        self.assertTrue(product_documents.get_document(self.product.slug))
+        self.assertIn(self.product.pk, facets.get_document("all")["rows"])
+
+        self.run_action("deactivate_products")
+
+        self.assertIsNone(product_documents.get_document(self.product.slug))
+        self.assertNotIn(self.product.pk, facets.get_document("all")["rows"])
+        self.assertEqual(search_product_ids("product"), [])
+
+        self.run_action("activate_products")
+
+        self.assertEqual(search_product_ids("product"), [self.product.pk])
+        self.assertIn(self.product.pk, facets.get_document("all")["rows"])
@@ -0,0 +1,37 @@
+from django.urls import reverse
+
+from .. import autocomplete
+from ..models import Brand
+from .base import ShopTestCase
+
+
+class AutocompleteTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        # The index is per process; every test starts from its own catalog
+        autocomplete._index = None
+        Brand.objects.create(name="Shield")
+        self.make_product("Linen shirt")
+
+    def names(self, prefix):
+        return [suggestion["name"] for suggestion in autocomplete.suggest(prefix)]
+
+    def test_prefix_matches_rank_name_starts_first(self):
+        self.assertEqual(self.names("shi"), ["Shirts", "Shield", "Linen shirt"])
+        self.assertEqual(self.names("linen sh"), ["Linen shirt"])
+        self.assertEqual(self.names("xyz"), [])
+
+    def test_changes_reach_a_built_index(self):
+        self.assertEqual(self.names("shim"), [])
+        product = self.make_product("Shimmer top")
+        self.assertEqual(self.names("shim"), ["Shimmer top"])
+
+        product.is_active = False
+        product.save()
+        self.assertEqual(self.names("shim"), [])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse("shop:autocomplete_api"), {"q": "Shie"})
+        self.assertEqual(response.status_code, 200)
+        (suggestion,) = response.json()["suggestions"]
+        self.assertEqual((suggestion["type"], suggestion["name"]), ("brand", "Shield"))
@@ -0,0 +1,35 @@
+from django.urls import reverse
+
+from ..models import Cart
+from .base import ShopTestCase
+
+
+class BadgeCounterTests(ShopTestCase):
+    def poll(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(reverse("shop:get_cart_and_wishlist_counts"), headers=headers)
+
+    def test_unchanged_counters_answer_304(self):
+        self.client.force_login(self.customer)
+        response = self.poll()
+        self.assertEqual(response.json()["cart_count"], 0)
+        etag = response["ETag"]
+        self.assertEqual(self.poll(etag).status_code, 304)
+
+        # Cart signals drop the cached counters, so the next poll sees the change
+        variant = self.make_variant()
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.create(user=self.customer).add(variant, 2)
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cart_count"], 2)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_anonymous_counters_come_from_the_session(self):
+        variant = self.make_variant()
+        self.client.post(
+            reverse("shop:add_to_cart"), {"product_variant_id": variant.pk, "quantity": 3}
+        )
+        response = self.poll()
+        self.assertEqual(response.json()["cart_count"], 3)
+        self.assertEqual(self.poll(response["ETag"]).status_code, 304)
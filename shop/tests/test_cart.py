@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from ..models import Cart, CartItem, Product
+from .base import ShopTestCase
+
+
+class CartTotalsTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cart = Cart.objects.create(user=self.customer)
+
+    def test_items_keep_totals_current(self):
+        shirt = self.make_variant(price="100.00")
+        hat = self.make_variant(price="25.00")
+
+        self.cart.add(shirt, 2)
+        self.cart.add(hat, 1)
+        self.cart.add(shirt, 1)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_items_field, 4)
+        self.assertEqual(self.cart.total_price_field, Decimal("325.00"))
+
+        CartItem.objects.get(cart=self.cart, product_variant=hat).delete()
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_items_field, 3)
+        self.assertEqual(self.cart.total_price_field, Decimal("300.00"))
+
+    def test_apply_delta(self):
+        self.cart.apply_delta(2, Decimal("40.00"))
+        self.cart.apply_delta(-1, Decimal("-20.00"))
+
+        self.assertEqual(self.cart.total_items_field, 1)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_items_field, 1)
+        self.assertEqual(self.cart.total_price_field, Decimal("20.00"))
+
+    def test_update_totals_repairs_drift(self):
+        shirt = self.make_variant(price="100.00")
+        self.cart.add(shirt, 2)
+        # Price changes do not touch the stored totals
+        Product.objects.filter(pk=shirt.product_id).update(price=Decimal("80.00"))
+
+        self.assertEqual(self.cart.update_totals(), (2, Decimal("160.00")))
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price_field, Decimal("160.00"))
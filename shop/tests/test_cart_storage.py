@@ -0,0 +1,48 @@
+from decimal import Decimal
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from django.urls import reverse
+
+from .. import cart_storage
+from ..models import Cart
+from .base import ShopTestCase
+
+
+class SessionCartTests(ShopTestCase):
+    def anonymous_request(self):
+        request = RequestFactory().get("/")
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.user = AnonymousUser()
+        return request
+
+    def test_anonymous_add_to_cart_writes_no_cart_row(self):
+        variant = self.make_variant(price="30.00")
+        for _ in range(2):
+            response = self.client.post(
+                reverse("shop:add_to_cart"), {"product_variant_id": variant.pk, "quantity": 1}
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.client.session[cart_storage.SESSION_CART_KEY], {str(variant.pk): 2})
+
+    def test_checkout_promotes_the_session_cart_once(self):
+        shirt = self.make_variant(price="30.00")
+        hat = self.make_variant(price="10.00")
+        request = self.anonymous_request()
+        cart = cart_storage.get_cart(request)
+        cart.add(shirt, 2)
+        cart.add(hat, 1)
+        self.assertEqual((cart.total_items, cart.total_price), (3, Decimal("70.00")))
+
+        promoted = cart_storage.promote(request)
+        self.assertEqual(promoted.total_items_field, 3)
+        self.assertEqual(promoted.total_price_field, Decimal("70.00"))
+        self.assertNotIn(cart_storage.SESSION_CART_KEY, request.session)
+
+        # Later changes go to the promoted cart
+        self.assertEqual(cart_storage.get_cart(request), promoted)
+        self.assertEqual(cart_storage.promote(request), promoted)
+        self.assertEqual(Cart.objects.count(), 1)
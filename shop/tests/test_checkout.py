@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+from .. import reservations, shipping
+from ..checkout import CheckoutError
+from ..models import Cart, Order, VendorOrder, VendorShipping
+from .base import ShopTestCase
+
+
+class PlaceOrderTests(ShopTestCase):
+    def test_multi_vendor_totals_and_payouts(self):
+        north = self.make_vendor("north", commission_rate="10.00")
+        south = self.make_vendor("south", commission_rate="20.00")
+        # Vendors get default shipping settings; north falls back to the site rate
+        VendorShipping.objects.filter(vendor=north).delete()
+        VendorShipping.objects.update_or_create(
+            vendor=south, defaults={"shipping_rate_cairo": Decimal("30.00")}
+        )
+        shirt = self.make_variant(north, price="100.00")
+        hat = self.make_variant(south, price="50.00")
+        site_rate = shipping.site_rates()[0]
+
+        order = self.order({shirt.pk: 2, hat.pk: 1})
+
+        self.assertEqual(order.subtotal, Decimal("250.00"))
+        self.assertEqual(order.shipping_cost, site_rate + Decimal("30.00"))
+        self.assertEqual(order.grand_total, order.subtotal + order.shipping_cost)
+        self.assertEqual(order.items.count(), 2)
+        payouts = {
+            vendor_order.vendor_id: vendor_order
+            for vendor_order in VendorOrder.objects.filter(order=order)
+        }
+        self.assertEqual(payouts[north.pk].commission_amount, Decimal("20.00"))
+        self.assertEqual(payouts[north.pk].net_payout, Decimal("180.00") + site_rate)
+        self.assertEqual(payouts[south.pk].commission_amount, Decimal("10.00"))
+        self.assertEqual(payouts[south.pk].net_payout, Decimal("70.00"))
+        self.refresh(north, south, shirt, hat)
+        self.assertEqual(north.wallet_balance, payouts[north.pk].net_payout)
+        self.assertEqual(south.wallet_balance, payouts[south.pk].net_payout)
+        self.assertEqual((shirt.stock_quantity, hat.stock_quantity), (8, 9))
+
+    def test_insufficient_stock_rolls_back(self):
+        vendor = self.make_vendor("north")
+        plenty = self.make_variant(vendor, stock=10)
+        scarce = self.make_variant(vendor, stock=1)
+
+        with self.assertRaises(CheckoutError):
+            self.order({plenty.pk: 2, scarce.pk: 2})
+
+        self.refresh(plenty, scarce, vendor)
+        self.assertEqual((plenty.stock_quantity, scarce.stock_quantity), (10, 1))
+        self.assertEqual(vendor.wallet_balance, Decimal("0"))
+        self.assertFalse(Order.objects.exists())
+
+    def test_held_stock_of_other_carts_is_not_sold(self):
+        variant = self.make_variant(stock=3)
+        other = Cart.objects.create(session_key="other")
+        reservations.reserve(other, {variant.pk: 2})
+
+        with self.assertRaises(CheckoutError):
+            self.order({variant.pk: 2})
+        self.order({variant.pk: 1})
+
+        self.refresh(variant)
+        self.assertEqual((variant.stock_quantity, variant.reserved_quantity), (2, 2))
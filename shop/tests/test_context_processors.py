@@ -0,0 +1,34 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from .. import context_processors
+from ..models import Category
+from .base import ShopTestCase
+
+
+class ContextProcessorTests(ShopTestCase):
+    def request(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        request.session = {}
+        return request
+
+    def test_categories_are_lazy_and_cached(self):
+        with self.assertNumQueries(0):
+            context = context_processors.categories_processor(self.request(self.customer))
+        self.assertEqual([c.name for c in context["all_categories"]], ["Shirts"])
+        with self.assertNumQueries(0):
+            context = context_processors.categories_processor(self.request(self.customer))
+            self.assertEqual(len(context["all_categories"]), 1)
+
+        Category.objects.create(name="Hats")
+        context = context_processors.categories_processor(self.request(self.customer))
+        self.assertEqual([c.name for c in context["all_categories"]], ["Hats", "Shirts"])
+
+    def test_notifications_are_only_loaded_when_used(self):
+        anonymous = self.request(AnonymousUser())
+        self.assertEqual(context_processors.notifications_context(anonymous), {})
+        with self.assertNumQueries(0):
+            context = context_processors.notifications_context(self.request(self.customer))
+        self.assertEqual(context["unread_notifications_count"], 0)
+        self.assertEqual(list(context["recent_notifications"]), [])
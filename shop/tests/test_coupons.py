@@ -0,0 +1,51 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from ..coupons import CouponError
+from ..models import Coupon, CouponRedemption, Order
+from .base import ShopTestCase
+
+
+class CouponLimitTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.variant = self.make_variant(price="100.00")
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code="SAVE10",
+            discount_type="percentage",
+            discount_value=Decimal("10.00"),
+            valid_from=now - timedelta(days=1),
+            valid_to=now + timedelta(days=1),
+            max_uses=2,
+            max_uses_per_user=1,
+        )
+
+    def test_discount_and_redemption_are_recorded(self):
+        order = self.order({self.variant.pk: 1}, coupon=self.coupon)
+
+        self.assertEqual(order.discount_amount, Decimal("10.00"))
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 1)
+        self.assertTrue(CouponRedemption.objects.filter(order=order).exists())
+
+    def test_per_user_limit_rolls_back_the_order(self):
+        self.order({self.variant.pk: 1}, coupon=self.coupon)
+
+        with self.assertRaises(CouponError):
+            self.order({self.variant.pk: 1}, coupon=self.coupon)
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.refresh(self.variant, self.coupon)
+        self.assertEqual(self.variant.stock_quantity, 9)
+        self.assertEqual(self.coupon.times_used, 1)
+
+    def test_total_limit(self):
+        self.order({self.variant.pk: 1}, coupon=self.coupon, user=None)
+        self.order({self.variant.pk: 1}, coupon=self.coupon, user=None)
+
+        with self.assertRaises(CouponError):
+            self.order({self.variant.pk: 1}, coupon=self.coupon, user=None)
+        self.assertEqual(Order.objects.count(), 2)
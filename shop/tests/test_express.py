@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+from django.test import RequestFactory
+from django.urls import reverse
+
+from ..express import buy_now_url, checkout_url, get_express_cart, make_token
+from ..models import Cart, CartItem
+from .base import ShopTestCase
+
+
+class ExpressToCartTests(ShopTestCase):
+    def test_moves_the_buy_now_line_into_the_cart_on_post_only(self):
+        variant = self.make_variant()
+        self.client.force_login(self.customer)
+        url = reverse("shop:express_to_cart")
+        data = {"express": make_token(variant, 2)}
+
+        self.assertEqual(self.client.get(url, data).status_code, 405)
+        self.assertRedirects(
+            self.client.post(url, data), reverse("shop:cart_view"), fetch_redirect_response=False
+        )
+
+        item = CartItem.objects.get(cart__user=self.customer)
+        self.assertEqual((item.product_variant_id, item.quantity), (variant.pk, 2))
+
+    def test_the_token_carries_a_single_line_cart(self):
+        variant = self.make_variant(price="40.00")
+        url = buy_now_url(variant, 2)
+        cart = get_express_cart(RequestFactory().get(url))
+        self.assertEqual(cart.lines, {str(variant.pk): 2})
+        self.assertEqual(cart.total_price, Decimal("80.00"))
+        self.assertEqual(checkout_url(cart), url)
+        self.assertFalse(Cart.objects.exists())
+
+        tampered = make_token(variant, 2)[:-2] + "xx"
+        self.assertIsNone(get_express_cart(RequestFactory().get("/", {"express": tampered})))
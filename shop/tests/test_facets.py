@@ -0,0 +1,63 @@
+from decimal import Decimal
+
+from django.http import QueryDict
+from django.test import RequestFactory
+
+from .. import facets
+from ..models import Brand, Product
+from ..pagination import CursorPage, paginate
+from ..views import _filter_and_sort_products
+from .base import ShopTestCase
+
+
+class FacetTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.brand = Brand.objects.create(name="Acme")
+        self.full_price = self.make_variant(price="120.00").product
+        self.on_sale = self.make_variant(price="120.00").product
+        self.on_sale.sale_price = Decimal("40.00")
+        self.on_sale.brand = self.brand
+        self.on_sale.save()
+
+    def buckets(self, params=None):
+        result = facets.get_facets(category=self.category, params=params)
+        return {str(bucket["min"]): bucket["count"] for bucket in result["price_buckets"]}
+
+    def test_counts_follow_the_active_filters(self):
+        result = facets.get_facets(category=self.category)
+        self.assertEqual([(b.name, b.product_count) for b in result["brands"]], [("Acme", 1)])
+        self.assertEqual([(c.name, c.product_count) for c in result["colors"]], [("Black", 2)])
+
+        result = facets.get_facets(category=self.category, params={"brand": "acme"})
+        self.assertEqual([(c.name, c.product_count) for c in result["colors"]], [("Black", 1)])
+
+    def test_prices_are_bucketed_and_filtered_on_the_sale_price(self):
+        self.assertEqual(self.buckets()["25"], 1)
+        self.assertEqual(self.buckets()["100"], 1)
+        result = facets.get_facets(category=self.category)
+        self.assertEqual(result["price_range"]["price__min"], Decimal("40.00"))
+
+        # The listing agrees with the bucket counts
+        params = QueryDict("min_price=25&max_price=50")
+        self.assertEqual(self.buckets(params)["25"], 1)
+        listing = _filter_and_sort_products(Product.storefront(), params)
+        self.assertEqual(list(listing), [self.on_sale])
+        listing = _filter_and_sort_products(Product.storefront(), QueryDict("sort=price_low"))
+        self.assertEqual(list(listing), [self.on_sale, self.full_price])
+
+        # Sorted by price, the listing still pages by cursor
+        page = paginate(RequestFactory().get("/", {"sort": "price_low"}), listing, 1)
+        self.assertIsInstance(page, CursorPage)
+        self.assertEqual(list(page), [self.on_sale])
+        page = paginate(RequestFactory().get(f"/?{page.next_query}"), listing, 1)
+        self.assertEqual(list(page), [self.full_price])
+
+    def test_counts_are_cached_until_a_product_changes(self):
+        self.buckets()
+        with self.assertNumQueries(0):
+            self.buckets()
+
+        self.full_price.sale_price = Decimal("30.00")
+        self.full_price.save()
+        self.assertEqual(self.buckets()["25"], 2)
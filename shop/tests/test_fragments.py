@@ -0,0 +1,46 @@
+from collections import Counter
+
+from .. import fragments
+from .base import ShopTestCase
+
+
+class FragmentTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.builds = Counter()
+
+    def sections(self):
+        def builder(section):
+            def build():
+                self.builds[section] += 1
+                return f"{section} #{self.builds[section]}"
+
+            return build
+
+        return fragments.get_sections(
+            {section: builder(section) for section in ("featured", "recent", "categories")}
+        )
+
+    def test_only_stale_sections_are_rebuilt(self):
+        self.sections()
+        self.assertEqual(self.sections()["featured"], "featured #1")
+
+        fragments.bump("featured")
+        self.assertEqual(
+            self.sections(),
+            {"featured": "featured #2", "recent": "recent #1", "categories": "categories #1"},
+        )
+
+    def test_stock_changes_bump_the_rails_of_their_product(self):
+        variant = self.make_variant()
+        self.sections()
+
+        variant.stock_quantity = 0
+        variant.save()
+        self.sections()
+        self.assertEqual(self.builds, {"featured": 1, "recent": 2, "categories": 1})
+
+        variant.product.is_featured = True
+        variant.product.save()
+        self.sections()
+        self.assertEqual(self.builds, {"featured": 2, "recent": 3, "categories": 2})
@@ -0,0 +1,44 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from ..idempotency import PENDING, SubmissionKey
+from .base import ShopTestCase
+
+
+class SubmissionKeyTests(ShopTestCase):
+    def submission(self):
+        request = RequestFactory().post("/", {"idempotency_key": "form-1"})
+        request.user = self.customer
+        return SubmissionKey.for_request(request, "checkout")
+
+    def test_repeat_gets_pending_then_the_result(self):
+        first = self.submission()
+        self.assertIsNone(first.claim())
+
+        self.assertEqual(self.submission().claim(), PENDING)
+        first.complete("ORD-1")
+        self.assertEqual(self.submission().claim(), "ORD-1")
+
+    def test_released_key_can_be_claimed_again(self):
+        first = self.submission()
+        first.claim()
+        first.release()
+
+        self.assertIsNone(self.submission().claim())
+
+    def test_anonymous_requests_without_a_session_are_not_deduplicated(self):
+        def anonymous_submission(save_session):
+            request = RequestFactory().post("/", {"city": "INSIDE_CAIRO"})
+            request.user = AnonymousUser()
+            request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+            if save_session:
+                request.session.save()
+            return SubmissionKey.for_request(request, "checkout")
+
+        self.assertIsNone(anonymous_submission(False))
+        # The same data posted from two sessions are two submissions
+        first, second = anonymous_submission(True), anonymous_submission(True)
+        self.assertNotEqual(first.key, second.key)
@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Cart, Wishlist, WishlistItem
+from .base import ShopTestCase
+
+
+class LoginMergeTests(ShopTestCase):
+    def log_in_with(self, cart_lines, wishlist=()):
+        session = self.client.session
+        session["cart"] = {str(variant_id): qty for variant_id, qty in cart_lines.items()}
+        session["wishlist"] = list(wishlist)
+        session.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.force_login(self.customer)
+        return len(queries)
+
+    def test_session_cart_and_wishlist_are_merged(self):
+        shirt = self.make_variant(price="100.00")
+        hat = self.make_variant(price="25.00")
+        cart = Cart.objects.create(user=self.customer)
+        cart.add(shirt, 1)
+        wishlist = Wishlist.objects.create(user=self.customer)
+        WishlistItem.objects.create(wishlist=wishlist, product=shirt.product)
+
+        self.log_in_with({shirt.pk: 2, hat.pk: 1, 999999: 5}, [shirt.product_id, hat.product_id])
+
+        self.assertEqual(
+            dict(cart.items.values_list("product_variant_id", "quantity")),
+            {shirt.pk: 3, hat.pk: 1},
+        )
+        cart.refresh_from_db()
+        self.assertEqual(cart.total_items_field, 4)
+        self.assertEqual(cart.total_price_field, Decimal("325.00"))
+        self.assertEqual(
+            set(wishlist.items.values_list("product_id", flat=True)),
+            {shirt.product_id, hat.product_id},
+        )
+        self.assertNotIn("cart", self.client.session)
+        self.assertNotIn("wishlist", self.client.session)
+
+    def test_merge_queries_do_not_grow_with_the_lines(self):
+        variants = [self.make_variant() for _ in range(6)]
+        few = self.log_in_with({v.pk: 1 for v in variants[:2]}, [variants[0].product_id])
+        self.client.logout()
+        Cart.objects.all().delete()
+        Wishlist.objects.all().delete()
+        many = self.log_in_with({v.pk: 1 for v in variants}, [v.product_id for v in variants])
+        self.assertEqual(many, few)
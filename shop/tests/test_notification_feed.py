@@ -0,0 +1,45 @@
+from freelancing.models import Notification as FreelancingNotification
+
+from .. import notification_feed
+from ..models import Notification
+from .base import ShopTestCase
+
+
+class NotificationFeedTests(ShopTestCase):
+    def notify(self, model, title, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return model.objects.create(
+                user=self.customer,
+                notification_type="general" if model is Notification else "message_received",
+                title=title,
+                message=title,
+                **fields,
+            )
+
+    def feed(self):
+        recent, unread = notification_feed.get_feed(self.customer)
+        return [notification.title for notification in recent], unread
+
+    def test_both_apps_form_one_cached_feed(self):
+        self.notify(Notification, "Order shipped")
+        self.notify(FreelancingNotification, "New message")
+        self.notify(Notification, "Sale", is_read=True)
+
+        self.assertEqual(self.feed(), (["Sale", "New message", "Order shipped"], 2))
+        with self.assertNumQueries(0):
+            self.feed()
+
+    def test_signals_keep_the_feed_current(self):
+        first = self.notify(Notification, "Order shipped")
+        self.assertEqual(self.feed(), (["Order shipped"], 1))
+
+        self.notify(FreelancingNotification, "New message")
+        self.assertEqual(self.feed(), (["New message", "Order shipped"], 2))
+
+        first.is_read = True
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save()
+        self.assertEqual(self.feed()[1], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.feed(), (["New message"], 1))
@@ -0,0 +1,57 @@
+from django.test import RequestFactory
+
+from ..models import Product
+from ..pagination import CursorPage, CursorPaginator, paginate
+from .base import ShopTestCase
+
+
+class CursorPaginatorTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        for price in ("10.00", "20.00", "20.00", "30.00", "40.00"):
+            self.make_variant(price=price)
+        self.products = Product.objects.all()
+
+    def walk(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append([product.pk for product in page])
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once_in_order(self):
+        paginator = CursorPaginator(self.products, 2, ["-price"])
+        expected = list(self.products.order_by("-price", "-pk").values_list("pk", flat=True))
+
+        pages = self.walk(paginator)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_previous_cursor_returns_the_previous_page(self):
+        paginator = CursorPaginator(self.products, 2, ["price"])
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+
+        back = paginator.get_page(second.previous_cursor)
+
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_foreign_or_tampered_cursor_starts_over(self):
+        by_price = CursorPaginator(self.products, 2, ["price"])
+        by_name = CursorPaginator(self.products, 2, ["name"])
+        cursor = by_price.get_page().next_cursor
+
+        self.assertEqual(list(by_name.get_page(cursor)), list(by_name.get_page()))
+        self.assertEqual(list(by_price.get_page(cursor + "x")), list(by_price.get_page()))
+
+    def test_nullable_ordering_falls_back_to_numbered_pages(self):
+        request = RequestFactory().get("/", {"sort": "brand"})
+
+        page = paginate(request, self.products.order_by("brand"), 2)
+
+        self.assertNotIsInstance(page, CursorPage)
+        self.assertEqual(page.paginator.count, 5)
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Product
+from ..views import _serialize_products
+from .base import ShopTestCase
+
+
+class ProductCardTests(ShopTestCase):
+    def serialize(self):
+        request = RequestFactory().get("/")
+        request.session = {}
+        request.user = AnonymousUser()
+        with CaptureQueriesContext(connection) as queries:
+            cards = _serialize_products(Product.objects.order_by("pk"), request)
+        return cards, len(queries)
+
+    def test_cards_load_in_a_fixed_number_of_queries(self):
+        vendor = self.make_vendor("north")
+        self.make_variant(vendor=vendor)
+        self.make_variant(stock=0)
+        cards, few = self.serialize()
+        self.assertEqual([card["is_in_stock"] for card in cards], [True, False])
+        self.assertEqual([card["vendor_name"] for card in cards], ["north", None])
+        self.assertEqual(cards[0]["category"], "Shirts")
+
+        for _ in range(4):
+            self.make_variant(vendor=vendor)
+        cards, many = self.serialize()
+        self.assertEqual(len(cards), 6)
+        self.assertEqual(many, few)
@@ -0,0 +1,40 @@
+from .. import product_documents
+from .base import ShopTestCase
+
+
+class ProductDocumentTests(ShopTestCase):
+    def test_renaming_a_label_refreshes_cached_documents(self):
+        product = self.make_variant().product
+        self.assertEqual(
+            [color.name for color in product_documents.get_document(product.slug)["colors"]],
+            ["Black"],
+        )
+
+        self.color.name = "Jet Black"
+        self.color.save()
+        self.subcategory.name = "T-Shirts"
+        self.subcategory.save()
+
+        document = product_documents.get_document(product.slug)
+        self.assertEqual([color.name for color in document["colors"]], ["Jet Black"])
+        self.assertEqual(document["product"].subcategory.name, "T-Shirts")
+
+    def test_documents_are_cached_until_the_stock_changes(self):
+        variant = self.make_variant(stock=2)
+        slug = variant.product.slug
+        self.assertEqual(product_documents.get_document(slug)["variants"], [variant])
+        with self.assertNumQueries(0):
+            product_documents.get_document(slug)
+
+        # Orders update the stock with a queryset update, bypassing the signals
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order({variant.pk: 2})
+        document = product_documents.get_document(slug)
+        self.assertEqual(document["variants"], [])
+        self.assertFalse(document["product"].is_in_stock)
+
+    def test_hidden_products_have_no_document(self):
+        product = self.make_variant().product
+        product.is_active = False
+        product.save()
+        self.assertIsNone(product_documents.get_document(product.slug))
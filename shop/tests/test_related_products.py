@@ -0,0 +1,55 @@
+from collections import Counter
+from unittest import mock
+
+from .. import related_products
+from ..models import Brand, Category, SubCategory
+from .base import ShopTestCase
+
+
+class RelatedProductTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.brand = Brand.objects.create(name="Acme")
+        other_category = Category.objects.create(name="Shoes")
+        self.elsewhere = SubCategory.objects.create(category=other_category, name="Boots")
+
+    def test_ranks_attribute_matches_and_co_purchases(self):
+        product = self.make_product("Linen tee", brand=self.brand)
+        twin = self.make_product("Cotton tee", brand=self.brand)
+        sibling = self.make_product("Pocket tee", price="500.00")
+        same_brand = self.make_product(
+            "Acme boot",
+            category=self.elsewhere.category,
+            subcategory=self.elsewhere,
+            brand=self.brand,
+        )
+        bought_with = self.make_product(
+            "Plain boot", category=self.elsewhere.category, subcategory=self.elsewhere
+        )
+        unrelated = self.make_product(
+            "Other boot",
+            category=self.elsewhere.category,
+            subcategory=self.elsewhere,
+            price="500.00",
+        )
+        co_purchases = {product.pk: Counter({bought_with.pk: 3})}
+        with mock.patch.object(related_products, "co_purchase_counts", return_value=co_purchases):
+            related_products.compute_related()
+
+        # 40 + 10 + 25 + 10, 25 + 10, 40 + 10 and 10 + 3 * 20
+        self.assertEqual(
+            related_products.related_ids(product.pk),
+            [twin.pk, bought_with.pk, sibling.pk, same_brand.pk],
+        )
+        self.assertNotIn(unrelated.pk, related_products.related_ids(product.pk))
+
+    def test_candidates_are_limited_to_the_best_matches(self):
+        product = self.make_product("Linen tee", brand=self.brand)
+        same_band = [self.make_product(f"Tee {n}") for n in range(3)]
+        other_band = [self.make_product(f"Dear tee {n}", price="900.00") for n in range(3)]
+        self.make_product("Boot", category=self.elsewhere.category, subcategory=self.elsewhere)
+
+        candidates = related_products.candidate_ids(
+            product.pk, related_products._load_products()[product.pk], limit=4
+        )
+        self.assertEqual(candidates, [p.pk for p in reversed(same_band)] + [other_band[-1].pk])
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.utils import timezone
+
+from .. import facets, reservations, variant_matrix
+from ..models import Cart, StockReservation
+from .base import ShopTestCase
+
+
+class StockHoldTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cart = Cart.objects.create(user=self.customer)
+
+    def test_order_releases_holds_of_lines_removed_after_reserving(self):
+        v1, v2 = self.make_variant(), self.make_variant()
+        self.assertEqual(reservations.reserve(self.cart, {v1.pk: 3, v2.pk: 2}), [])
+
+        self.order({v1.pk: 1}, reserved_for=self.cart)
+
+        self.refresh(v1, v2)
+        self.assertEqual((v1.stock_quantity, v1.reserved_quantity), (9, 0))
+        self.assertEqual((v2.stock_quantity, v2.reserved_quantity), (10, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_hold_blocks_other_carts_until_released(self):
+        variant = self.make_variant(stock=3)
+        other = Cart.objects.create(session_key="other")
+
+        self.assertEqual(reservations.reserve(self.cart, {variant.pk: 2}), [])
+        self.assertEqual(reservations.reserve(other, {variant.pk: 2}), [variant.pk])
+
+        reservations.release(self.cart)
+        self.assertEqual(reservations.reserve(other, {variant.pk: 2}), [])
+        variant.refresh_from_db()
+        self.assertEqual(variant.reserved_quantity, 2)
+
+    def test_expired_holds_are_swept(self):
+        variant = self.make_variant(stock=3)
+        reservations.reserve(self.cart, {variant.pk: 3})
+        self.cart.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(reservations.sweep_expired(), 1)
+
+        variant.refresh_from_db()
+        self.assertEqual(variant.reserved_quantity, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_held_stock_is_not_available_to_others(self):
+        variant = self.make_variant(stock=2)
+        product = variant.product
+        cell = variant_matrix.get_matrix(product.pk)["variant_ids"].index(variant.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.reserve(self.cart, {variant.pk: 2})
+
+        variant.refresh_from_db()
+        self.assertEqual(variant.available_quantity, 0)
+        self.assertFalse(product.is_in_stock)
+        self.assertEqual(variant_matrix.get_matrix(product.pk)["stock"][cell], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.release(self.cart)
+
+        self.assertTrue(product.is_in_stock)
+        self.assertEqual(variant_matrix.get_matrix(product.pk)["stock"][cell], 2)
+
+    def test_reserving_again_replaces_the_holds(self):
+        v1, v2 = self.make_variant(stock=3), self.make_variant(stock=3)
+
+        self.assertEqual(reservations.reserve(self.cart, {v1.pk: 2}), [])
+        self.assertEqual(reservations.reserve(self.cart, {v1.pk: 1, v2.pk: 3}), [])
+        self.assertEqual(reservations.reserve(self.cart, {v1.pk: 1, v2.pk: 3}), [])
+
+        self.refresh(v1, v2)
+        self.assertEqual((v1.reserved_quantity, v2.reserved_quantity), (1, 3))
+        self.assertEqual(
+            dict(self.cart.reservations.values_list("product_variant_id", "quantity")),
+            {v1.pk: 1, v2.pk: 3},
+        )
+
+    def test_selling_what_other_carts_do_not_hold_reports_sold_out(self):
+        variant = self.make_variant(stock=3)
+        reservations.reserve(Cart.objects.create(session_key="other"), {variant.pk: 2})
+
+        with patch.object(facets, "refresh_product") as refresh_product:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.order({variant.pk: 1})
+
+        refresh_product.assert_called_once_with(variant.product_id)
+
+    def test_cart_delete_releases_holds(self):
+        variant = self.make_variant(stock=3)
+        reservations.reserve(self.cart, {variant.pk: 2})
+
+        self.cart.delete()
+
+        variant.refresh_from_db()
+        self.assertEqual(variant.reserved_quantity, 0)
@@ -0,0 +1,35 @@
+from ..models import ProductSearchToken
+from ..search import DatabaseSearchBackend, search_product_ids
+from .base import ShopTestCase
+
+
+class SearchTests(ShopTestCase):
+    def test_name_matches_rank_above_description_matches(self):
+        mention = self.make_product("Plain tee", description="Goes with a linen jacket")
+        jacket = self.make_product("Linen jacket")
+
+        self.assertEqual(search_product_ids("jacket"), [jacket.pk, mention.pk])
+
+    def test_every_term_must_match_and_the_last_is_a_prefix(self):
+        trousers = self.make_product("Cotton trousers")
+        self.make_product("Cotton tee")
+
+        self.assertEqual(search_product_ids("cotton tro"), [trousers.pk])
+        self.assertEqual(search_product_ids("wool tro"), [])
+
+    def test_arabic_letter_variants_match(self):
+        product = self.make_product("أحذية رياضية")
+
+        self.assertEqual(search_product_ids("احذيه"), [product.pk])
+
+    def test_scans_until_the_index_is_built(self):
+        jacket = self.make_product("Linen jacket")
+        ProductSearchToken.objects.all().delete()
+        backend = DatabaseSearchBackend()
+
+        # The scan matches the query as one substring
+        self.assertEqual(backend.search("jacket linen"), [])
+        self.assertEqual(backend.search("linen jack"), [jacket.pk])
+
+        backend.rebuild()
+        self.assertEqual(backend.search("jacket linen"), [jacket.pk])
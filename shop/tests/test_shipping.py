@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from .. import shipping
+from ..models import Cart, VendorShipping
+from .base import ShopTestCase
+
+
+class ShippingQuoteTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.north = self.make_vendor("north")
+        self.settings = VendorShipping.objects.get(vendor=self.north)
+        self.settings.shipping_rate_cairo = Decimal("30.00")
+        self.settings.shipping_rate_outside_cairo = Decimal("45.00")
+        self.settings.free_shipping_threshold = Decimal("200.00")
+        self.settings.save()
+
+    def test_quotes_per_vendor(self):
+        cairo, outside = shipping.site_rates()
+        cart = Cart.objects.create(user=self.customer)
+        cart.add(self.make_variant(self.north, price="50.00"), 2)
+        cart.add(self.make_variant(price="20.00"), 1)
+
+        quote = shipping.quote_cart(cart, "INSIDE_CAIRO")
+        self.assertEqual(
+            quote.subtotals, {self.north.pk: Decimal("100.00"), None: Decimal("20.00")}
+        )
+        self.assertEqual(quote.charges, {self.north.pk: Decimal("30.00"), None: cairo})
+
+        quote = shipping.quote({self.north.pk: Decimal("250.00")}, shipping.OUTSIDE_CAIRO)
+        self.assertEqual(quote.total, Decimal("0.00"))
+        quote = shipping.quote(
+            {self.north.pk: Decimal("50.00"), None: Decimal("5.00")}, shipping.OUTSIDE_CAIRO
+        )
+        self.assertEqual(quote.total, Decimal("45.00") + outside)
+
+    def test_vendor_rates_are_cached_until_they_change(self):
+        shipping.quote({self.north.pk: Decimal("50.00")}, "INSIDE_CAIRO")
+        with self.assertNumQueries(0):
+            quote = shipping.quote({self.north.pk: Decimal("50.00")}, "INSIDE_CAIRO")
+        self.assertEqual(quote.total, Decimal("30.00"))
+
+        self.settings.shipping_rate_cairo = Decimal("35.00")
+        self.settings.save()
+        quote = shipping.quote({self.north.pk: Decimal("50.00")}, "INSIDE_CAIRO")
+        self.assertEqual(quote.total, Decimal("35.00"))
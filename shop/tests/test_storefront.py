@@ -0,0 +1,37 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from .. import autocomplete, facets, search
+from ..models import Product
+from .base import ShopTestCase
+
+
+class StorefrontTests(ShopTestCase):
+    def test_demo_products_stay_off_the_storefront(self):
+        shown = self.make_variant().product
+        demo = self.make_variant().product
+        demo.name = "Test shirt"
+        demo.save()
+        self.assertFalse(demo.is_visible)
+
+        self.assertEqual(list(Product.storefront()), [shown])
+        rows = facets.get_document("all")["rows"]
+        self.assertIn(shown.pk, rows)
+        self.assertNotIn(demo.pk, rows)
+        self.assertEqual(search.search_product_ids("shirt"), [shown.pk])
+        self.assertEqual(search.ranked_products([demo.pk, shown.pk]), [shown])
+        self.assertEqual(autocomplete.suggest("test shirt"), [])
+
+    def test_visibility_backfill_refreshes_the_indexes(self):
+        product = self.make_variant().product
+        # Renamed without save(), so the flag is stale
+        Product.objects.filter(pk=product.pk).update(name="Dummy shirt")
+        self.assertEqual(search.search_product_ids("product"), [product.pk])
+
+        call_command("backfill_product_visibility", stdout=StringIO())
+
+        product.refresh_from_db()
+        self.assertFalse(product.is_visible)
+        self.assertEqual(search.search_product_ids("product"), [])
+        self.assertNotIn(product.pk, facets.get_document("all")["rows"])
@@ -0,0 +1,44 @@
+from .. import variant_matrix
+from ..models import Cart
+from ..reservations import reserve
+from .base import ShopTestCase
+
+
+def stock_of(variant):
+    matrix = variant_matrix.get_matrix(variant.product_id)
+    return [cell["stock"] for cell in variant_matrix.iter_cells(matrix, in_stock=False)]
+
+
+class VariantMatrixTests(ShopTestCase):
+    def test_stock_changes_rebuild_the_matrix(self):
+        variant = self.make_variant(stock=5)
+        self.assertEqual(stock_of(variant), [5])
+
+        variant.stock_quantity = 7
+        variant.save()
+        self.assertEqual(stock_of(variant), [7])
+
+        # Holds and orders update the stock with queryset updates
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve(Cart.objects.create(user=self.customer), {variant.pk: 3})
+        self.assertEqual(stock_of(variant), [4])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order({variant.pk: 2})
+        self.assertEqual(stock_of(variant), [2])
+
+    def test_a_matrix_built_before_a_change_is_not_served(self):
+        variant = self.make_variant(stock=5)
+        stale_key = variant_matrix._key(variant.product_id)
+        stale = variant_matrix.build_matrix(variant.product_id)
+
+        variant.stock_quantity = 1
+        variant.save()
+        variant_matrix.cache.set(stale_key, stale)
+        self.assertEqual(stock_of(variant), [1])
+
+    def test_hidden_products_have_no_matrix(self):
+        variant = self.make_variant()
+        variant.product.name = "Test product"
+        variant.product.save()
+        self.assertFalse(variant.product.is_visible)
+        self.assertIsNone(variant_matrix.get_matrix(variant.product_id))
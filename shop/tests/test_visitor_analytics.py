@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .. import visitor_analytics
+from ..models import VisitorSession, VisitorSketch
+from ..visitor_analytics import HyperLogLog
+from .base import ShopTestCase
+
+
+class VisitorAnalyticsTests(ShopTestCase):
+    def test_sketch_estimates_unique_counts(self):
+        hll = HyperLogLog()
+        for n in range(20000):
+            hll.add(f"session-{n}")
+            hll.add(f"session-{n}")  # Repeats are not counted again
+        self.assertAlmostEqual(hll.count(), 20000, delta=20000 * 0.03)
+
+        other = HyperLogLog()
+        for n in range(10000, 30000):
+            other.add(f"session-{n}")
+        hll.update(other)
+        self.assertAlmostEqual(hll.count(), 30000, delta=30000 * 0.03)
+
+    def test_dashboard_windows_merge_the_day_sketches(self):
+        now = timezone.now()
+        visitor_analytics.add_visits({f"today-{n}": now for n in range(100)})
+        visitor_analytics.add_visits(
+            {f"old-{n}": now - timedelta(days=3) for n in range(50)}
+            # Visitors of both days are counted once
+            | {f"today-{n}": now - timedelta(days=3) for n in range(20)}
+        )
+        visitor_analytics.add_visits(
+            {f"older-{n}": now - timedelta(days=20) for n in range(30)}
+        )
+
+        counts = visitor_analytics.visitor_counts()
+        self.assertAlmostEqual(counts["today"], 100, delta=2)
+        self.assertAlmostEqual(counts["last_week"], 150, delta=3)
+        self.assertAlmostEqual(counts["last_month"], 180, delta=4)
+        self.assertAlmostEqual(counts["all_time"], 180, delta=4)
+
+    def test_prune_keeps_the_all_time_sketch(self):
+        long_ago = timezone.now() - timedelta(days=visitor_analytics.SKETCH_RETENTION_DAYS + 1)
+        visitor_analytics.add_visits({"gone": long_ago})
+        VisitorSession.objects.create(session_key="gone")
+        VisitorSession.objects.filter(session_key="gone").update(last_activity=long_ago)
+        VisitorSession.objects.create(session_key="active")
+
+        self.assertEqual(visitor_analytics.prune(days=30), 1)
+        self.assertEqual(
+            list(VisitorSession.objects.values_list("session_key", flat=True)), ["active"]
+        )
+        self.assertEqual(
+            list(VisitorSketch.objects.values_list("period", flat=True)),
+            [VisitorSketch.ALL_TIME],
+        )
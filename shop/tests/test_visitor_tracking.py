@@ -0,0 +1,75 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import visitor_tracking
+from ..models import VisitorSession
+
+
+class VisitorTrackingTests(TestCase):
+    def setUp(self):
+        # Flushed by the tests, not by the background thread
+        patcher = patch.object(visitor_tracking, "_start_flusher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        visitor_tracking._recent.clear()
+        visitor_tracking._take()
+
+    def test_page_views_are_buffered_and_written_in_one_flush(self):
+        url = reverse("shop:get_cart_and_wishlist_counts")
+        self.client.get(url, headers={"User-Agent": "Mozilla/5.0"})
+        self.assertFalse(VisitorSession.objects.exists())
+
+        session_key = self.client.session.session_key
+        later = timezone.now() + timedelta(minutes=5)
+        visitor_tracking.record(session_key, None, "127.0.0.1", "Mozilla/5.0", later)
+        visitor_tracking.record("other", None, "127.0.0.2", "Mozilla/5.0", later)
+
+        self.assertEqual(visitor_tracking.flush(), 2)
+        self.assertEqual(
+            dict(VisitorSession.objects.values_list("session_key", "last_activity")),
+            {session_key: later, "other": later},
+        )
+        self.assertEqual(visitor_tracking.flush(), 0)
+
+    def test_written_sessions_keep_the_time_of_the_visit(self):
+        seen_at = timezone.now() - timedelta(minutes=5)
+        VisitorSession.objects.create(session_key="known")
+
+        visitor_tracking.write(
+            {key: (None, "127.0.0.1", "Firefox", seen_at) for key in ("known", "new")}
+        )
+
+        self.assertEqual(
+            set(VisitorSession.objects.values_list("last_activity", flat=True)), {seen_at}
+        )
+
+    def test_activity_is_recorded_once_per_resolution(self):
+        seen_at = timezone.localtime().replace(hour=12, minute=0)
+        record = visitor_tracking.record
+        step = timedelta(seconds=visitor_tracking.ACTIVITY_RESOLUTION)
+
+        self.assertTrue(record("s1", None, "127.0.0.1", "Mozilla/5.0", seen_at))
+        self.assertFalse(record("s1", None, "127.0.0.1", "Mozilla/5.0", seen_at + step / 2))
+        # Logging in changes the session's user
+        self.assertTrue(record("s1", 7, "127.0.0.1", "Mozilla/5.0", seen_at + step / 2))
+        self.assertTrue(record("s1", 7, "127.0.0.1", "Mozilla/5.0", seen_at + step * 2))
+
+    def test_a_new_day_is_always_recorded(self):
+        before_midnight = timezone.localtime().replace(hour=23, minute=59, second=50)
+        record = visitor_tracking.record
+        self.assertTrue(record("s1", None, "127.0.0.1", "Mozilla/5.0", before_midnight))
+        after_midnight = before_midnight + timedelta(seconds=20)
+        self.assertTrue(record("s1", None, "127.0.0.1", "Mozilla/5.0", after_midnight))
+
+    def test_bots_are_not_tracked(self):
+        for user_agent in ("", "Googlebot/2.1", "UptimeRobot/2.0", "curl/8.0"):
+            self.assertTrue(visitor_tracking.is_bot(user_agent))
+        self.assertFalse(visitor_tracking.is_bot("Mozilla/5.0 (Windows NT 10.0)"))
+
+        url = reverse("shop:get_cart_and_wishlist_counts")
+        self.client.get(url, headers={"User-Agent": "Googlebot/2.1"})
+        self.assertEqual(visitor_tracking.flush(), 0)
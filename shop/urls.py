@@ -19,6 +19,9 @@ urlpatterns = [
     path(
         "search/", views.search_products, name="search_products"
     ),  # GET for search results
+    path(
+        "api/autocomplete/", views.autocomplete_api, name="autocomplete_api"
+    ),  # GET for typeahead suggestions
     path(
         "api/products/",
         views.get_category_products_api,
@@ -122,6 +125,7 @@ urlpatterns = [
     path("orders/<str:order_number>/", views.order_detail, name="order_detail"),
     # Buy Now
     path("buy-now/", extra_views.buy_now_view, name="buy_now"),
+    path("buy-now/to-cart/", extra_views.express_to_cart, name="express_to_cart"),
     # Accounts Views
     path("register/vendor/", user_views.register_vendor, name="register_vendor"),
     path(
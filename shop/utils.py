@@ -1,20 +1,15 @@
 from decimal import Decimal
-from shop.models import Cart, ShippingAddress
-from constance import config
+from shop.cart_storage import get_cart
+from shop.models import ShippingAddress
+from shop.shipping import quote_cart
 from django.utils.translation import gettext_lazy as _
 
 def get_or_create_cart(request):
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key, user=None)
-    if created or not cart.total_price_field or not cart.total_items_field:
-        cart.update_totals()
-    return cart
+    """
+    The customer's Cart, or for anonymous visitors their session cart (see
+    shop.cart_storage), which is only written to the database at checkout.
+    """
+    return get_cart(request, create=True)
 
 def get_user_shipping_city(request):
     if request.user.is_authenticated:
@@ -31,41 +26,18 @@ def get_cart_totals(cart_instance, user_location_city=None, user_country_code=No
             'grand_total': Decimal('0.00'),
             'shipping_status_message': _("Free"),
         }
-    cart_instance.refresh_from_db()
-    cart_instance.update_totals()
+    cart_instance.refresh_from_db(fields=["total_items_field", "total_price_field"])
     cart_total_price = cart_instance.total_price_field
     cart_total_items = cart_instance.total_items_field
 
-    shipping_cost = Decimal('0.00')
-    shipping_status_message = _("Free")
-
-    SHIPPING_THRESHOLD = Decimal(str(config.SHIPPING_THRESHOLD))
-    SHIPPING_RATE_CAIRO = Decimal(str(config.SHIPPING_RATE_CAIRO))
-    SHIPPING_RATE_OUTSIDE_CAIRO = Decimal(str(config.SHIPPING_RATE_OUTSIDE_CAIRO))
-
-    base_shipping_rate = SHIPPING_RATE_CAIRO
-
-    if user_location_city:
-        # Match the exact choice value
-        if user_location_city == 'INSIDE_CAIRO':
-            base_shipping_rate = SHIPPING_RATE_CAIRO
-        elif user_location_city == 'OUTSIDE_CAIRO':
-            base_shipping_rate = SHIPPING_RATE_OUTSIDE_CAIRO
-        else:
-            # fallback if city value is unexpected
-            base_shipping_rate = SHIPPING_RATE_CAIRO
-    else:
-        # No location info; fallback message
+    shipping_status_message = ""
+    if not user_location_city:
+        # No location info; quote inside Cairo
         shipping_status_message = _("Shipping (Estimate)")
 
-    # Apply shipping cost if cart has items
     if cart_total_items > 0:
-        if cart_total_price < SHIPPING_THRESHOLD:
-            shipping_cost = base_shipping_rate
-            if shipping_cost > 0 and shipping_status_message == _("Free"):
-                shipping_status_message = ""
-        else:
-            shipping_cost = Decimal('0.00')
+        shipping_cost = quote_cart(cart_instance, user_location_city).total
+        if shipping_cost == 0:
             shipping_status_message = _("Free (Threshold Met)")
     else:
         shipping_cost = Decimal('0.00')
@@ -0,0 +1,205 @@
+"""
+Per-product variant availability matrix.
+
+The color / size selector on the product page needs, for every color × size
+combination, whether it is in stock, its price and its variant id. Instead of
+querying variants joined through Color and Size on every click, each product
+has a compact cached matrix:
+
+    colors:  [(color_id, name, hex_code), ...]    ordered like Color.Meta
+    sizes:   [(size_id, name), ...]               ordered like Size.Meta
+    cells (row-major, index = color_index * len(sizes) + size_index):
+        variant_ids  array("q")  0 where the combination does not exist
+        stock        array("l")  available: stock_quantity - reserved_quantity
+        available    bytearray   variant.is_available flags
+        adjustments  array("q")  price adjustment in cents
+        skus         list
+
+Any change to a product's variants (the ProductVariant signals, and the bulk
+stock and reservation updates that bypass them) drops its matrix by bumping a
+per-product version, so it is rebuilt on the next request. A request that
+was building the matrix from rows read before the change stores it under the
+old version, where it is never read: no stale matrix survives a change.
+"""
+
+from array import array
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from .models import Product, ProductVariant
+
+MATRIX_TIMEOUT = 60 * 60
+MATRIX_VERSION_KEY = "shop:variant_matrix:version"
+CENTS = Decimal("0.01")
+
+
+def _version():
+    version = cache.get(MATRIX_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(MATRIX_VERSION_KEY, version, None)
+    return version
+
+
+def _product_version_key(version, product_id):
+    return f"shop:variant_matrix:{version}:{product_id}:version"
+
+
+def _key(product_id):
+    version = _version()
+    product_version = cache.get(_product_version_key(version, product_id), 1)
+    return f"shop:variant_matrix:{version}:{product_id}:{product_version}"
+
+
+def _to_cents(amount):
+    return int((amount or Decimal("0")).quantize(CENTS) * 100)
+
+
+def build_matrix(product_id):
+    """Build the matrix for a storefront product, or ``None`` if there is none."""
+    product = (
+        Product.storefront()
+        .filter(pk=product_id)
+        .only("pk", "price", "sale_price", "is_on_sale")
+        .first()
+    )
+    if product is None:
+        return None
+
+    variants = list(
+        ProductVariant.objects.filter(
+            product_id=product_id, color__is_active=True, size__is_active=True
+        ).select_related("color", "size")
+    )
+    colors = sorted(
+        {(v.color_id, v.color.name, v.color.hex_code) for v in variants},
+        key=lambda color: color[1],
+    )
+    sizes = sorted(
+        {(v.size_id, v.size.name, v.size.size_type, v.size.order) for v in variants},
+        key=lambda size: (size[2], size[3], size[1]),
+    )
+    color_index = {color[0]: index for index, color in enumerate(colors)}
+    size_index = {size[0]: index for index, size in enumerate(sizes)}
+
+    cells = len(colors) * len(sizes)
+    matrix = {
+        "product_id": product_id,
+        "base_price": _to_cents(product.get_price),
+        "colors": colors,
+        "sizes": [(size[0], size[1]) for size in sizes],
+        "variant_ids": array("q", [0] * cells),
+        "stock": array("l", [0] * cells),
+        "available": bytearray(cells),
+        "adjustments": array("q", [0] * cells),
+        "skus": [None] * cells,
+    }
+    for variant in variants:
+        cell = color_index[variant.color_id] * len(sizes) + size_index[variant.size_id]
+        _fill(matrix, cell, variant)
+    return matrix
+
+
+def _fill(matrix, cell, variant):
+    matrix["variant_ids"][cell] = variant.pk
+    matrix["stock"][cell] = variant.available_quantity
+    matrix["available"][cell] = 1 if variant.is_available else 0
+    matrix["adjustments"][cell] = _to_cents(variant.price_adjustment)
+    matrix["skus"][cell] = variant.sku
+
+
+def get_matrix(product_id):
+    key = _key(product_id)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = build_matrix(product_id)
+        if matrix is not None:
+            cache.set(key, matrix, MATRIX_TIMEOUT)
+    return matrix
+
+
+def iter_cells(matrix, color_id=None, size_id=None, in_stock=True):
+    """Yield one dict per existing combination, optionally filtered."""
+    size_count = len(matrix["sizes"])
+    for ci, (cid, color_name, hex_code) in enumerate(matrix["colors"]):
+        if color_id is not None and cid != color_id:
+            continue
+        for si, (sid, size_name) in enumerate(matrix["sizes"]):
+            if size_id is not None and sid != size_id:
+                continue
+            cell = ci * size_count + si
+            variant_id = matrix["variant_ids"][cell]
+            stock = matrix["stock"][cell]
+            available = matrix["available"][cell] and stock > 0
+            if not variant_id or (in_stock and not available):
+                continue
+            price = Decimal(matrix["base_price"] + matrix["adjustments"][cell]) / 100
+            yield {
+                "id": variant_id,
+                "color_id": cid,
+                "color_name": color_name,
+                "size_id": sid,
+                "size_name": size_name,
+                "price": str(price.quantize(CENTS)),
+                "stock": stock,
+                "sku": matrix["skus"][cell],
+                "in_stock": bool(available),
+            }
+
+
+def as_json(matrix):
+    """The whole selector state in one payload: labels plus a stock grid."""
+    size_count = len(matrix["sizes"])
+    grid = []
+    for ci in range(len(matrix["colors"])):
+        row = []
+        for si in range(size_count):
+            cell = ci * size_count + si
+            if not matrix["variant_ids"][cell]:
+                row.append(None)
+                continue
+            in_stock = matrix["available"][cell] and matrix["stock"][cell] > 0
+            price = Decimal(matrix["base_price"] + matrix["adjustments"][cell]) / 100
+            row.append(
+                {
+                    "id": matrix["variant_ids"][cell],
+                    "stock": matrix["stock"][cell] if in_stock else 0,
+                    "price": str(price.quantize(CENTS)),
+                }
+            )
+        grid.append(row)
+    return {
+        "colors": [
+            {"id": cid, "name": name, "hex_code": hex_code}
+            for cid, name, hex_code in matrix["colors"]
+        ],
+        "sizes": [{"id": sid, "name": name} for sid, name in matrix["sizes"]],
+        "matrix": grid,
+    }
+
+
+# --- Invalidation ---
+
+
+def invalidate(product_id):
+    invalidate_many([product_id])
+
+
+def invalidate_many(product_ids):
+    """Drop the matrices of ``product_ids`` (rebuilt on the next read)."""
+    version = _version()
+    for product_id in product_ids:
+        version_key = _product_version_key(version, product_id)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, 2, None)
+
+
+def invalidate_all():
+    """Drop every matrix, e.g. after a Color or Size is renamed."""
+    try:
+        cache.incr(MATRIX_VERSION_KEY)
+    except ValueError:
+        cache.set(MATRIX_VERSION_KEY, 2, None)
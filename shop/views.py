@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, Http404
 from django.db.models import Q, Min, Max, Sum, Count, F
 from django.db.models.functions import TruncDay  # noqa
 from django.views.decorators.http import (
@@ -12,7 +12,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.db import transaction, models, connection
+from django.db import transaction, models, connection, IntegrityError
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger  # noqa
 import json
 from .forms import (
@@ -66,9 +66,38 @@ from .models import (  # noqa
     VendorOrder,
     ChatbotQuestion,
 )
+from .facets import get_facets
+from .badges import get_counts as get_badge_counts
+from .cart_storage import SessionCart, get_cart
+from .cart_storage import promote as promote_cart
+from .checkout import cart_lines, place_order
+from .express import checkout_url as express_checkout_url
+from .express import get_express_cart
+from .coupons import SESSION_COUPON_KEY, CouponError, applied_coupon, get_coupon
+from .coupons import check as check_coupon
+from .idempotency import PENDING as SUBMISSION_PENDING
+from .idempotency import SubmissionKey
+from .idempotency import new_key as new_submission_key
+from .notification_feed import invalidate as invalidate_notification_feed
+from .reservations import reserve as reserve_stock
+from .shipping import quote as quote_shipping
+from .shipping import quote_cart as quote_cart_shipping
+from .product_cards import card_queryset, load_product_cards
+from .product_documents import get_document as get_product_document
+from .product_documents import user_flags as product_user_flags
+from .autocomplete import suggest
+from .fragments import get_sections
+from .pagination import paginate
+from .search import ranked_products, search_product_ids
+from .variant_matrix import as_json as variant_matrix_json
+from .variant_matrix import get_matrix as get_variant_matrix
+from .variant_matrix import iter_cells as iter_variant_cells
 from decimal import Decimal
 import csv
-from django.http import HttpResponse
+import hashlib
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 from datetime import timedelta
 import uuid
 import logging
@@ -77,12 +106,27 @@ from constance import config
 from django.utils import timezone, translation
 from shop.models import Review
 from itertools import chain
+from collections import defaultdict
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
 
 # --- Helper Functions for Filtering/Sorting ---
+# The ``?sort=`` choices of the product listings; anything else falls back
+# to the listing's default (never pass the raw parameter to order_by)
+PRODUCT_SORTS = {
+    "name": ("name",),
+    # The price shoppers pay (annotated by the listings), like the price
+    # filters and the facet buckets
+    "price_low": ("current_price",),
+    "price_high": ("-current_price",),
+    "newest": ("-created_at",),
+    # Consider adding a sales count or view count to Product model for true popularity
+    "popular": ("-is_best_seller", "-created_at"),
+}
+
+
 def _filter_and_sort_products(products_queryset, request_get_params):
     """
     Applies common filtering and sorting logic to a product queryset.
@@ -110,42 +154,39 @@ def _filter_and_sort_products(products_queryset, request_get_params):
     if color_filter:
         # Filter products by color of their available variants
         products_queryset = products_queryset.filter(
-            productvariant__color__slug=color_filter
+            variants__color__name__iexact=color_filter,
+            variants__is_available=True,
+            variants__stock_quantity__gt=F("variants__reserved_quantity"),
         ).distinct()
 
     if size_filter:
         # Filter products by size of their available variants
         products_queryset = products_queryset.filter(
-            productvariant__size__name__iexact=size_filter
+            variants__size__name__iexact=size_filter,
+            variants__is_available=True,
+            variants__stock_quantity__gt=F("variants__reserved_quantity"),
         ).distinct()
 
-    # Price filtering
+    # Price filtering (on the sale price while on sale)
+    products_queryset = products_queryset.annotate(current_price=Product.current_price())
     if min_price_str:
         try:
             min_price = Decimal(min_price_str)
-            products_queryset = products_queryset.filter(price__gte=min_price)
+            products_queryset = products_queryset.filter(current_price__gte=min_price)
         except (ValueError, TypeError):
             pass
 
     if max_price_str:
         try:
             max_price = Decimal(max_price_str)
-            products_queryset = products_queryset.filter(price__lte=max_price)
+            products_queryset = products_queryset.filter(current_price__lte=max_price)
         except (ValueError, TypeError):
             pass
 
-    # Sorting
-    if sort_by == "price_low":
-        products_queryset = products_queryset.order_by("price")
-    elif sort_by == "price_high":
-        products_queryset = products_queryset.order_by("-price")
-    elif sort_by == "newest":
-        products_queryset = products_queryset.order_by("-created_at")
-    elif sort_by == "popular":
-        # Consider adding a sales count or view count to Product model for true popularity
-        products_queryset = products_queryset.order_by("-is_best_seller", "-created_at")
-    else:  # Default or invalid sort
-        products_queryset = products_queryset.order_by("name")
+    # Sorting (default or invalid sort: by name)
+    products_queryset = products_queryset.order_by(
+        *PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS["name"])
+    )
 
     return (
         products_queryset.distinct()
@@ -156,9 +197,15 @@ def _serialize_products(products_queryset, request):
     """
     Helper function to serialize a queryset of products into a list of dictionaries.
     Handles prices, images, wishlist status, and other common fields.
+    Card data for the whole page is loaded in bulk (see shop.product_cards).
     """
     products_data = []
     currency = request.session.get("currency", "USD")
+    products = load_product_cards(products_queryset)
+    # Read the exchange rate once instead of once per price property access
+    exchange_rate = (
+        Decimal(str(config.EXCHANGE_RATE_USD_TO_EGP)) if currency == "EGP" else None
+    )
 
     # Get user's wishlist items if authenticated
     products_in_wishlist_ids = set()
@@ -171,7 +218,7 @@ def _serialize_products(products_queryset, request):
         except Wishlist.DoesNotExist:
             pass
 
-    for product in products_queryset:
+    for product in products:
         try:
             primary_image = product.get_main_image()
             hover_image = product.get_hover_image()
@@ -189,13 +236,15 @@ def _serialize_products(products_queryset, request):
 
             # Calculate price based on currency and sale status
             if currency == "EGP":
+                price_egp = product.get_price * exchange_rate
+                price_egp_no_sale = product.price * exchange_rate
                 display_price = (
-                    f"{product.price_egp} EGP"
+                    f"{price_egp} EGP"
                     if product.is_on_sale
-                    else f"{product.price_egp_no_sale} EGP"
+                    else f"{price_egp_no_sale} EGP"
                 )
                 original_price = (
-                    f"{product.price_egp_no_sale} EGP" if product.is_on_sale else None
+                    f"{price_egp_no_sale} EGP" if product.is_on_sale else None
                 )
             else:  # Default to USD
                 display_price = (
@@ -210,9 +259,9 @@ def _serialize_products(products_queryset, request):
             # Vendor information
             vendor_name = None
             vendor_slug = None
-            if product.vendor and hasattr(product.vendor, "vendorprofile"):
-                vendor_name = product.vendor.vendorprofile.store_name
-                vendor_slug = product.vendor.vendorprofile.slug
+            if product.vendor:
+                vendor_name = product.vendor.store_name
+                vendor_slug = product.vendor.slug
 
             products_data.append(
                 {
@@ -247,82 +296,81 @@ def _serialize_products(products_queryset, request):
 
 
 # --- Core Product & Category Views ---
-@cache_page(60)
 def home(request):
     """Homepage view"""
-    # Optimized initial product queries to reduce database hits - excluding obvious dummy/test products
+    from freelancing.models import Project, FreelancerProfile, CompanyProfile
+
+    # Optimized initial product queries to reduce database hits - storefront() excludes dummy/test products
     # Use prefetch_related for images and select_related for foreign keys
     base_products = (
-        Product.objects.filter(is_active=True, is_available=True)
-        .exclude(name__icontains="test product")
-        .exclude(name__icontains="dummy product")
-        .exclude(name__icontains="sample product")
-        .exclude(name__startswith="Test")
-        .exclude(name__startswith="Dummy")
-        .exclude(description__icontains="this is a test")
-        .exclude(description__icontains="dummy description")
-        .exclude(description__icontains="sample description")
-        .prefetch_related("images")
-        .select_related("category", "subcategory", "brand")
-        .distinct()
+        Product.storefront()
+        .select_related("subcategory")
     )
-    featured_products = base_products.filter(is_featured=True).distinct()[:8]
-    new_arrivals = base_products.filter(is_new_arrival=True).distinct()[:8]
-    best_sellers = base_products.filter(is_best_seller=True).distinct()[:8]
-    all_products_recent = base_products.order_by("-created_at").distinct()[
-        :12
-    ]  # Get 12 for category tabs
-    sale_products = base_products.filter(is_on_sale=True).distinct()[:8]
-
-    categories = Category.objects.filter(is_active=True).order_by("name")
-    sliders = HomeSlider.objects.filter(is_active=True).order_by("order")
+    base_products = card_queryset(base_products)
 
-    # Get active advertisements for home page
-    home_ads = Advertisement.get_active_ads(placement="home")
+    # Each section is cached under its own version (see shop.fragments); only
+    # sections invalidated by a model change are recomputed here.
+    sections = get_sections(
+        {
+            "featured": lambda: list(base_products.filter(is_featured=True)[:8]),
+            "new_arrivals": lambda: list(base_products.filter(is_new_arrival=True)[:8]),
+            "best_sellers": lambda: list(base_products.filter(is_best_seller=True)[:8]),
+            "sale": lambda: list(base_products.filter(is_on_sale=True)[:8]),
+            # Get 12 for category tabs
+            "recent": lambda: list(base_products.order_by("-created_at")[:12]),
+            "categories": lambda: list(
+                Category.objects.filter(is_active=True)
+                .annotate(product_count=Count("products"))
+                .order_by("name")
+            ),
+            "sliders": lambda: list(
+                HomeSlider.objects.filter(is_active=True).order_by("order")
+            ),
+            # Get active advertisements for home page
+            "ads": lambda: list(Advertisement.get_active_ads(placement="home")),
+            # Get top freelance jobs, freelancers, and companies
+            "top_jobs": lambda: list(
+                Project.objects.filter(status='open')
+                .select_related('client', 'category')
+                .prefetch_related('skills_required')
+                .order_by('-is_featured', '-created_at')[:6]
+            ),
+            "top_freelancers": lambda: list(
+                FreelancerProfile.objects.filter(user__is_active=True)
+                .select_related('user')
+                .prefetch_related('skills')
+                .order_by('-rating', '-total_jobs_completed')[:6]
+            ),
+            "top_companies": lambda: list(
+                CompanyProfile.objects.filter(user__is_active=True)
+                .select_related('user')
+                .order_by('-rating', '-total_jobs_posted', '-is_verified')[:6]
+            ),
+        }
+    )
+    all_products_recent = sections["recent"]
 
-    # Use the new serializer helper for the JSON data for category tabs
+    # Currency and wishlist state are per visitor, so they are applied to the
+    # cached products here rather than cached with them
     initial_category_products_json = json.dumps(
         _serialize_products(all_products_recent, request)
     )
 
-    # Get top freelance jobs, freelancers, and companies
-    from freelancing.models import Project, FreelancerProfile, CompanyProfile
-
-    top_jobs = (
-        Project.objects.filter(status='open')
-        .select_related('client', 'category')
-        .prefetch_related('skills_required')
-        .order_by('-is_featured', '-created_at')[:6]
-    )
-
-    top_freelancers = (
-        FreelancerProfile.objects.filter(user__is_active=True)
-        .select_related('user')
-        .prefetch_related('skills')
-        .order_by('-rating', '-total_jobs_completed')[:6]
-    )
-
-    top_companies = (
-        CompanyProfile.objects.filter(user__is_active=True)
-        .select_related('user')
-        .order_by('-rating', '-total_jobs_posted', '-is_verified')[:6]
-    )
-
     context = {
-        "featured_products": featured_products,
-        "new_arrivals": new_arrivals,
-        "best_sellers": best_sellers,
-        "sale_products": sale_products,
-        "categories": categories,
-        "sliders": sliders,
-        "home_ads": home_ads,  # Add advertisements to context
+        "featured_products": sections["featured"],
+        "new_arrivals": sections["new_arrivals"],
+        "best_sellers": sections["best_sellers"],
+        "sale_products": sections["sale"],
+        "categories": sections["categories"],
+        "sliders": sections["sliders"],
+        "home_ads": sections["ads"],  # Add advertisements to context
         "all_products": all_products_recent,  # Pass raw queryset for template rendering
         "initial_category_products": all_products_recent,  # For category tabs section
         "initial_category_products_json": initial_category_products_json,
         "currency": request.session.get("currency", "USD"),  # Add currency for template
-        "top_jobs": top_jobs,  # Add top jobs
-        "top_freelancers": top_freelancers,  # Add top freelancers
-        "top_companies": top_companies,  # Add top companies
+        "top_jobs": sections["top_jobs"],  # Add top jobs
+        "top_freelancers": sections["top_freelancers"],  # Add top freelancers
+        "top_companies": sections["top_companies"],  # Add top companies
     }
 
     return render(request, "shop/home.html", context)
@@ -334,21 +382,12 @@ def get_category_products_api(request):
     try:
         category_slug = request.GET.get("category", "all")
 
-        # Base query for active products - excluding obvious dummy/test products
+        # Base query for storefront products - excludes dummy/test products
         base_products = (
-            Product.objects.filter(is_active=True, is_available=True)
-            .exclude(name__icontains="test product")
-            .exclude(name__icontains="dummy product")
-            .exclude(name__icontains="sample product")
-            .exclude(name__startswith="Test")
-            .exclude(name__startswith="Dummy")
-            .exclude(description__icontains="this is a test")
-            .exclude(description__icontains="dummy description")
-            .exclude(description__icontains="sample description")
-            .prefetch_related("images")
-            .select_related("category", "subcategory", "brand", "vendor")
-            .distinct()
+            Product.storefront()
+            .select_related("subcategory")
         )
+        base_products = card_queryset(base_products)
 
         # Filter by category if not 'all'
         if category_slug and category_slug != "all":
@@ -486,7 +525,7 @@ def category_detail(request, slug):
     subcategories = []
     # Start with active and available products
     products_queryset = (
-        Product.objects.filter(is_active=True, is_available=True)
+        Product.storefront()
         .prefetch_related("images")
         .select_related("category", "subcategory", "brand")
     )
@@ -514,8 +553,9 @@ def category_detail(request, slug):
     # Apply filters and sorting using helper. Pass request object to helper for messages
     products_queryset = _filter_and_sort_products(products_queryset, request.GET)
 
-    # Price range calculation for the *entire* filtered set, before pagination
-    price_range = products_queryset.aggregate(Min("price"), Max("price"))
+    # Filter options and price range for the *entire* filtered set come from
+    # the precomputed facet index (one cache read) instead of per-facet queries.
+    facet_data = get_facets(category=category, params=request.GET)
 
     # Pagination
     per_page = request.GET.get("per_page")
@@ -525,42 +565,7 @@ def category_detail(request, slug):
             per_page = 12
     except (TypeError, ValueError):
         per_page = 12
-    paginator = Paginator(products_queryset, per_page)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-
-    # --- Performance Optimization for Filter Options ---
-    # Instead of filtering on the entire queryset, we get the IDs first.
-    # This is much faster than passing a large subquery in the `__in` clause.
-    product_ids = products_queryset.values_list("id", flat=True)
-
-    # Get FitType options
-    fit_type_ids = (
-        products_queryset.exclude(fit_type__isnull=True)
-        .values_list("fit_type_id", flat=True)
-        .distinct()
-    )
-    fit_types = FitType.objects.filter(is_active=True, id__in=fit_type_ids).order_by(
-        "name"
-    )
-
-    # Get Brand options
-    brand_ids = (
-        products_queryset.exclude(brand__isnull=True)
-        .values_list("brand_id", flat=True)
-        .distinct()
-    )
-    brands = Brand.objects.filter(is_active=True, id__in=brand_ids).order_by("name")
-
-    # Get Color and Size options from available variants of the filtered products
-    variants_of_products = ProductVariant.objects.filter(
-        product_id__in=product_ids, is_available=True, stock_quantity__gt=0
-    )
-    color_ids = variants_of_products.values_list("color_id", flat=True).distinct()
-    colors = Color.objects.filter(is_active=True, id__in=color_ids).order_by("name")
-
-    size_ids = variants_of_products.values_list("size_id", flat=True).distinct()
-    sizes = Size.objects.filter(is_active=True, id__in=size_ids).order_by("name")
+    page_obj = paginate(request, products_queryset, per_page)
 
     all_categories = Category.objects.filter(is_active=True).order_by(
         "name"
@@ -579,11 +584,12 @@ def category_detail(request, slug):
         "category": category,
         "subcategories": subcategories,
         "products": page_obj,  # This is the paginated queryset
-        "fit_types": fit_types,
-        "brands": brands,
-        "colors": colors,
-        "sizes": sizes,
-        "price_range": price_range,
+        "fit_types": facet_data["fit_types"],
+        "brands": facet_data["brands"],
+        "colors": facet_data["colors"],
+        "sizes": facet_data["sizes"],
+        "price_range": facet_data["price_range"],
+        "price_buckets": facet_data["price_buckets"],
         "categories": all_categories,
         "category_ads": category_ads,  # Add advertisements for category
         "products_in_wishlist_ids": products_in_wishlist_ids,
@@ -610,9 +616,7 @@ def subcategory_detail(request, category_slug, slug):
     )
 
     products_queryset = (
-        Product.objects.filter(
-            subcategory=subcategory, is_active=True, is_available=True
-        )
+        Product.storefront().filter(subcategory=subcategory)
         .prefetch_related("images")
         .select_related("category", "subcategory", "brand")
     )
@@ -620,8 +624,8 @@ def subcategory_detail(request, category_slug, slug):
     # Apply filters and sorting using helper
     products_queryset = _filter_and_sort_products(products_queryset, request.GET)
 
-    # Price range calculation for current filtered set
-    price_range = products_queryset.aggregate(Min("price"), Max("price"))
+    # Filter options and price range for the current filtered set (facet index)
+    facet_data = get_facets(subcategory=subcategory, params=request.GET)
 
     # Pagination
     per_page = request.GET.get("per_page")
@@ -631,35 +635,7 @@ def subcategory_detail(request, category_slug, slug):
             per_page = 12
     except (TypeError, ValueError):
         per_page = 12
-    paginator = Paginator(products_queryset, per_page)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-
-    # Get filter options relevant to this subcategory's products
-    fit_types = (
-        FitType.objects.filter(is_active=True, products__in=products_queryset)
-        .distinct()
-        .order_by("name")
-    )
-    brands = (
-        Brand.objects.filter(is_active=True, products__in=products_queryset)
-        .distinct()
-        .order_by("name")
-    )
-    colors = (
-        Color.objects.filter(
-            is_active=True, productvariant__product__in=products_queryset
-        )
-        .distinct()
-        .order_by("name")
-    )
-    sizes = (
-        Size.objects.filter(
-            is_active=True, productvariant__product__in=products_queryset
-        )
-        .distinct()
-        .order_by("name")
-    )
+    page_obj = paginate(request, products_queryset, per_page)
 
     all_categories = Category.objects.filter(is_active=True).order_by(
         "name"
@@ -679,11 +655,12 @@ def subcategory_detail(request, category_slug, slug):
         "category": category,
         "subcategory": subcategory,
         "products": page_obj,
-        "fit_types": fit_types,
-        "brands": brands,
-        "colors": colors,
-        "sizes": sizes,
-        "price_range": price_range,
+        "fit_types": facet_data["fit_types"],
+        "brands": facet_data["brands"],
+        "colors": facet_data["colors"],
+        "sizes": facet_data["sizes"],
+        "price_range": facet_data["price_range"],
+        "price_buckets": facet_data["price_buckets"],
         "categories": all_categories,
         "subcategories": category.subcategories.filter(is_active=True).order_by("name"),
         "products_in_wishlist_ids": products_in_wishlist_ids,
@@ -704,73 +681,39 @@ def subcategory_detail(request, category_slug, slug):
     return render(request, "shop/subcategory_detail.html", context)
 
 
-@cache_page(60)
 def product_detail(request, slug):
     """Product detail view"""
-    product = get_object_or_404(
-        Product.objects.select_related(
-            "category", "subcategory", "brand", "fit_type"
-        ).prefetch_related("images", "variants__color", "variants__size"),
-        slug=slug,
-        is_active=True,
-        is_available=True,
+    # Shared, cached part of the page (see shop.product_documents)
+    document = get_product_document(slug)
+    if document is None:
+        raise Http404("No Product matches the given query.")
+    product = document["product"]
+
+    # Precomputed ranking (see shop.related_products), kept in rank order
+    related_products = ranked_products(
+        document["related_ids"],
+        card_queryset(Product.objects.all()).select_related("subcategory"),
     )
 
-    related_products = (
-        Product.objects.filter(
-            Q(category=product.category) | Q(subcategory=product.subcategory),
-            is_active=True,
-            is_available=True,
-        )
-        .exclude(id=product.id)
-        .distinct()
-        .prefetch_related("images", "variants__color", "variants__size")
-        .select_related("category", "subcategory", "brand")[:8]
-    )
-
-    variants = product.variants.filter(is_available=True, stock_quantity__gt=0)
-
-    available_colors = product.get_available_colors()
-    available_sizes = product.get_available_sizes()
-
-    product_images = product.images.all().order_by("order")
-
     categories = Category.objects.filter(is_active=True).order_by("name")
 
-    is_in_wishlist = False
-    if request.user.is_authenticated:
-        is_in_wishlist = WishlistItem.objects.filter(
-            wishlist__user=request.user, product=product
-        ).exists()
-
-    reviews = (
-        product.reviews.filter(is_public=True)
-        .select_related("user")
-        .order_by("-created_at")
+    # Per-user bits are resolved outside the cached document
+    is_in_wishlist, has_purchased, has_reviewed = product_user_flags(
+        request.user, product.pk
     )
-    review_form = ReviewForm()
-    user_can_review = False
-    if request.user.is_authenticated:
-        user_can_review = (
-            OrderItem.objects.filter(
-                order__user=request.user,
-                product_variant__product=product,
-                order__status="delivered",
-            ).exists()
-            and not reviews.filter(user=request.user).exists()
-        )
+    user_can_review = has_purchased and not has_reviewed
 
     context = {
         "product": product,
         "related_products": related_products,
-        "variants": variants,
-        "available_colors": available_colors,
-        "available_sizes": available_sizes,  # This will now be ordered by size_type, then 'order', then 'name'
-        "product_images": product_images,
+        "variants": document["variants"],
+        "available_colors": document["colors"],
+        "available_sizes": document["sizes"],  # This will now be ordered by size_type, then 'order', then 'name'
+        "product_images": document["images"],
         "categories": categories,
         "is_in_wishlist": is_in_wishlist,
-        "reviews": reviews,
-        "review_form": review_form,
+        "reviews": document["reviews"],
+        "review_form": ReviewForm(),
         "user_can_review": user_can_review,
     }
 
@@ -818,31 +761,19 @@ def product_search_view(request):
     Display product search results on a dedicated page.
     """
     query = request.GET.get("q", "").strip()
-    products_list = Product.objects.none()
-
-    if query:
-        products_list = (
-            Product.objects.filter(
-                Q(name__icontains=query)
-                | Q(description__icontains=query)
-                | Q(brand__name__icontains=query)
-                | Q(category__name__icontains=query),
-                is_active=True,
-                is_available=True,
-            )
-            .select_related("category", "brand")
-            .prefetch_related("images")
-            .distinct()
-        )
+    product_ids = search_product_ids(query) if query else []
 
-    paginator = Paginator(products_list, 12)  # 12 products per page
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Paginate the ranked ids, then load only the products on this page
+    page_obj = paginate(request, product_ids, 12)  # 12 products per page
+    page_obj.object_list = ranked_products(
+        list(page_obj.object_list),
+        Product.objects.select_related("category", "brand").prefetch_related("images"),
+    )
 
     context = {
         "query": query,
         "products": page_obj,
-        "result_count": paginator.count,
+        "result_count": page_obj.paginator.count,
     }
     return render(request, "shop/search_results.html", context)
 
@@ -866,7 +797,7 @@ def get_product_variants(request, product_id):
     variants_queryset = ProductVariant.objects.filter(
         product=product,
         is_available=True,
-        stock_quantity__gt=0,  # Only show variants that are in stock
+        stock_quantity__gt=F("reserved_quantity"),  # Only show variants that are in stock
     ).select_related(
         "color", "size"
     )  # Efficiently fetch related color and size objects
@@ -901,7 +832,7 @@ def get_product_variants(request, product_id):
                 "price": str(
                     variant.get_price()
                 ),  # Ensure Decimal is serialized as string
-                "stock": variant.stock_quantity,
+                "stock": variant.available_quantity,
                 "sku": variant.sku,
             }
         )
@@ -914,79 +845,35 @@ def get_cart_and_wishlist_counts(request):
     """
     Returns JSON with counts of items in cart and wishlist.
     Supports logged-in users and anonymous users (session).
+
+    Counters come from the session and the cache (see shop.badges) and are
+    served with an ETag, so an unchanged poll is answered with a 304.
     """
     try:
-        cart_count = 0
-        wishlist_count = 0
-
-        # Get cart count
-        try:
-            if request.user.is_authenticated:
-                cart = Cart.objects.filter(user=request.user).first()
-                if cart:
-                    # Try to get total_items, fallback to counting items
-                    try:
-                        cart_count = cart.total_items
-                    except (AttributeError, TypeError):
-                        cart_count = cart.items.count() if hasattr(cart, 'items') else 0
-            else:
-                session_key = request.session.session_key
-                if not session_key:
-                    try:
-                        request.session.save()
-                        session_key = request.session.session_key
-                    except Exception:
-                        # If session save fails, return 0 counts
-                        pass
-
-                if session_key:
-                    cart = Cart.objects.filter(session_key=session_key).first()
-                    if cart:
-                        try:
-                            cart_count = cart.total_items
-                        except (AttributeError, TypeError):
-                            cart_count = cart.items.count() if hasattr(cart, 'items') else 0
-        except Exception as cart_error:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Error getting cart count: {str(cart_error)}")
-            cart_count = 0
-
-        # Get wishlist count
-        try:
-            if request.user.is_authenticated:
-                wishlist = Wishlist.objects.filter(user=request.user).first()
-                wishlist_count = wishlist.items.count() if wishlist else 0
-            else:
-                wishlist_session = request.session.get("wishlist", [])
-                wishlist_count = len(wishlist_session) if isinstance(wishlist_session, list) else 0
-        except Exception as wishlist_error:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.warning(f"Error getting wishlist count: {str(wishlist_error)}")
-            wishlist_count = 0
-
-        return JsonResponse(
-            {
-                "success": True,
-                "cart_count": cart_count,
-                "wishlist_count": wishlist_count,
-            }
-        )
+        scope, cart_count, wishlist_count = get_badge_counts(request)
     except Exception as e:
-        # Log the error for debugging
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Error in get_cart_and_wishlist_counts: {str(e)}", exc_info=True)
-
         # Return success with 0 counts instead of error to prevent frontend errors
-        return JsonResponse(
+        return JsonResponse({"success": True, "cart_count": 0, "wishlist_count": 0})
+
+    etag = quote_etag(
+        hashlib.md5(f"{scope}:{cart_count}:{wishlist_count}".encode()).hexdigest()
+    )
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(
             {
                 "success": True,
-                "cart_count": 0,
-                "wishlist_count": 0,
+                "cart_count": cart_count,
+                "wishlist_count": wishlist_count,
             }
         )
+    response["ETag"] = etag
+    # Revalidate on every poll; the counters are per visitor
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
 
 
 def get_shipping_cost(request):
@@ -994,35 +881,19 @@ def get_shipping_cost(request):
     AJAX endpoint. Returns total shipping cost based on the selected city and items in the cart.
     """
     city = request.GET.get("city", "")
-    cart = get_cart_for_request(request)
-    total_shipping_cost = Decimal("0.00")
+    cart = get_express_cart(request) or get_cart(request)
+    shipping_quote = quote_cart_shipping(cart, city) if cart else quote_shipping({}, city)
 
-    if cart:
-        # Group cart items by vendor
-        vendor_items = {}
-        for item in cart.items.all():
-            vendor_id = item.product_variant.product.vendor_id
-            if vendor_id not in vendor_items:
-                vendor_items[vendor_id] = []
-            vendor_items[vendor_id].append(item)
-
-        # Calculate shipping for each vendor's sub-order
-        for vendor_id, items in vendor_items.items():
-            vendor_shipping = VendorShipping.objects.filter(vendor_id=vendor_id).first()
-            if vendor_shipping:
-                subtotal = sum(item.get_total_price() for item in items)
-                if not (
-                    vendor_shipping.free_shipping_threshold
-                    and subtotal >= vendor_shipping.free_shipping_threshold
-                ):
-                    if city == "OUTSIDE_CAIRO":
-                        total_shipping_cost += (
-                            vendor_shipping.shipping_rate_outside_cairo
-                        )
-                    else:  # Default to inside Cairo
-                        total_shipping_cost += vendor_shipping.shipping_rate_cairo
-
-    return JsonResponse({"success": True, "shipping_cost": float(total_shipping_cost)})
+    return JsonResponse(
+        {
+            "success": True,
+            "shipping_cost": float(shipping_quote.total),
+            "vendors": {
+                str(vendor_id): float(charge)
+                for vendor_id, charge in shipping_quote.charges.items()
+            },
+        }
+    )
 
 
 # --- Wishlist Views ---
@@ -1118,7 +989,7 @@ def add_to_cart(request):
                 color_id=color_id,
                 size_id=size_id,
                 is_available=True,
-                stock_quantity__gt=0,
+                stock_quantity__gt=F("reserved_quantity"),
             ).first()
 
             if not product_variant:
@@ -1155,7 +1026,9 @@ def add_to_cart(request):
             )
             product_variant = (
                 ProductVariant.objects.filter(
-                    product=product, is_available=True, stock_quantity__gt=0
+                    product=product,
+                    is_available=True,
+                    stock_quantity__gt=F("reserved_quantity"),
                 )
                 .order_by("pk")
                 .first()
@@ -1190,16 +1063,16 @@ def add_to_cart(request):
         )
         return JsonResponse({"success": False, "message": message}, status=400)
 
-    if product_variant.stock_quantity < quantity:
+    if product_variant.available_quantity < quantity:
         message = (
             (
                 f'Not enough stock for {product.name} ({product_variant.color.name if product_variant.color else "N/A"}, '
-                f'{product_variant.size.name if product_variant.size else "N/A"}). Available: {product_variant.stock_quantity}.'
+                f'{product_variant.size.name if product_variant.size else "N/A"}). Available: {product_variant.available_quantity}.'
             )
             if lang == "en"
             else (
                 f'الكمية غير كافية للمنتج {product.name} ({product_variant.color.name if product_variant.color else "غير متوفر"}, '
-                f'{product_variant.size.name if product_variant.size else "غير متوفر"}). المتوفر: {product_variant.stock_quantity}.'
+                f'{product_variant.size.name if product_variant.size else "غير متوفر"}). المتوفر: {product_variant.available_quantity}.'
             )
         )
         return JsonResponse({"success": False, "message": message}, status=400)
@@ -1678,50 +1551,29 @@ def cart_view(request):
 @require_POST
 def apply_coupon(request):
     """Applies a coupon to the cart."""
-    now = timezone.now()
     form = CouponApplyForm(request.POST)
     if form.is_valid():
-        code = form.cleaned_data["code"]
+        coupon = get_coupon(form.cleaned_data["code"])
+        if coupon is None:
+            request.session.pop(SESSION_COUPON_KEY, None)
+            messages.error(request, _("This coupon is invalid or has expired."))
+            return redirect("shop:cart_view")
+        cart = get_cart(request)
         try:
-            coupon = Coupon.objects.get(
-                code__iexact=code,
-                valid_from__lte=now,
-                valid_to__gte=now,
-                is_active=True,
-            )
-
-            # Check total usage limit
-            if coupon.max_uses is not None and coupon.times_used >= coupon.max_uses:
-                messages.error(request, _("This coupon has reached its usage limit."))
-                return redirect("shop:cart_view")
+            check_coupon(coupon, cart.total_price if cart else 0, request.user)
+        except CouponError as e:
+            messages.error(request, str(e))
+            return redirect("shop:cart_view")
 
-            # Check per-user usage limit
-            if request.user.is_authenticated:
-                user_uses = Order.objects.filter(
-                    user=request.user, coupon=coupon
-                ).count()
-                if user_uses >= coupon.max_uses_per_user:
-                    messages.error(
-                        request,
-                        _(
-                            "You have already used this coupon the maximum number of times."
-                        ),
-                    )
-                    return redirect("shop:cart_view")
-
-            request.session["coupon_id"] = coupon.id
-            messages.success(request, _("Coupon applied successfully!"))
-        except Coupon.DoesNotExist:
-            request.session["coupon_id"] = None
-            messages.error(request, _("This coupon is invalid or has expired."))
+        request.session[SESSION_COUPON_KEY] = coupon.code
+        messages.success(request, _("Coupon applied successfully!"))
     return redirect("shop:cart_view")
 
 
 @require_POST
 def remove_coupon(request):
     """Removes an applied coupon from the session."""
-    if "coupon_id" in request.session:
-        del request.session["coupon_id"]
+    if request.session.pop(SESSION_COUPON_KEY, None):
         messages.success(request, _("Coupon removed."))
     return redirect("shop:cart_view")
 
@@ -2122,13 +1974,14 @@ def vendor_detail(request, slug):
     sizes_ids = request.GET.getlist(
         "sizes"
     )  # request.GET.getlist returns a list of selected IDs
-    sort_by = request.GET.get("sort", "-created_at")  # Default sort to newest first
+    sort_by = request.GET.get("sort", "newest")  # Default sort to newest first
 
-    # Apply price filters
+    # Apply price filters (on the sale price while on sale)
+    products_queryset = products_queryset.annotate(current_price=Product.current_price())
     if price_min:
-        products_queryset = products_queryset.filter(price__gte=price_min)
+        products_queryset = products_queryset.filter(current_price__gte=price_min)
     if price_max:
-        products_queryset = products_queryset.filter(price__lte=price_max)
+        products_queryset = products_queryset.filter(current_price__lte=price_max)
 
     # Apply category filter (accept either numeric id or slug)
     if category_id:
@@ -2161,8 +2014,10 @@ def vendor_detail(request, slug):
             productsize__size__id__in=sizes_ids
         ).distinct()
 
-    # Apply sorting
-    products_queryset = products_queryset.order_by(sort_by)
+    # Apply sorting (only the listed choices; default newest first)
+    products_queryset = products_queryset.order_by(
+        *PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS["newest"])
+    )
 
     # Pagination
     paginator = Paginator(products_queryset, 9)  # Show 9 products per page
@@ -2477,43 +2332,8 @@ def vendor_dashboard(request):
     )
 
     # --- Shipping & Net Revenue Calculation ---
-    total_shipping_revenue = Decimal("0.00")
-    try:
-        vendor_shipping_settings = VendorShipping.objects.get(vendor=vendor_profile)
-        for order in total_orders_period:
-            # Calculate the subtotal of this vendor's items within this specific order
-            vendor_subtotal_in_order = order.items.filter(
-                product_variant__product__vendor=vendor_profile
-            ).aggregate(subtotal=Sum(F("price_at_purchase") * F("quantity")))[
-                "subtotal"
-            ] or Decimal(
-                "0.00"
-            )
-
-            # Check if this vendor's items qualify for their free shipping
-            if not (
-                vendor_shipping_settings.free_shipping_threshold
-                and vendor_subtotal_in_order
-                >= vendor_shipping_settings.free_shipping_threshold
-            ):
-                city = (
-                    order.shipping_address.city
-                    if order.shipping_address
-                    else "INSIDE_CAIRO"
-                )
-                if city == "OUTSIDE_CAIRO":
-                    total_shipping_revenue += (
-                        vendor_shipping_settings.shipping_rate_outside_cairo
-                    )
-                else:
-                    total_shipping_revenue += (
-                        vendor_shipping_settings.shipping_rate_cairo
-                    )
-    except VendorShipping.DoesNotExist:
-        # If for some reason shipping settings don't exist, shipping revenue is 0
-        total_shipping_revenue = Decimal("0.00")
-
-    # Use the new aggregated values for accuracy
+    # Shipping was quoted per vendor when each order was placed, so the
+    # VendorOrder records already hold it
     total_shipping_revenue = financial_summary["total_shipping"] or Decimal("0.00")
     total_commission = financial_summary["total_commission"] or Decimal("0.00")
     net_payout = financial_summary["total_payout"] or Decimal("0.00")
@@ -3272,17 +3092,11 @@ def search_products(request):
         if not query:
             return JsonResponse({"products": []})
 
-        products = (
-            Product.objects.filter(
-                Q(name__icontains=query)
-                | Q(description__icontains=query)
-                | Q(brand__name__icontains=query)
-                | Q(category__name__icontains=query),
-                is_active=True,
-                is_available=True,
-            )
-            .select_related("category", "subcategory", "brand")
-            .prefetch_related("images")[:10]
+        products = ranked_products(
+            search_product_ids(query, limit=10),
+            Product.objects.select_related("category", "brand").prefetch_related(
+                "images"
+            ),
         )
 
         results = []
@@ -3292,7 +3106,7 @@ def search_products(request):
                 {
                     "id": product.id,
                     "name": product.name,
-                    "price": str(product.get_price()),
+                    "price": str(product.get_price),
                     "url": product.get_absolute_url(),
                     "image": (
                         main_image.image.url if main_image and main_image.image else ""
@@ -3308,66 +3122,57 @@ def search_products(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@require_http_methods(["GET"])
+def autocomplete_api(request):
+    """
+    Typeahead suggestions (products, brands, categories) for the header
+    search box. Served from the in-process prefix index, no DB queries.
+    """
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 20)
+    except (TypeError, ValueError):
+        limit = 10
+    if not query:
+        return JsonResponse({"suggestions": []})
+    return JsonResponse({"suggestions": suggest(query, limit)})
+
+
 @require_http_methods(["GET"])
 def get_product_variants(request, product_id):
     """
     AJAX endpoint to get product variants based on color and size filters.
-    Returns a list of matching variants with stock info.
+    Returns a list of matching variants with stock info, plus the full
+    color x size availability matrix so the selector needs one request.
+    Served from the cached variant matrix (see shop.variant_matrix).
     """
-    try:
-        product = get_object_or_404(Product, id=product_id)
-    except ValueError:
-        return JsonResponse(
-            {"variants": [], "message": _("Invalid product ID.")}, status=400
-        )
+    matrix = get_variant_matrix(product_id)
+    if matrix is None:
+        raise Http404("No Product matches the given query.")
 
     color_id = request.GET.get("color")
     size_id = request.GET.get("size")
 
-    variants_queryset = ProductVariant.objects.filter(
-        product=product,
-        is_available=True,
-        stock_quantity__gt=0,  # Only show variants that are in stock
-    ).select_related(
-        "color", "size"
-    )  # Efficiently fetch related color and size objects
-
-    if color_id:
-        try:
-            variants_queryset = variants_queryset.filter(color__id=int(color_id))
-        except (ValueError, TypeError):
-            # If color_id is invalid, return empty results (or all if that's desired behavior)
-            return JsonResponse(
-                {"variants": [], "message": _("Invalid color ID.")}, status=400
-            )
-
-    if size_id:
-        try:
-            variants_queryset = variants_queryset.filter(size__id=int(size_id))
-        except (ValueError, TypeError):
-            # If size_id is invalid, return empty results
-            return JsonResponse(
-                {"variants": [], "message": _("Invalid size ID.")}, status=400
-            )
+    try:
+        color_id = int(color_id) if color_id else None
+    except (ValueError, TypeError):
+        # If color_id is invalid, return empty results (or all if that's desired behavior)
+        return JsonResponse(
+            {"variants": [], "message": _("Invalid color ID.")}, status=400
+        )
 
-    results = []
-    for variant in variants_queryset:
-        results.append(
-            {
-                "id": variant.id,
-                "color_id": variant.color.id if variant.color else None,
-                "color_name": variant.color.name if variant.color else _("N/A"),
-                "size_id": variant.size.id if variant.size else None,
-                "size_name": variant.size.name if variant.size else _("N/A"),
-                "price": str(
-                    variant.get_price()
-                ),  # Ensure Decimal is serialized as string
-                "stock": variant.stock_quantity,
-                "sku": variant.sku,
-            }
+    try:
+        size_id = int(size_id) if size_id else None
+    except (ValueError, TypeError):
+        # If size_id is invalid, return empty results
+        return JsonResponse(
+            {"variants": [], "message": _("Invalid size ID.")}, status=400
         )
 
-    return JsonResponse({"variants": results})
+    # Only show variants that are in stock
+    results = list(iter_variant_cells(matrix, color_id=color_id, size_id=size_id))
+
+    return JsonResponse({"variants": results, **variant_matrix_json(matrix)})
 
 # --- Wishlist Views ---
 def wishlist_view(request):
@@ -3462,7 +3267,7 @@ def add_to_cart(request):
                 color_id=color_id,
                 size_id=size_id,
                 is_available=True,
-                stock_quantity__gt=0,
+                stock_quantity__gt=F("reserved_quantity"),
             ).first()
 
             if not product_variant:
@@ -3499,7 +3304,9 @@ def add_to_cart(request):
             )
             product_variant = (
                 ProductVariant.objects.filter(
-                    product=product, is_available=True, stock_quantity__gt=0
+                    product=product,
+                    is_available=True,
+                    stock_quantity__gt=F("reserved_quantity"),
                 )
                 .order_by("pk")
                 .first()
@@ -3534,38 +3341,47 @@ def add_to_cart(request):
         )
         return JsonResponse({"success": False, "message": message}, status=400)
 
-    if product_variant.stock_quantity < quantity:
+    if product_variant.available_quantity < quantity:
         message = (
             (
                 f'Not enough stock for {product.name} ({product_variant.color.name if product_variant.color else "N/A"}, '
-                f'{product_variant.size.name if product_variant.size else "N/A"}). Available: {product_variant.stock_quantity}.'
+                f'{product_variant.size.name if product_variant.size else "N/A"}). Available: {product_variant.available_quantity}.'
             )
             if lang == "en"
             else (
                 f'الكمية غير كافية للمنتج {product.name} ({product_variant.color.name if product_variant.color else "غير متوفر"}, '
-                f'{product_variant.size.name if product_variant.size else "غير متوفر"}). المتوفر: {product_variant.stock_quantity}.'
+                f'{product_variant.size.name if product_variant.size else "غير متوفر"}). المتوفر: {product_variant.available_quantity}.'
             )
         )
         return JsonResponse({"success": False, "message": message}, status=400)
 
+    cart = get_cart(request)
+    if isinstance(cart, SessionCart):
+        # Anonymous shoppers keep their cart in the session until checkout
+        cart.add(product_variant, quantity)
+        request.session["cart_count"] = cart.total_items
+        message = (
+            "Item added to cart successfully!"
+            if lang == "en"
+            else "تمت إضافة العنصر إلى السلة بنجاح!"
+        )
+        return JsonResponse(
+            {"success": True, "message": message, "cart_total_items": cart.total_items}
+        )
+
     with transaction.atomic():
         if request.user.is_authenticated:
             cart, created = Cart.objects.select_for_update().get_or_create(
                 user=request.user
             )
         else:
-            session_key = request.session.session_key
-            if not session_key:
-                request.session.save()
-                session_key = request.session.session_key
-            cart, created = Cart.objects.select_for_update().get_or_create(
-                session_key=session_key
-            )
+            cart = Cart.objects.select_for_update().get(pk=cart.pk)
 
         cart_item, created = CartItem.objects.select_for_update().get_or_create(
             cart=cart, product_variant=product_variant, defaults={"quantity": quantity}
         )
         if not created:
+            cart_item.cart = cart  # So the save updates this cart's totals too
             cart_item.quantity += quantity
             cart_item.save()
 
@@ -3845,9 +3661,19 @@ def remove_from_cart(request):
                 status=HttpResponseBadRequest.status_code,
             )
         try:
-            cart_item = get_object_or_404(
-                CartItem.objects.select_related("cart"), id=cart_item_id
-            )
+            cart = None if request.user.is_authenticated else get_cart(request)
+            if isinstance(cart, SessionCart):
+                # Session cart lines are identified by their variant id
+                cart_item = cart.get_item(cart_item_id)
+                if cart_item is None:
+                    raise CartItem.DoesNotExist
+            else:
+                cart_item = get_object_or_404(
+                    CartItem.objects.select_related(
+                        "cart", "product_variant__product"
+                    ),
+                    id=cart_item_id,
+                )
             if request.user.is_authenticated:
                 if cart_item.cart.user != request.user:
                     return JsonResponse(
@@ -3916,29 +3742,19 @@ def remove_from_cart(request):
 def cart_view(request):
     cart_items_data = []
     total_cart_price = Decimal("0.00")
-    shipping_fee = Decimal(config.SHIPPING_RATE_CAIRO)
-    cart = None
+    vendor_subtotals = defaultdict(Decimal)
+    cart = get_cart(request)
 
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-        except Cart.DoesNotExist:
-            pass
-    else:
-        session_key = request.session.session_key
-        if session_key:
-            try:
-                cart = Cart.objects.get(session_key=session_key)
-            except Cart.DoesNotExist:
-                pass
-
-    if cart:
+    if isinstance(cart, SessionCart):
+        cart_items = cart.get_items()
+    elif cart:
         cart_items = cart.items.select_related(
             "product_variant__product",
             "product_variant__color",
             "product_variant__size",
         ).order_by("pk")
 
+    if cart:
         for item in cart_items:
             current_stock = (
                 item.product_variant.stock_quantity if item.product_variant else 0
@@ -3953,6 +3769,7 @@ def cart_view(request):
 
             item_total = item.get_total_price()
             total_cart_price += item_total
+            vendor_subtotals[item.product_variant.product.vendor_id] += item_total
             cart_items_data.append(
                 {
                     "id": item.id,
@@ -3963,13 +3780,26 @@ def cart_view(request):
                 }
             )
 
-        cart.update_totals()
-        total_cart_price = cart.total_price_field
-        request.session["cart_count"] = cart.total_items_field
+        # The page already priced every line; repair the stored totals only
+        # if they drifted from it (e.g. a price changed in the meantime)
+        total_items = sum(data["quantity"] for data in cart_items_data)
+        if not isinstance(cart, SessionCart) and (
+            total_items,
+            total_cart_price,
+        ) != (cart.total_items_field, cart.total_price_field):
+            cart.update_totals()
+        request.session["cart_count"] = total_items
     else:
         request.session["cart_count"] = 0
 
-    grand_total = total_cart_price + shipping_fee
+    # Estimate for inside Cairo; checkout quotes the chosen address
+    shipping_fee = quote_shipping(dict(vendor_subtotals), None).total
+
+    # --- Coupon Logic ---
+    coupon, discount_amount, coupon_error = applied_coupon(request, total_cart_price)
+    if coupon_error:
+        messages.warning(request, coupon_error)
+    grand_total = total_cart_price + shipping_fee - discount_amount
 
     return render(
         request,
@@ -3979,6 +3809,9 @@ def cart_view(request):
             "total": total_cart_price,
             "shipping_fee": shipping_fee,
             "grand_total": grand_total,
+            "coupon_apply_form": CouponApplyForm(),
+            "coupon": coupon,
+            "discount_amount": discount_amount,
             "cart": cart,
         },
     )
@@ -4026,10 +3859,19 @@ def update_cart_quantity(request):
             )
 
         try:
-            cart_item = get_object_or_404(
-                CartItem.objects.select_related("cart", "product_variant"),
-                id=cart_item_id,
-            )
+            cart = None if request.user.is_authenticated else get_cart(request)
+            if isinstance(cart, SessionCart):
+                # Session cart lines are identified by their variant id
+                cart_item = cart.get_item(cart_item_id)
+                if cart_item is None:
+                    raise CartItem.DoesNotExist
+            else:
+                cart_item = get_object_or_404(
+                    CartItem.objects.select_related(
+                        "cart", "product_variant__product"
+                    ),
+                    id=cart_item_id,
+                )
             if request.user.is_authenticated:
                 if cart_item.cart.user != request.user:
                     message = (
@@ -4109,32 +3951,48 @@ def update_cart_quantity(request):
 
 # --- Checkout & Order Views ---
 def get_cart_for_request(request):
-    if request.user.is_authenticated:
-        try:
-            return Cart.objects.get(user=request.user)
-        except Cart.DoesNotExist:
-            return None
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.save()
-            session_key = request.session.session_key
-        try:
-            return Cart.objects.get(session_key=session_key)
-        except Cart.DoesNotExist:
-            return None
+    """The request's database cart (anonymous carts only once promoted)."""
+    cart = get_cart(request)
+    return None if isinstance(cart, SessionCart) else cart
 
 
 def checkout_view(request):
-    cart = get_cart_for_request(request)
+    if request.method != "POST":
+        return _checkout(request)
+
+    # A repeated submission (double-click, retry) gets the order placed by
+    # the first one instead of placing another
+    submission = SubmissionKey.for_request(request, "checkout")
+    if submission is None:
+        return _checkout(request)
+    order_number = submission.claim()
+    if order_number == SUBMISSION_PENDING:
+        messages.info(request, _("Your order is still being processed."))
+        return redirect(express_checkout_url(get_express_cart(request)))
+    if order_number is not None:
+        return redirect("shop:order_confirmation", order_number=order_number)
+    try:
+        return _checkout(request, submission)
+    finally:
+        if not submission.completed:
+            submission.release()
+
 
-    if not cart or not cart.items.exists():
+def _checkout(request, submission=None):
+    # Buy Now checks out a single line carried in a signed token; otherwise
+    # anonymous session carts become database carts from here on
+    express_cart = get_express_cart(request)
+    cart = express_cart or promote_cart(request)
+
+    if not cart or not (
+        cart.get_items() if express_cart else cart.items.exists()
+    ):
         messages.warning(
             request, _("Your cart is empty. Please add items before checking out.")
         )
         return redirect("shop:cart_view")
 
-    cart.update_totals()
+    cart.update_totals()  # Verify the incrementally kept totals before pricing
     if cart.total_items == 0:
         messages.warning(
             request,
@@ -4144,6 +4002,16 @@ def checkout_view(request):
         )
         return redirect("shop:cart_view")
 
+    if request.method == "GET" and not express_cart:
+        # Hold the stock while the shopper fills in the form
+        if reserve_stock(cart, cart_lines(cart)):
+            messages.warning(
+                request,
+                _(
+                    "Some items in your cart are in high demand and could not be reserved for you. Their stock will be checked again when you place your order."
+                ),
+            )
+
     initial_shipping_data = {}
     user_shipping_addresses = ShippingAddress.objects.none()
 
@@ -4171,67 +4039,20 @@ def checkout_view(request):
     )
     payment_form = PaymentForm(request.POST or None)
 
-    # Determine shipping fee based on form input or default address
+    # Quote shipping for the submitted city or the default address
     city = (
         request.POST.get("city")
         if request.method == "POST"
         else initial_shipping_data.get("city")
     )
-    if city == "OUTSIDE_CAIRO":
-        # This is now an estimate; the real calculation happens below
-        shipping_fee_estimate = Decimal(config.SHIPPING_RATE_OUTSIDE_CAIRO)
-    else:
-        shipping_fee_estimate = Decimal(config.SHIPPING_RATE_CAIRO)
-
-    # --- New Per-Vendor Shipping Calculation ---
-    total_shipping_cost = Decimal("0.00")
-    vendor_items = {}
-    for item in cart.items.all():
-        vendor_id = item.product_variant.product.vendor_id
-        if vendor_id not in vendor_items:
-            vendor_items[vendor_id] = []
-        vendor_items[vendor_id].append(item)
-
-    for vendor_id, items in vendor_items.items():
-        vendor_shipping = VendorShipping.objects.filter(vendor_id=vendor_id).first()
-        if vendor_shipping:
-            subtotal = sum(item.get_total_price() for item in items)
-            if not (
-                vendor_shipping.free_shipping_threshold
-                and subtotal >= vendor_shipping.free_shipping_threshold
-            ):
-                if city == "OUTSIDE_CAIRO":
-                    total_shipping_cost += vendor_shipping.shipping_rate_outside_cairo
-                else:
-                    total_shipping_cost += vendor_shipping.shipping_rate_cairo
+    total_shipping_cost = quote_cart_shipping(cart, city).total
 
     # --- Coupon Logic for Checkout ---
-    coupon_id = request.session.get("coupon_id")
-    discount_amount = Decimal("0.00")
-    coupon = None
-    if coupon_id:
-        try:
-            coupon = Coupon.objects.get(id=coupon_id)
-            if coupon.is_valid():
-                if (
-                    coupon.min_purchase_amount
-                    and cart.total_price_field < coupon.min_purchase_amount
-                ):
-                    messages.warning(
-                        request, _("Coupon is no longer valid for this cart total.")
-                    )
-                    del request.session["coupon_id"]
-                else:
-                    if coupon.discount_type == "percentage":
-                        discount_amount = (
-                            cart.total_price_field * coupon.discount_value
-                        ) / 100
-                    else:
-                        discount_amount = coupon.discount_value
-            else:
-                del request.session["coupon_id"]
-        except Coupon.DoesNotExist:
-            del request.session["coupon_id"]
+    coupon, discount_amount, coupon_error = applied_coupon(
+        request, cart.total_price_field
+    )
+    if coupon_error:
+        messages.warning(request, coupon_error)
 
     if request.method == "POST":
         selected_address_id = request.POST.get("saved_address")
@@ -4245,6 +4066,7 @@ def checkout_view(request):
                     cart,
                     shipping_form=shipping_form,
                     payment_form=payment_form,
+                    submission=submission,
                 )
             else:
                 messages.error(
@@ -4266,12 +4088,13 @@ def checkout_view(request):
                         cart,
                         payment_form=payment_form,
                         existing_address=selected_address,
+                        submission=submission,
                     )
             except (ShippingAddress.DoesNotExist, ValueError):
                 messages.error(
                     request, _("Invalid address selected. Please try again.")
                 )
-                return redirect("shop:checkout")
+                return redirect(express_checkout_url(cart))
             else:
                 messages.error(
                     request, _("Please correct the errors in your payment details.")
@@ -4282,7 +4105,9 @@ def checkout_view(request):
         "shipping_form": shipping_form,
         "payment_form": payment_form,
         "user_shipping_addresses": user_shipping_addresses,
-        "cart_items": cart.items.all(),
+        "idempotency_key": new_submission_key(),
+        "express_token": express_cart.token if express_cart else None,
+        "cart_items": cart.get_items() if express_cart else cart.items.all(),
         "subtotal": cart.total_price_field,
         "shipping_fee": total_shipping_cost,
         "discount_amount": discount_amount,
@@ -4293,245 +4118,86 @@ def checkout_view(request):
 
 @transaction.atomic
 def process_order(
-    request, cart, shipping_form=None, payment_form=None, existing_address=None
+    request,
+    cart,
+    shipping_form=None,
+    payment_form=None,
+    existing_address=None,
+    submission=None,
 ):
     try:
         if not shipping_form and not existing_address:
             messages.error(request, _("Shipping information is required."))
-            return redirect("shop:checkout")
+            return redirect(express_checkout_url(cart))
 
         if not payment_form:
             messages.error(request, _("Payment information is required."))
-            return redirect("shop:checkout")
+            return redirect(express_checkout_url(cart))
 
         # --- Final Coupon Validation ---
-        coupon_id = request.session.get("coupon_id")
-        coupon = None
-        discount_amount = Decimal("0.00")
-        if coupon_id:
-            try:
-                coupon = Coupon.objects.get(id=coupon_id)
-                if coupon.is_valid() and (
-                    not coupon.min_purchase_amount
-                    or cart.total_price_field >= coupon.min_purchase_amount
-                ):
-                    if coupon.discount_type == "percentage":
-                        discount_amount = (
-                            cart.total_price_field * coupon.discount_value
-                        ) / 100
-                    else:
-                        discount_amount = coupon.discount_value
-                else:
-                    # Coupon became invalid, proceed without it
-                    coupon = None
-                    messages.warning(
-                        request,
-                        _("The applied coupon was invalid and has been removed."),
-                    )
-            except Coupon.DoesNotExist:
-                coupon = None
-
-        # Determine shipping cost from the final address data
-        city = (
-            shipping_form.cleaned_data.get("city")
-            if shipping_form
-            else existing_address.city
-        )
-
-        # --- New Per-Vendor Shipping Calculation for Order ---
-        total_shipping_cost = Decimal("0.00")
-        vendor_items = {}
-        # Group items by vendor
-        for item in cart.items.all():
-            vendor_id = item.product_variant.product.vendor_id
-            if vendor_id not in vendor_items:
-                vendor_items[vendor_id] = []
-            vendor_items[vendor_id].append(item)
-
-        for vendor_id, items in vendor_items.items():
-            try:
-                vendor_shipping = VendorShipping.objects.get(vendor_id=vendor_id)
-                subtotal = sum(item.get_total_price() for item in items)
-                if not (
-                    vendor_shipping.free_shipping_threshold
-                    and subtotal >= vendor_shipping.free_shipping_threshold
-                ):
-                    total_shipping_cost += (
-                        vendor_shipping.shipping_rate_outside_cairo
-                        if city == "OUTSIDE_CAIRO"
-                        else vendor_shipping.shipping_rate_cairo
-                    )
-            except VendorShipping.DoesNotExist:
-                # Fallback to global config if vendor settings are missing
-                total_shipping_cost += (
-                    Decimal(config.SHIPPING_RATE_OUTSIDE_CAIRO)
-                    if city == "OUTSIDE_CAIRO"
-                    else Decimal(config.SHIPPING_RATE_CAIRO)
-                )
-
-        # Create order
-        order = Order.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            full_name=(
-                shipping_form.cleaned_data["full_name"]
-                if shipping_form
-                else existing_address.full_name
-            ),
-            email=(
-                shipping_form.cleaned_data.get("email")
-                if shipping_form
-                else existing_address.email
-            ),
-            phone_number=(
-                shipping_form.cleaned_data["phone_number"]
-                if shipping_form
-                else existing_address.phone_number
-            ),
-            subtotal=Decimal("0.00"),
-            shipping_cost=total_shipping_cost,
-            grand_total=Decimal("0.00"),
-            coupon=coupon,
-            discount_amount=discount_amount,
-            status="pending",
-            payment_status="pending",
-        )
+        coupon, _discount, coupon_error = applied_coupon(request, cart.total_price_field)
+        if coupon_error:
+            # Coupon became invalid, proceed without it
+            messages.warning(
+                request,
+                _("The applied coupon was invalid and has been removed."),
+            )
 
-        # Save shipping address
-        if existing_address:
-            # Use a copy of the existing address for this order's record
-            shipping_address = existing_address.clone_for_order(order)
-        else:
-            shipping_address = shipping_form.save(commit=False)
+        express = getattr(cart, "is_express", False)
+        if shipping_form:
+            address = shipping_form.save(commit=False)
             if request.user.is_authenticated:
-                shipping_address.user = request.user
-            shipping_address.order = order
-            shipping_address.save()
-
-        order.shipping_address = shipping_address
-        order.save()
-
-        # Create payment
-        payment_data = payment_form.cleaned_data
-        payment_method = payment_data.get("payment_method")
+                address.user = request.user
+            contact = shipping_form.cleaned_data
+        else:
+            # The order keeps its own copy of the saved address
+            address = existing_address.copy_for_order()
+            contact = {
+                "full_name": existing_address.full_name,
+                "email": existing_address.email,
+                "phone_number": existing_address.phone_number,
+            }
 
+        payment_method = payment_form.cleaned_data.get("payment_method")
         # Handle transaction photo for offline payments
         transaction_photo = None
         if payment_method == "offline_payment":
             transaction_photo = request.FILES.get("transaction_photo")
 
-        payment = Payment.objects.create(
-            order=order,
-            payment_method=payment_method,
-            amount=Decimal("0.00"),  # Will update later
-            transaction_id=f"TXN-{uuid.uuid4().hex[:10]}",
-            is_success=False,
-            transaction_photo=transaction_photo,
-        )
-
-        # Process cart items
-        subtotal = Decimal("0.00")
-        # Lock product variants to prevent race conditions on stock
-        cart_items = cart.items.select_related("product_variant__product").all()
-        variants_to_lock = [item.product_variant for item in cart_items]
-        locked_variants = list(
-            ProductVariant.objects.select_for_update().filter(
-                id__in=[v.id for v in variants_to_lock]
-            )
-        )
-        for cart_item in cart_items:
-            if variant.stock_quantity < cart_item.quantity:
-                raise ValueError(
-                    f"Not enough stock for {variant.product.name} "
-                    f"({variant.color.name if variant.color else 'N/A'}, "
-                    f"{variant.size.name if variant.size else 'N/A'}). "
-                    f"Available: {variant.stock_quantity}, Requested: {cart_item.quantity}"
-                )
-
-            price = variant.get_price  # property
-            OrderItem.objects.create(
-                order=order,
-                product_variant=variant,
-                quantity=cart_item.quantity,
-                price_at_purchase=price,
+        try:
+            order = place_order(
+                user=request.user if request.user.is_authenticated else None,
+                lines=cart_lines(cart),
+                contact=contact,
+                address=address,
+                payment_method=payment_method,
+                transaction_photo=transaction_photo,
+                coupon=coupon,
+                reserved_for=None if express else cart,
+                idempotency_key=submission.key if submission else None,
             )
-            variant.stock_quantity -= cart_item.quantity
-            variant.save()
-            subtotal += price * cart_item.quantity
-
-        # --- Create VendorOrder records and calculate commissions ---
-        for vendor_id, items in vendor_items.items():
-            vendor_profile = VendorProfile.objects.get(id=vendor_id)
-            vendor_subtotal = sum(item.get_total_price() for item in items)
-
-            # Calculate this vendor's portion of the shipping
-            vendor_shipping_cost = Decimal("0.00")
-            try:
-                vendor_shipping_settings = VendorShipping.objects.get(
-                    vendor=vendor_profile
-                )
-                if not (
-                    vendor_shipping_settings.free_shipping_threshold
-                    and vendor_subtotal
-                    >= vendor_shipping_settings.free_shipping_threshold
-                ):
-                    vendor_shipping_cost = (
-                        vendor_shipping_settings.shipping_rate_outside_cairo
-                        if city == "OUTSIDE_CAIRO"
-                        else vendor_shipping_settings.shipping_rate_cairo
-                    )
-            except VendorShipping.DoesNotExist:
-                vendor_shipping_cost = (
-                    Decimal(config.SHIPPING_RATE_OUTSIDE_CAIRO)
-                    if city == "OUTSIDE_CAIRO"
-                    else Decimal(config.SHIPPING_RATE_CAIRO)
-                )
-
-            # Calculate commission
-            commission_rate = vendor_profile.commission_rate
-            commission_amount = (vendor_subtotal * commission_rate) / 100
-
-            # Create the VendorOrder record
-            vendor_order = VendorOrder.objects.create(
-                order=order,
-                vendor=vendor_profile,
-                subtotal=vendor_subtotal,
-                shipping_charged=vendor_shipping_cost,
-                commission_rate=commission_rate,
-                commission_amount=commission_amount,
-                # net_payout is calculated on save
+        except IntegrityError:
+            # The submission's key is taken: the order was placed already
+            order = (
+                Order.objects.filter(idempotency_key=submission.key).first()
+                if submission
+                else None
             )
-
-            # Update vendor's wallet balance
-            vendor_profile.wallet_balance += vendor_order.net_payout
-            vendor_profile.save(update_fields=["wallet_balance"])
-
-        # Update totals
-        order.subtotal = subtotal
-        order.grand_total = subtotal + order.shipping_cost - discount_amount
-        order.save()
-
-        # Update payment
-        payment.amount = order.grand_total
-        payment.is_success = True
-        payment.save()
-
-        # Finalize order
-        order.status = "processing"
-        order.payment_status = "paid"
-        order.save()
-
-        # Increment coupon usage count
-        if coupon:
-            coupon.times_used = F("times_used") + 1
-            coupon.save()
-            del request.session["coupon_id"]
-
-        # Clear cart
-        cart.items.all().delete()
-        cart.update_totals()
-        if not request.user.is_authenticated:
-            cart.delete()
-        request.session["cart_count"] = 0
+            if order is None:
+                raise
+            submission.complete(order.order_number)
+            return redirect("shop:order_confirmation", order_number=order.order_number)
+        if submission:
+            order_number = order.order_number
+            transaction.on_commit(lambda: submission.complete(order_number))
+        request.session.pop(SESSION_COUPON_KEY, None)
+
+        # Clear cart (an express checkout never had one)
+        if not express:
+            cart.clear()
+            if not request.user.is_authenticated:
+                cart.delete()
+            request.session["cart_count"] = 0
 
         messages.success(
             request, _(f"Your order {order.order_number} has been placed successfully!")
@@ -4540,11 +4206,11 @@ def process_order(
 
     except ValueError as e:
         messages.error(request, _(f"Order failed: {e}"))
-        return redirect("shop:checkout")
+        return redirect(express_checkout_url(cart))
     except Exception as e:
         logger.exception(f"Order processing failed for user {request.user}: {e}")
         messages.error(request, _(f"An unexpected error occurred during checkout: {e}"))
-        return redirect("shop:checkout")
+        return redirect(express_checkout_url(cart))
 
 
 def order_confirmation(request, order_number):
@@ -4594,21 +4260,27 @@ def get_available_sizes_ajax(request, product_id):
         request.method == "GET"
         and request.headers.get("x-requested-with") == "XMLHttpRequest"
     ):
-        color_id = request.GET.get("color_id")
-        try:
-            # You should have a Product model with a method like get_available_sizes
-            product = get_object_or_404(Product, id=product_id)
-            available_sizes_query = product.get_available_sizes(color_id=color_id)
-
-            # Convert queryset to a list of dictionaries for JSON response
-            # Change 'available_sizes' to 'sizes' to match JavaScript
-            available_sizes_data = list(available_sizes_query.values("id", "name"))
-
-            return JsonResponse({"success": True, "sizes": available_sizes_data})
-        except Product.DoesNotExist:
+        matrix = get_variant_matrix(product_id)
+        if matrix is None:
             return JsonResponse(
                 {"success": False, "message": "Product not found."}, status=404
             )
+        try:
+            color_id = int(request.GET.get("color_id") or 0) or None
+        except ValueError:
+            color_id = None
+
+        # Sizes with at least one in-stock variant (for the color), in size order
+        in_stock_sizes = {
+            cell["size_id"] for cell in iter_variant_cells(matrix, color_id=color_id)
+        }
+        # Change 'available_sizes' to 'sizes' to match JavaScript
+        available_sizes_data = [
+            {"id": size_id, "name": name}
+            for size_id, name in matrix["sizes"]
+            if size_id in in_stock_sizes
+        ]
+        return JsonResponse({"success": True, "sizes": available_sizes_data})
     return JsonResponse({"success": False, "message": "Invalid request"}, status=400)
 
 
@@ -4635,13 +4307,14 @@ def vendor_detail(request, slug):
     sizes_ids = request.GET.getlist(
         "sizes"
     )  # request.GET.getlist returns a list of selected IDs
-    sort_by = request.GET.get("sort", "-created_at")  # Default sort to newest first
+    sort_by = request.GET.get("sort", "newest")  # Default sort to newest first
 
-    # Apply price filters
+    # Apply price filters (on the sale price while on sale)
+    products_queryset = products_queryset.annotate(current_price=Product.current_price())
     if price_min:
-        products_queryset = products_queryset.filter(price__gte=price_min)
+        products_queryset = products_queryset.filter(current_price__gte=price_min)
     if price_max:
-        products_queryset = products_queryset.filter(price__lte=price_max)
+        products_queryset = products_queryset.filter(current_price__lte=price_max)
 
     # Apply category filter (accept either numeric id or slug)
     if category_id:
@@ -4674,18 +4347,13 @@ def vendor_detail(request, slug):
             productsize__size__id__in=sizes_ids
         ).distinct()
 
-    # Apply sorting
-    products_queryset = products_queryset.order_by(sort_by)
+    # Apply sorting (only the listed choices; default newest first)
+    products_queryset = products_queryset.order_by(
+        *PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS["newest"])
+    )
 
     # Pagination
-    paginator = Paginator(products_queryset, 9)  # Show 9 products per page
-    page = request.GET.get("page")
-    try:
-        products_page = paginator.page(page)
-    except PageNotAnInteger:
-        products_page = paginator.page(1)
-    except EmptyPage:
-        products_page = paginator.page(paginator.num_pages)
+    products_page = paginate(request, products_queryset, 9)  # Show 9 products per page
 
     # Get filter options relevant to this vendor's active products
     # CORRECTED based on your models.py:
@@ -5382,6 +5050,7 @@ def mark_notifications_as_read(request):
         freelance_updated_count = request.user.freelancing_notifications.filter(
             is_read=False
         ).update(is_read=True)
+        invalidate_notification_feed(request.user.pk)
 
         total_updated = shop_updated_count + freelance_updated_count
 
@@ -5486,18 +5155,16 @@ def admin_dashboard(request):
         total_reviews = 0
     active_coupons = Coupon.objects.filter(is_active=True, valid_to__gte=timezone.now()).count()
 
-    from .models import VisitorSession
-
-    now = timezone.now()
-    online_cutoff = now - timedelta(minutes=10)
-    visitors_online_now = VisitorSession.objects.filter(last_activity__gte=online_cutoff).count()
+    from .visitor_analytics import visitor_counts
 
-    start_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    visitors_today = VisitorSession.objects.filter(created_at__gte=start_today).count()
-    visitors_last_week = VisitorSession.objects.filter(created_at__gte=now - timedelta(days=7)).count()
-    visitors_last_month = VisitorSession.objects.filter(created_at__gte=now - timedelta(days=30)).count()
-    visitors_last_year = VisitorSession.objects.filter(created_at__gte=now - timedelta(days=365)).count()
-    visitors_all_time = VisitorSession.objects.count()
+    # Unique visitors from the daily sketches, not by counting sessions
+    visitors = visitor_counts()
+    visitors_online_now = visitors["online_now"]
+    visitors_today = visitors["today"]
+    visitors_last_week = visitors["last_week"]
+    visitors_last_month = visitors["last_month"]
+    visitors_last_year = visitors["last_year"]
+    visitors_all_time = visitors["all_time"]
 
     # Chart data - daily revenue for the period
     daily_revenue = orders_period.annotate(
@@ -6157,8 +5824,8 @@ def admin_products(request):
     # Apply filters
     if search_query:
         products = products.filter(
-            Q(name__icontains=search_query) | Q(sku__icontains=search_query)
-        )
+            Q(name__icontains=search_query) | Q(variants__sku__icontains=search_query)
+        ).distinct()
     if category_filter:
         products = products.filter(category_id=category_filter)
     if status_filter == "active":
@@ -6171,13 +5838,11 @@ def admin_products(request):
         products = products.filter(vendor_id=vendor_filter)
 
     # Pagination
-    paginator = Paginator(products, 20)
-    page = request.GET.get("page")
-    products = paginator.get_page(page)
+    products = paginate(request, products, 20)
 
     context = {
         "products": products,
-        "total_count": paginator.count,
+        "total_count": products.paginator.count,
         "categories": Category.objects.all(),
         "vendors": MnoryUser.objects.filter(user_type="vendor"),
         "search_query": search_query,
@@ -6239,7 +5904,7 @@ def admin_orders(request):
     date_from = request.GET.get("date_from", "")
 
     # Base queryset
-    orders = Order.objects.select_related("user").prefetch_related("orderitem_set").all()
+    orders = Order.objects.select_related("user").prefetch_related("items").all()
 
     # Apply filters
     if search_query:
@@ -6258,13 +5923,11 @@ def admin_orders(request):
     orders = orders.order_by("-created_at")
 
     # Pagination
-    paginator = Paginator(orders, 20)
-    page = request.GET.get("page")
-    orders = paginator.get_page(page)
+    orders = paginate(request, orders, 20)
 
     context = {
         "orders": orders,
-        "total_count": paginator.count,
+        "total_count": orders.paginator.count,
         "search_query": search_query,
         "status_filter": status_filter,
         "payment_filter": payment_filter,
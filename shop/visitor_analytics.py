@@ -0,0 +1,144 @@
+"""
+Unique visitor counts for the admin dashboard.
+
+Counting VisitorSession rows for each dashboard window meant six COUNT(*)
+queries over a table that grows with every visitor. Instead, the visitor
+tracking flusher (shop.visitor_tracking) adds the sessions it writes to a
+HyperLogLog sketch for their day and to an all-time sketch
+(VisitorSketch rows, 4 KB each). A window's unique visitors is the
+estimate of its days' sketches merged, within about 2% of the exact
+count.
+
+Past days do not change, so the merge of a window's past days is cached
+until midnight; loading the dashboard merges it with today's sketch only.
+With the counts no longer read from VisitorSession, its old rows can be
+pruned (``prune_visitor_sessions``).
+"""
+
+import hashlib
+import math
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import VisitorSession, VisitorSketch
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+WINDOWS = {"today": 1, "last_week": 7, "last_month": 30, "last_year": 365}
+ONLINE_WINDOW = timedelta(minutes=10)
+# Day sketches are kept a little past the longest window
+SKETCH_RETENTION_DAYS = 400
+PRUNE_BATCH_SIZE = 5000
+
+
+class HyperLogLog:
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers or REGISTERS)
+
+    def add(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+        h = int.from_bytes(digest, "big")
+        index = h >> (64 - PRECISION)
+        rest = h & ((1 << (64 - PRECISION)) - 1)
+        rank = (64 - PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+        estimate = alpha * REGISTERS**2 / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Small range correction (linear counting)
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return round(estimate)
+
+
+def _add(period, session_keys):
+    sketch, _ = VisitorSketch.objects.select_for_update().get_or_create(
+        period=period, defaults={"registers": bytes(REGISTERS)}
+    )
+    hll = HyperLogLog(sketch.registers)
+    for session_key in session_keys:
+        hll.add(session_key)
+    sketch.registers = bytes(hll.registers)
+    sketch.save(update_fields=["registers", "updated_at"])
+
+
+def add_visits(visits):
+    """Count ``{session_key: seen_at}`` in the day and all-time sketches."""
+    days = {}
+    for session_key, seen_at in visits.items():
+        days.setdefault(timezone.localdate(seen_at).isoformat(), []).append(session_key)
+    with transaction.atomic():
+        for day, session_keys in days.items():
+            _add(day, session_keys)
+        _add(VisitorSketch.ALL_TIME, visits)
+
+
+def _merged(periods):
+    hll = HyperLogLog()
+    for registers in VisitorSketch.objects.filter(period__in=periods).values_list(
+        "registers", flat=True
+    ):
+        hll.update(HyperLogLog(registers))
+    return hll
+
+
+def _past_days(today, days):
+    """The merged sketch of the ``days - 1`` days before ``today`` (cached)."""
+    key = f"shop:visitors:past:{today.isoformat()}:{days}"
+    registers = cache.get(key)
+    if registers is None:
+        periods = [(today - timedelta(days=n)).isoformat() for n in range(1, days)]
+        registers = bytes(_merged(periods).registers)
+        cache.set(key, registers, 24 * 60 * 60)
+    return HyperLogLog(registers)
+
+
+def visitor_counts():
+    """Return the dashboard's visitor numbers (see WINDOWS)."""
+    today = timezone.localdate()
+    sketches = dict(
+        VisitorSketch.objects.filter(
+            period__in=[today.isoformat(), VisitorSketch.ALL_TIME]
+        ).values_list("period", "registers")
+    )
+    today_hll = HyperLogLog(sketches.get(today.isoformat()))
+    counts = {}
+    for name, days in WINDOWS.items():
+        hll = _past_days(today, days) if days > 1 else HyperLogLog()
+        hll.update(today_hll)
+        counts[name] = hll.count()
+    counts["all_time"] = HyperLogLog(sketches.get(VisitorSketch.ALL_TIME)).count()
+    counts["online_now"] = VisitorSession.objects.filter(
+        last_activity__gte=timezone.now() - ONLINE_WINDOW
+    ).count()
+    return counts
+
+
+def prune(days):
+    """
+    Delete visitor sessions inactive for ``days`` days and day sketches past
+    SKETCH_RETENTION_DAYS; returns the number of sessions deleted.
+    """
+    cutoff = timezone.localdate() - timedelta(days=SKETCH_RETENTION_DAYS)
+    VisitorSketch.objects.filter(period__lt=cutoff.isoformat()).exclude(
+        period=VisitorSketch.ALL_TIME
+    ).delete()
+    stale = VisitorSession.objects.filter(
+        last_activity__lt=timezone.now() - timedelta(days=days)
+    )
+    deleted = 0
+    while True:
+        # In batches, so the table is never locked for long
+        batch = list(stale.values_list("pk", flat=True)[:PRUNE_BATCH_SIZE])
+        if not batch:
+            return deleted
+        deleted += VisitorSession.objects.filter(pk__in=batch).delete()[0]
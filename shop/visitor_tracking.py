@@ -0,0 +1,169 @@
+"""
+Write-behind visitor tracking.
+
+VisitorTrackingMiddleware used to upsert the VisitorSession row on every
+page view, retrying with sleeps while SQLite was locked. Requests now only
+``record`` the visit in an in-process buffer, coalesced by session key (a
+session's latest visit wins). A background thread flushes the buffer every
+FLUSH_INTERVAL seconds with one query to find the known sessions, one
+bulk_update and one bulk_create, so page views never write or wait on the
+database.
+
+Visits still buffered when a worker is killed are lost; that is acceptable
+for analytics. The buffer is also flushed when the process exits.
+
+Most visits do not need writing at all: the dashboard only tells sessions
+apart by activity within minutes, so a session is recorded again only
+once ACTIVITY_RESOLUTION seconds (``settings.VISITOR_ACTIVITY_RESOLUTION``)
+have passed since it was last recorded, or when its user changes. A
+bounded LRU of recently recorded sessions keeps that check in memory.
+A session's first visit of each day is always recorded, for the daily
+unique visitor counts (shop.visitor_analytics). Crawlers, monitors and
+health checks (``is_bot``) are not tracked.
+"""
+
+import atexit
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from . import visitor_analytics
+from .models import VisitorSession
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10  # Seconds
+# Flush early rather than let a traffic spike grow the buffer
+MAX_PENDING = 5000
+BATCH_SIZE = 500
+ACTIVITY_RESOLUTION = getattr(settings, "VISITOR_ACTIVITY_RESOLUTION", 60)  # Seconds
+# Sessions remembered per process; one worker rarely sees more in a window
+RECENT_SIZE = 10000
+
+BOT_USER_AGENT = re.compile(
+    r"bot|crawl|spider|slurp|facebookexternalhit|preview|monitor|uptime|"
+    r"pingdom|health|probe|curl|wget|python-requests|httpx|go-http-client|"
+    r"headless|lighthouse",
+    re.IGNORECASE,
+)
+
+_pending = {}  # {session_key: (user_id, ip_address, user_agent, seen_at)}
+_recent = OrderedDict()  # {session_key: (user_id, seen_at)}, least recent first
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+
+def is_bot(user_agent):
+    """Whether a visit with ``user_agent`` should not be tracked."""
+    return not user_agent or BOT_USER_AGENT.search(user_agent) is not None
+
+
+def record(session_key, user_id, ip_address, user_agent, seen_at):
+    """
+    Buffer one visit, written by the next flush; returns False when the
+    session's last recorded activity is still recent enough.
+    """
+    with _lock:
+        last = _recent.get(session_key)
+        if (
+            last is not None
+            and last[0] == user_id
+            and (seen_at - last[1]).total_seconds() < ACTIVITY_RESOLUTION
+            # The first visit of a day counts towards that day's visitors
+            and timezone.localdate(seen_at) == timezone.localdate(last[1])
+        ):
+            return False
+        _recent[session_key] = (user_id, seen_at)
+        _recent.move_to_end(session_key)
+        if len(_recent) > RECENT_SIZE:
+            _recent.popitem(last=False)
+        _pending[session_key] = (user_id, ip_address, user_agent, seen_at)
+        full = len(_pending) >= MAX_PENDING
+    _start_flusher()
+    if full:
+        _wakeup.set()
+    return True
+
+
+def _take():
+    global _pending
+    with _lock:
+        visits, _pending = _pending, {}
+    return visits
+
+
+def write(visits):
+    """Upsert ``{session_key: (user_id, ip, user_agent, seen_at)}``."""
+    existing = VisitorSession.objects.in_bulk(list(visits), field_name="session_key")
+    updated, created = [], []
+    for session_key, (user_id, ip_address, user_agent, seen_at) in visits.items():
+        session = existing.get(session_key)
+        if session is None:
+            session = VisitorSession(session_key=session_key)
+            created.append(session)
+        else:
+            updated.append(session)
+        session.user_id = user_id
+        session.ip_address = ip_address
+        session.user_agent = user_agent
+        session.last_activity = seen_at
+    VisitorSession.objects.bulk_update(
+        updated,
+        ["user", "ip_address", "user_agent", "last_activity"],
+        batch_size=BATCH_SIZE,
+    )
+    # A session created by another worker since the lookup is skipped; its
+    # next visit updates it
+    VisitorSession.objects.bulk_create(
+        created, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def flush():
+    """Write the buffered visits; returns how many sessions were written."""
+    visits = _take()
+    if not visits:
+        return 0
+    try:
+        write(visits)
+        visitor_analytics.add_visits(
+            {session_key: visit[3] for session_key, visit in visits.items()}
+        )
+    except DatabaseError as e:
+        logger.warning(f"Failed to write {len(visits)} visitor sessions: {e}")
+        # Retry them with the next flush, unless visited again since
+        with _lock:
+            for session_key, visit in visits.items():
+                _pending.setdefault(session_key, visit)
+        return 0
+    return len(visits)
+
+
+def _run():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        close_old_connections()
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Visitor tracking flush failed: {e}")
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=_run, name="visitor-tracking-flusher", daemon=True
+            )
+            _flusher.start()
+            atexit.register(flush)